@@ -0,0 +1,137 @@
+import logging
+import threading
+import time
+import typing as t
+
+from ckan.lib.redis import connect_to_redis, is_redis_available
+from redis.exceptions import RedisError
+
+from .config import config
+
+
+logger = logging.getLogger(__name__)
+
+
+def cache_namespace(account_id: str, bucket_region: str, bucket_name: str) -> str:
+    """Namespace of the cached access points of a bucket, so that sites sharing
+    a redis instance do not share their caches.
+    """
+    return f"{account_id}:{bucket_region}:{bucket_name}"
+
+
+class KnownAccessPoints:
+    """Names of access points known to exist, cached in-process and in redis
+    for `ttl` seconds.
+
+    An access point is known once it was created, or once S3 Control returned
+    it or reported that it exists without a policy.
+    """
+    def __init__(self, ttl: int, namespace: str):
+        self._ttl = ttl
+        self._namespace = namespace
+        self._local: t.Dict[str, float] = {}
+        self._lock = threading.Lock()
+
+    def _key(self, name: str) -> str:
+        return f"datasci-sharing:{self._namespace}:access-point-exists-{name}"
+
+    def __contains__(self, name: str) -> bool:
+        with self._lock:
+            expires = self._local.get(name)
+        if expires is not None and expires > time.monotonic():
+            return True
+
+        try:
+            if is_redis_available() and connect_to_redis().exists(self._key(name)):
+                self.add_local([name])
+                return True
+        except RedisError:
+            logger.warning("unable to read known access point %s from redis", name, exc_info=True)
+        return False
+
+    def add(self, name: str):
+        self.add_local([name])
+        try:
+            if is_redis_available():
+                connect_to_redis().setex(self._key(name), self._ttl, 1)
+        except RedisError:
+            logger.warning("unable to write known access point %s to redis", name, exc_info=True)
+
+    def add_local(self, names: t.Iterable[str]):
+        """Add access points known to exist to the in-process cache only."""
+        expires = time.monotonic() + self._ttl
+        with self._lock:
+            for name in names:
+                self._local[name] = expires
+
+    def discard(self, name: str):
+        with self._lock:
+            self._local.pop(name, None)
+        try:
+            if is_redis_available():
+                connect_to_redis().delete(self._key(name))
+        except RedisError:
+            logger.warning("unable to remove known access point %s from redis", name, exc_info=True)
+
+
+_known_access_points: t.Dict[str, KnownAccessPoints] = {}
+
+
+def get_known_access_points(namespace: str) -> KnownAccessPoints:
+    if namespace not in _known_access_points:
+        _known_access_points[namespace] = KnownAccessPoints(config.access_point_cache_ttl, namespace)
+    return _known_access_points[namespace]
+
+
+class PolicyDocumentCache:
+    """Policy documents of access points cached in redis for `ttl` seconds.
+
+    Documents are cached when read from S3 Control and replaced after being
+    written while holding the access point lock, so the cache only goes stale
+    if a policy is changed outside of this extension or the cache fails to be
+    replaced. Writes check the cached document against the hash of the policy
+    last written, recorded in the database, before reusing it.
+    """
+    def __init__(self, ttl: int, namespace: str):
+        self._ttl = ttl
+        self._namespace = namespace
+
+    def _key(self, name: str) -> str:
+        return f"datasci-sharing:{self._namespace}:access-point-policy-{name}"
+
+    def get(self, name: str) -> t.Optional[str]:
+        if not self._ttl:
+            return None
+        try:
+            if is_redis_available():
+                policy = connect_to_redis().get(self._key(name))
+                return policy.decode() if isinstance(policy, bytes) else policy
+        except RedisError:
+            logger.warning("unable to read policy of access point %s from redis", name, exc_info=True)
+        return None
+
+    def set(self, name: str, policy: str):
+        if not self._ttl:
+            return
+        try:
+            if is_redis_available():
+                connect_to_redis().setex(self._key(name), self._ttl, policy)
+        except RedisError:
+            logger.warning("unable to write policy of access point %s to redis", name, exc_info=True)
+            self.invalidate(name)
+
+    def invalidate(self, name: str):
+        try:
+            if is_redis_available():
+                connect_to_redis().delete(self._key(name))
+        except RedisError:
+            logger.error("unable to invalidate policy of access point %s in redis", name, exc_info=True)
+
+
+_policy_document_caches: t.Dict[str, PolicyDocumentCache] = {}
+
+
+def get_policy_document_cache(namespace: str) -> PolicyDocumentCache:
+    if namespace not in _policy_document_caches:
+        _policy_document_caches[namespace] = PolicyDocumentCache(config.policy_cache_ttl, namespace)
+    return _policy_document_caches[namespace]
@@ -1,40 +1,224 @@
-from typing import TypedDict
+import datetime
+from typing import Optional, TypedDict
 
+import ckan.model as model
 from ckan.plugins import toolkit
 
 from .config import config, SHARE_INTERNALLY_FIELD
-from .sharing_policy_repository import SharingPolicyRepository, SharingNotAvailable
+from .model import AccessPointUsage, PackageSharingEvent
+from .profiling import profiled, stage
+from .sharing_policy_document import PolicyDocumentSizeLimitExceeded
+from .sharing_policy_repository import (
+    SharingCapacityExceeded,
+    SharingChangePending,
+    SharingNotAvailable,
+    SharingPolicyRepository,
+)
 
 
-class SyncPackageSharingPolicyDataDict(TypedDict):
+class SyncPackageSharingPolicyDataDict(TypedDict, total=False):
     package_id: str
+    plan: bool
+    live: bool
 
 
 def sync_package_sharing_policy(context, data: SyncPackageSharingPolicyDataDict):
+    """Update the access point policy of the package to match its sharing state.
+
+    When `plan` is true nothing is updated, instead the changes to the access
+    point policies are returned, one for each access point changed. The changes
+    are computed against the cached access point policies unless `live` is true.
+    """
     package_id = toolkit.get_or_bust(data, "package_id")
+    with profiled('sync_package_sharing_policy', package_id=package_id):
+        return _sync_package_sharing_policy(context, data, package_id)
+
+
+def _sync_package_sharing_policy(context, data: SyncPackageSharingPolicyDataDict, package_id: str):
+    plan = toolkit.asbool(data.get("plan", False))
     show_package_data = {'id': package_id}
 
-    toolkit.check_access('package_show', context, show_package_data)
+    with stage('auth'):
+        toolkit.check_access('package_show', context, show_package_data)
 
-    show_context = dict(context, for_update=True)
-    package = toolkit.get_action('package_show')(show_context, show_package_data)
+    # the package is not locked for update, concurrent syncs are ordered by the
+    # sharing policy repository without holding database locks.
+    show_context = dict(context)
+    with stage('package_show'):
+        package = toolkit.get_action('package_show')(show_context, show_package_data)
 
-    toolkit.check_access('share_internally_update', context, package)
-    toolkit.check_access('package_update', context, package)
+    with stage('auth'):
+        toolkit.check_access('share_internally_update', context, package)
+        toolkit.check_access('package_update', context, package)
 
     is_deleted = package.get("state") == "deleted"
     if is_deleted:
         package[SHARE_INTERNALLY_FIELD] = False
 
     allowed = package.get(SHARE_INTERNALLY_FIELD, False)
-    org_title = package['organization']['title']
+    org_title = (package.get('organization') or {}).get('title')
+    if allowed and not org_title:
+        raise toolkit.ValidationError({SHARE_INTERNALLY_FIELD: [
+            "cannot share a dataset that does not belong to an organization."
+        ]})
     prefix = toolkit.h['get_package_cloud_storage_key'](package)
 
     repo = SharingPolicyRepository(config.bucket.bucket_name, config.bucket)
     try:
-        with repo.sharing_policy(org_title, package_id, prefix) as policy:
+        if plan:
+            live = toolkit.asbool(data.get("live", False))
+            return [diff.as_dict() for diff in repo.plan(org_title, package_id, prefix, allowed, live=live)]
+        with repo.sharing_policy(org_title, package_id, prefix, actor=context.get('user')) as policy:
             policy.allowed = allowed
+    except SharingChangePending:
+        raise toolkit.ValidationError([
+            "the dataset was saved, but its sharing settings could not be applied yet. "
+            "They will be applied later."
+        ])
     except SharingNotAvailable:
         raise toolkit.ValidationError([
             "cannot share package currently, please try again later."
         ])
+    except (SharingCapacityExceeded, PolicyDocumentSizeLimitExceeded):
+        raise _capacity_exceeded()
+
+
+def _capacity_exceeded() -> toolkit.ValidationError:
+    return toolkit.ValidationError({SHARE_INTERNALLY_FIELD: [
+        "cannot share package, the organization has reached the limit of shared datasets. "
+        "Stop sharing other datasets of the organization and try again."
+    ]})
+
+
+def check_sharing_capacity(pkg_dict: dict):
+    """Raise a `ValidationError` if the package `pkg_dict`, as passed to the
+    package hooks, is to be shared but would not fit in the policy of the
+    access point of its organization, so that the change is rejected before
+    the package is saved.
+
+    Other errors are left to the sync of the package, which reports them.
+    """
+    package_obj = model.Package.get(pkg_dict['id'])
+    if package_obj is None or package_obj.state == 'deleted':
+        return
+    if not toolkit.asbool(package_obj.extras.get(SHARE_INTERNALLY_FIELD, False)):
+        return
+    organization = model.Group.get(package_obj.owner_org) if package_obj.owner_org else None
+    if organization is None:
+        return
+
+    # the package is not shown again, its prefix is computed from the saved
+    # name and organization.
+    package = dict(
+        pkg_dict,
+        name=package_obj.name,
+        organization={'id': organization.id, 'name': organization.name, 'title': organization.title},
+    )
+    prefix = toolkit.h['get_package_cloud_storage_key'](package)
+
+    repo = SharingPolicyRepository(config.bucket.bucket_name, config.bucket)
+    try:
+        with stage('check_capacity'):
+            repo.check_capacity(organization.title, package_obj.id, prefix)
+    except SharingNotAvailable:
+        return
+    except SharingCapacityExceeded:
+        raise _capacity_exceeded()
+
+
+class PackageSharingEventListDataDict(TypedDict, total=False):
+    package_id: str
+    since: str
+    until: str
+    before_id: int
+    limit: int
+
+
+_EVENTS_LIMIT = 100
+_EVENTS_MAX_LIMIT = 1000
+
+
+def _parse_timestamp(data: dict, key: str) -> Optional[datetime.datetime]:
+    value = data.get(key)
+    if not value:
+        return None
+    try:
+        # `fromisoformat` does not accept the `Z` suffix of UTC timestamps.
+        if isinstance(value, str) and value[-1:] in ('Z', 'z'):
+            value = value[:-1] + '+00:00'
+        timestamp = datetime.datetime.fromisoformat(value)
+    except (TypeError, ValueError):
+        raise toolkit.ValidationError({key: ["expected an ISO 8601 timestamp"]})
+    if timestamp.tzinfo is not None:
+        # events are stored in UTC without a time zone.
+        timestamp = timestamp.astimezone(datetime.timezone.utc).replace(tzinfo=None)
+    return timestamp
+
+
+def _parse_int(data: dict, key: str) -> Optional[int]:
+    value = data.get(key)
+    if value in (None, ''):
+        return None
+    try:
+        return int(value)
+    except (TypeError, ValueError):
+        raise toolkit.ValidationError({key: ["expected an integer"]})
+
+
+@toolkit.side_effect_free
+def package_sharing_event_list(context, data: PackageSharingEventListDataDict):
+    """List the sharing events, newest first, of the package `package_id` if
+    given, created within `since` (inclusive) and `until` (exclusive) UTC ISO
+    8601 timestamps if given.
+
+    At most `limit` events are returned along with `next_before_id`, to pass
+    as `before_id` to list the next page, which is null on the last page.
+    """
+    toolkit.check_access('package_sharing_event_list', context, data)
+
+    limit = max(1, min(_parse_int(data, 'limit') or _EVENTS_LIMIT, _EVENTS_MAX_LIMIT))
+    events = PackageSharingEvent.query(
+        package_id=data.get('package_id'),
+        since=_parse_timestamp(data, 'since'),
+        until=_parse_timestamp(data, 'until'),
+        before_id=_parse_int(data, 'before_id'),
+    ).limit(limit).all()
+    return {
+        'events': [event.as_dict() for event in events],
+        'next_before_id': events[-1].id if len(events) == limit else None,
+    }
+
+
+class AccessPointUsageListDataDict(TypedDict, total=False):
+    organization_id: str
+
+
+@toolkit.side_effect_free
+def access_point_usage_list(context, data: AccessPointUsageListDataDict):
+    """List the recorded usage of the access point policies, the usage of the
+    access point of the organization `organization_id` if given.
+
+    The usage of an access point is recorded every time its policy is written,
+    its size is limited to `limit` characters, `headroom` being the characters
+    left.
+    """
+    toolkit.check_access('access_point_usage_list', context, data)
+
+    organization_id = data.get('organization_id')
+    if not organization_id:
+        usages = AccessPointUsage.query().order_by(AccessPointUsage.size.desc()).all()
+        return [usage.as_dict() for usage in usages]
+
+    organization = toolkit.get_action('organization_show')(
+        dict(context),
+        {'id': organization_id, 'include_datasets': False, 'include_users': False},
+    )
+    repo = SharingPolicyRepository(config.bucket.bucket_name, config.bucket)
+    try:
+        handle = repo.handle_for(organization['title'])
+    except SharingNotAvailable:
+        raise toolkit.ValidationError([
+            "cannot get the usage of the organization currently, please try again later."
+        ])
+    usage = AccessPointUsage.get(handle)
+    return [dict(usage.as_dict(), organization_id=organization['id'])] if usage is not None else []
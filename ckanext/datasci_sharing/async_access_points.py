@@ -0,0 +1,109 @@
+"""asyncio interface to the access point and short name services for bulk jobs.
+
+The boto3 calls of the synchronous services are offloaded to a thread pool,
+with bounded concurrency, so that bulk jobs can fan out over many access
+points. Interactive requests keep using the synchronous services.
+"""
+import asyncio
+from concurrent.futures import ThreadPoolExecutor
+import contextvars
+import functools
+import typing as t
+
+from .organization_short_name import ShortOrganizationNameStrategy
+from .rate_limiter import BULK, rate_limit_priority
+from .sharing_policy_repository import AccessPointService
+
+
+_T = t.TypeVar('_T')
+
+
+class _ThreadOffloader:
+    def __init__(self, concurrency: int):
+        self._concurrency = concurrency
+        self._executor = ThreadPoolExecutor(max_workers=concurrency)
+        # created lazily so that they are bound to the running event loop.
+        self._semaphore: t.Optional[asyncio.Semaphore] = None
+
+    async def _run(self, func: t.Callable[..., _T], *args, **kwargs) -> _T:
+        if self._semaphore is None:
+            self._semaphore = asyncio.Semaphore(self._concurrency)
+        async with self._semaphore:
+            # run with the current context, so that the rate limit priority applies.
+            call = functools.partial(contextvars.copy_context().run, func, *args, **kwargs)
+            return await asyncio.get_running_loop().run_in_executor(self._executor, call)
+
+    def close(self):
+        self._executor.shutdown(wait=True)
+
+
+class AsyncAccessPointService(_ThreadOffloader):
+    """asyncio interface to an `AccessPointService`.
+
+    Calls for different access points run concurrently, up to `concurrency`
+    calls at a time. Use `ordered` to run a sequence of calls for the same
+    access point in order, for example reading and then updating its policy.
+    """
+    def __init__(self, ap_service: AccessPointService, concurrency: int):
+        super().__init__(concurrency)
+        self._service = ap_service
+        self._handle_locks: t.Dict[str, asyncio.Lock] = {}
+        self.account_id = ap_service.account_id
+        self.bucket_name = ap_service.bucket_name
+        self.bucket_region = ap_service.bucket_region
+
+    def ordered(self, name: str) -> asyncio.Lock:
+        """Lock of the access point, acquired in FIFO order."""
+        if name not in self._handle_locks:
+            self._handle_locks[name] = asyncio.Lock()
+        return self._handle_locks[name]
+
+    async def get_policy(self, name: str, force_refresh: bool = False) -> t.Optional[dict]:
+        return await self._run(self._service.get_policy, name, force_refresh=force_refresh)
+
+    async def ensure_exists(self, name: str):
+        await self._run(self._service.ensure_exists, name)
+
+    async def update(self, name: str, policy: str) -> bool:
+        return await self._run(self._service.update, name, policy)
+
+    async def call_sync(self, func: t.Callable[..., _T], *args) -> _T:
+        """Run a blocking call, such as one holding the distributed lock of an
+        access point, on the thread pool.
+        """
+        return await self._run(func, *args)
+
+    async def get_policies(
+        self,
+        names: t.Iterable[str],
+        force_refresh: bool = False,
+    ) -> t.AsyncIterator[t.Tuple[str, t.Optional[dict]]]:
+        """Yield the policies of the access points as they are fetched."""
+        async def get(name):
+            return name, await self.get_policy(name, force_refresh=force_refresh)
+
+        for fetched in asyncio.as_completed([get(name) for name in names]):
+            yield await fetched
+
+
+class AsyncShortOrganizationNameStrategy(_ThreadOffloader):
+    """asyncio interface to a `ShortOrganizationNameStrategy`, resolving the
+    short name of each title once.
+    """
+    def __init__(self, strategy: ShortOrganizationNameStrategy, concurrency: int):
+        super().__init__(concurrency)
+        self._strategy = strategy
+        self._short_names: t.Dict[str, asyncio.Future] = {}
+
+    async def __call__(self, title: str) -> str:
+        if title not in self._short_names:
+            self._short_names[title] = asyncio.ensure_future(self._run(self._strategy, title))
+        return await self._short_names[title]
+
+
+def run_bulk(coroutine: t.Awaitable[_T]) -> _T:
+    """Run the coroutine of a bulk job to completion on a new event loop, with
+    bulk rate limit priority.
+    """
+    with rate_limit_priority(BULK):
+        return asyncio.run(coroutine)
@@ -14,3 +14,35 @@ def share_internally_update(context, package):
         return {'success': True}
     except toolkit.NotAuthorized:
         return {'success': False, 'msg': f'User {context.get("user")} not authorized'}
+
+
+def package_sharing_event_list(context, data_dict):
+    # the events of a package are visible to the users who can share it, all
+    # the events only to sysadmins.
+    package_id = data_dict.get('package_id')
+    if not package_id:
+        return {'success': False, 'msg': 'Only sysadmins can list all sharing events'}
+    try:
+        toolkit.check_access('package_update', context, {'id': package_id})
+        return {'success': True}
+    except toolkit.NotAuthorized:
+        return {'success': False, 'msg': f'User {context.get("user")} not authorized'}
+
+
+def access_point_usage_list(context, data_dict):
+    # the usage of an organization is visible to its admins, all the usages
+    # only to sysadmins.
+    organization_id = data_dict.get('organization_id')
+    if not organization_id:
+        return {'success': False, 'msg': 'Only sysadmins can list the usage of all access points'}
+    try:
+        toolkit.check_access('organization_update', context, {'id': organization_id})
+        return {'success': True}
+    except toolkit.NotAuthorized:
+        return {'success': False, 'msg': f'User {context.get("user")} not authorized'}
+
+
+def sharing_health_details(context, data_dict):
+    # the errors of the health checks may reveal the configuration, only
+    # sysadmins can view them.
+    return {'success': False, 'msg': 'Only sysadmins can view the details of the sharing health'}
@@ -0,0 +1,103 @@
+"""Online backfill of the columns added to the `package_sharing_policy` table.
+
+Rows are backfilled in small batches paginated by package id, each batch in
+its own short transaction, so that the backfill can run while CKAN serves
+requests. Rows are only updated if their column is still empty, so values
+written by concurrent syncs are kept. A backfill is resumable, as rows that
+were backfilled no longer need it, and it can start after a given package id.
+"""
+import logging
+import time
+import typing as t
+
+import ckan.model as model
+from ckan.plugins import toolkit
+
+from .model import PackageSharingPolicy
+
+
+logger = logging.getLogger(__name__)
+
+
+ProgressCallback = t.Callable[[int, str], None]
+
+
+def _no_progress(count: int, last_package_id: str):
+    pass
+
+
+def _fill_prefixes(rows: t.List[PackageSharingPolicy]) -> int:
+    context = {'ignore_auth': True}
+    count = 0
+    for row in rows:
+        try:
+            package = toolkit.get_action('package_show')(dict(context), {'id': row.package_id})
+        except toolkit.ObjectNotFound:
+            logger.warning("skipping prefix backfill of missing package %s", row.package_id)
+            continue
+        count += (
+            model.Session.query(PackageSharingPolicy)
+            .filter_by(package_id=row.package_id)
+            .filter(PackageSharingPolicy.prefix.is_(None))
+            .update({'prefix': toolkit.h['get_package_cloud_storage_key'](package)}, synchronize_session=False)
+        )
+    return count
+
+
+def _fill_applied_allowed(rows: t.List[PackageSharingPolicy]) -> int:
+    # rows without an applied state were saved only after being applied.
+    return (
+        model.Session.query(PackageSharingPolicy)
+        .filter(PackageSharingPolicy.package_id.in_([row.package_id for row in rows]))
+        .filter(PackageSharingPolicy.applied_allowed.is_(None))
+        .update({'applied_allowed': PackageSharingPolicy.allowed}, synchronize_session=False)
+    )
+
+
+class _Backfill(t.NamedTuple):
+    # query of the rows to backfill.
+    query: t.Callable[[], t.Any]
+    # backfill a batch of rows, returning the number of rows updated.
+    fill: t.Callable[[t.List[PackageSharingPolicy]], int]
+
+
+BACKFILLS = {
+    # the stored prefix is the current prefix of the package, so it should be
+    # backfilled before packages are renamed or moved to another organization.
+    'prefix': _Backfill(PackageSharingPolicy.missing_prefix, _fill_prefixes),
+    'applied_allowed': _Backfill(PackageSharingPolicy.missing_applied_allowed, _fill_applied_allowed),
+}
+
+
+def backfill(
+    column: str,
+    batch_size: int = 100,
+    delay: float = 0.1,
+    after: str = '',
+    progress: ProgressCallback = _no_progress,
+) -> int:
+    """Backfill `column` for the rows with a package id greater than `after`,
+    `batch_size` rows at a time, sleeping `delay` seconds between batches.
+    Returns the number of rows backfilled.
+    """
+    query, fill = BACKFILLS[column]
+    count = 0
+    last_package_id = after
+    while True:
+        rows = (
+            query()
+            .filter(PackageSharingPolicy.package_id > last_package_id)
+            .order_by(PackageSharingPolicy.package_id)
+            .limit(batch_size)
+            .all()
+        )
+        if not rows:
+            break
+
+        last_package_id = rows[-1].package_id
+        count += fill(rows)
+        model.repo.commit()
+        progress(count, last_package_id)
+        if delay:
+            time.sleep(delay)
+    return count
@@ -0,0 +1,262 @@
+import contextlib
+import datetime
+import json
+import os
+import tempfile
+import time
+
+import click
+from ckan.plugins import toolkit
+
+from .backfill import BACKFILLS, backfill
+from .config import config
+from .model import PackageSharingEvent, PackageSharingPolicy
+from .organization_short_name import create_short_name_strategy
+from .profiling import get_profile_store
+from .rate_limiter import BULK, rate_limit_priority
+from .sharing_backup import (
+    export_sharing_state,
+    import_sharing_state,
+    plan_import_sharing_state,
+    refresh_access_point_usage,
+)
+from .sharing_plan import plan_sharing_state
+from .sharing_policy_repository import create_boto3_session, create_access_point_service
+
+
+def _echo_progress(kind: str, count: int):
+    click.echo(f'{kind}: {count}', err=True)
+
+
+def _echo_plan(diffs, as_json: bool, verbose: bool):
+    changed = 0
+    for diff in diffs:
+        changed += diff.has_changes
+        if as_json:
+            click.echo(json.dumps(diff.as_dict()))
+            continue
+        if not diff.has_changes and not verbose:
+            continue
+        click.secho(diff.summary(), fg='red' if diff.headroom < 0 else None)
+        if verbose:
+            for prefix in diff.added_prefixes:
+                click.secho(f'  + {prefix}', fg='green')
+            for prefix in diff.removed_prefixes:
+                click.secho(f'  - {prefix}', fg='red')
+    click.echo(f'{changed} access points to change', err=True)
+
+
+@click.group("datasci-sharing", short_help="Datasci sharing management commands.")
+def datasci_sharing():
+    pass
+
+
+@datasci_sharing.command('export')
+@click.argument('output', type=click.Path(dir_okay=False, allow_dash=True), default='-')
+@click.option('--batch-size', default=500, show_default=True, help='Rows fetched from the database at a time.')
+@click.option('--workers', default=8, show_default=True, help='Access point policies fetched concurrently.')
+def export_(output, batch_size, workers):
+    """Export all sharing policies and access point policies as NDJSON to OUTPUT.
+
+    The export is written to a temporary file, which replaces OUTPUT only once
+    the export is complete.
+    """
+    with _atomic_output(output) as stream:
+        counts = export_sharing_state(
+            stream,
+            create_access_point_service(config.bucket),
+            batch_size=batch_size,
+            workers=workers,
+            progress=_echo_progress,
+        )
+    click.secho(
+        f"exported {counts['package_sharing_policy']} sharing policies "
+        f"and {counts['access_point']} access points",
+        fg='green',
+        err=True,
+    )
+
+
+@contextlib.contextmanager
+def _atomic_output(path: str):
+    if path == '-':
+        yield click.get_text_stream('stdout')
+        return
+
+    directory = os.path.dirname(os.path.abspath(path))
+    fd, tmp_path = tempfile.mkstemp(prefix='.datasci-sharing-export-', dir=directory)
+    try:
+        with os.fdopen(fd, 'w') as stream:
+            yield stream
+        os.replace(tmp_path, path)
+    except BaseException:
+        os.unlink(tmp_path)
+        raise
+
+
+@datasci_sharing.command('import')
+@click.argument('input', type=click.File('r'), default='-')
+@click.option('--batch-size', default=500, show_default=True, help='Rows written to the database at a time.')
+@click.option('--workers', default=8, show_default=True, help='Access points restored concurrently.')
+@click.option('--dry-run', is_flag=True, help='Show the changes to the access points without importing.')
+@click.option('--json', 'as_json', is_flag=True, help='Output the changes of a dry run as NDJSON.')
+def import_(input, batch_size, workers, dry_run, as_json):
+    """Import sharing policies and access point policies from an export in INPUT."""
+    if dry_run:
+        ap_service = create_access_point_service(config.bucket)
+        _echo_plan(plan_import_sharing_state(input, ap_service), as_json, verbose=False)
+        return
+
+    counts = import_sharing_state(
+        input,
+        create_access_point_service(config.bucket),
+        batch_size=batch_size,
+        workers=workers,
+        progress=_echo_progress,
+    )
+    click.secho(
+        f"imported {counts['package_sharing_policy']} sharing policies "
+        f"and {counts['access_point']} access points",
+        fg='green',
+        err=True,
+    )
+    if counts['failed']:
+        raise click.ClickException(f"{counts['failed']} access points failed to import")
+
+
+@datasci_sharing.command('plan')
+@click.option(
+    '--resources-prefix',
+    help='Plan for a different prefix of the access point names, defaults to the current prefix.',
+)
+@click.option('--live', is_flag=True, help='Diff against the live policies instead of the cached ones.')
+@click.option('--verbose', '-v', is_flag=True, help='List the added and removed prefixes.')
+@click.option('--json', 'as_json', is_flag=True, help='Output the changes as NDJSON.')
+@click.option('--workers', default=8, show_default=True, help='Access point policies fetched concurrently.')
+def plan(resources_prefix, live, verbose, as_json, workers):
+    """Show the changes needed for the access point policies to match the
+    sharing state in the database, without taking locks or writing anything.
+    """
+    session = create_boto3_session()
+    diffs = plan_sharing_state(
+        create_access_point_service(config.bucket, session),
+        create_short_name_strategy(session),
+        resources_prefix or config.bucket.bucket_name,
+        live=live,
+        workers=workers,
+    )
+    with rate_limit_priority(BULK):
+        _echo_plan(diffs, as_json, verbose)
+
+
+@datasci_sharing.command('reconcile')
+def reconcile():
+    """Sync the packages whose sharing state was not applied to their access point."""
+    site_user = toolkit.get_action('get_site_user')({'ignore_auth': True}, {})
+    package_ids = [package_id for (package_id,) in PackageSharingPolicy.pending_package_ids()]
+    click.echo(f'{len(package_ids)} packages pending', err=True)
+
+    failed = 0
+    with rate_limit_priority(BULK):
+        for package_id in package_ids:
+            context = {'ignore_auth': True, 'user': site_user['name']}
+            try:
+                toolkit.get_action('sync_package_sharing_policy')(context, {'package_id': package_id})
+            except toolkit.ValidationError as e:
+                failed += 1
+                click.secho(f'{package_id}: {e.error_summary}', fg='red', err=True)
+
+    click.secho(f'synced {len(package_ids) - failed} packages', fg='green', err=True)
+    if failed:
+        raise click.ClickException(f'{failed} packages failed to sync')
+
+
+@datasci_sharing.command('backfill')
+@click.argument('column', type=click.Choice(list(BACKFILLS)))
+@click.option('--batch-size', default=100, show_default=True, help='Rows updated per transaction.')
+@click.option('--delay', default=0.1, show_default=True, help='Seconds to wait between batches.')
+@click.option('--after', default='', help='Resume after this package id.')
+def backfill_(column, batch_size, delay, after):
+    """Backfill a column of the package sharing policies in small batches,
+    while CKAN is running.
+    """
+    def echo_progress(count: int, last_package_id: str):
+        click.echo(f'{column}: {count} rows backfilled, last package id {last_package_id}', err=True)
+
+    with rate_limit_priority(BULK):
+        count = backfill(column, batch_size, delay, after, progress=echo_progress)
+    click.secho(f'{column}: backfilled {count} rows', fg='green', err=True)
+
+
+@datasci_sharing.command('prune-events')
+@click.option('--older-than', type=int, help='Days to keep events for, defaults to the configured retention.')
+@click.option('--batch-size', default=1000, show_default=True, help='Events deleted per transaction.')
+@click.option('--delay', default=0.1, show_default=True, help='Seconds to wait between batches.')
+def prune_events(older_than, batch_size, delay):
+    """Delete the sharing events older than the retention period."""
+    days = config.event_retention_days if older_than is None else older_than
+    cutoff = datetime.datetime.utcnow() - datetime.timedelta(days=days)
+
+    count = 0
+    while True:
+        deleted = PackageSharingEvent.prune(cutoff, batch_size)
+        count += deleted
+        if deleted < batch_size:
+            break
+        click.echo(f'{count} events deleted', err=True)
+        time.sleep(delay)
+    click.secho(f'deleted {count} events created before {cutoff.isoformat()}', fg='green', err=True)
+
+
+@datasci_sharing.command('refresh-usage')
+@click.option('--workers', default=8, show_default=True, help='Access point policies fetched concurrently.')
+def refresh_usage(workers):
+    """Record the usage of the access point policies from the live policies."""
+    count = refresh_access_point_usage(create_access_point_service(config.bucket), workers=workers)
+    click.secho(f'recorded the usage of {count} access points', fg='green', err=True)
+
+
+@datasci_sharing.group('profiles')
+def profiles():
+    """Inspect the profiles of slow sharing policy syncs."""
+    pass
+
+
+@profiles.command('list')
+def list_profiles():
+    """List the stored profiles, newest first."""
+    store = get_profile_store()
+    for profile_id in reversed(store.ids()):
+        profile = store.get(profile_id)
+        slowest = max(profile['stages'], key=lambda stage: stage['duration'], default=None)
+        click.echo(
+            f"{profile_id}  {profile['duration']:.3f}s  {profile['name']}  "
+            f"{json.dumps(profile['attributes'])}"
+            + (f"  slowest: {slowest['stage']} {slowest['duration']:.3f}s" if slowest else '')
+        )
+
+
+@profiles.command('show')
+@click.argument('profile_id')
+@click.option('--limit', default=30, show_default=True, help='Functions listed from the cProfile dump.')
+def show_profile(profile_id, limit):
+    """Show the stage timings of a profile and its cProfile stats, if any."""
+    store = get_profile_store()
+    try:
+        profile = store.get(profile_id)
+    except FileNotFoundError:
+        raise click.ClickException(f'profile {profile_id} not found')
+
+    click.echo(f"{profile['name']} {json.dumps(profile['attributes'])}: {profile['duration']:.3f}s")
+    for stage in profile['stages']:
+        click.echo(f"  {stage['stage']:<24} {stage['duration']:.3f}s")
+    for event, count in profile['events'].items():
+        click.echo(f"  {event}: {count}")
+
+    stats = store.stats(profile_id, limit)
+    if stats:
+        click.echo(stats)
+
+
+def get_commands():
+    return [datasci_sharing]
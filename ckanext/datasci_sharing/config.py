@@ -1,7 +1,9 @@
 from ast import literal_eval
+import os
+import tempfile
 from typing import NamedTuple, Optional
 
-from ckan.plugins.toolkit import config as ckan_config
+from ckan.plugins.toolkit import asbool, config as ckan_config
 
 
 SHARE_INTERNALLY_FIELD = 'share_internally'
@@ -13,6 +15,20 @@ class BucketConfig(NamedTuple):
     bucket_name: str
 
 
+class RateLimitConfig(NamedTuple):
+    rate: float
+    burst: float
+    bulk_reserve: float
+    max_wait: float
+    bulk_max_wait: float
+
+
+_RATE_LIMIT_DEFAULTS = {
+    's3control': RateLimitConfig(rate=5, burst=10, bulk_reserve=5, max_wait=1, bulk_max_wait=60),
+    'lambda': RateLimitConfig(rate=10, burst=20, bulk_reserve=10, max_wait=1, bulk_max_wait=60),
+}
+
+
 class Config:
     @property
     def iam_resources_prefix(self) -> str:
@@ -59,6 +75,95 @@ class Config:
             or self._aws_session_options().get('aws_secret_access_key')
         )
 
+    @property
+    def short_name_strategy(self) -> str:
+        return ckan_config.get('ckanext.datasci_sharing.short_name_strategy', 'lambda')
+
+    @property
+    def short_name_lambda_arn(self) -> str:
+        return ckan_config.get(
+            'ckanext.datasci_sharing.short_name_lambda_arn',
+            'arn:aws:lambda:eu-west-1:450869586150:function:GetShortGroup',
+        )
+
+    @property
+    def short_name_lambda_region(self) -> str:
+        return ckan_config.get('ckanext.datasci_sharing.short_name_lambda_region', 'eu-west-1')
+
+    @property
+    def short_name_max_length(self) -> int:
+        return int(ckan_config.get('ckanext.datasci_sharing.short_name_max_length', 20))
+
+    @property
+    def short_name_mapping_file(self) -> str:
+        return ckan_config['ckanext.datasci_sharing.short_name_mapping_file']
+
+    @property
+    def short_name_cache_size(self) -> int:
+        """Resolved short names cached by each process."""
+        return int(ckan_config.get('ckanext.datasci_sharing.short_name_cache_size', 1000))
+
+    @property
+    def access_point_cache_ttl(self) -> int:
+        return int(ckan_config.get('ckanext.datasci_sharing.access_point_cache_ttl', 3600))
+
+    @property
+    def policy_cache_ttl(self) -> int:
+        return int(ckan_config.get('ckanext.datasci_sharing.policy_cache_ttl', 300))
+
+    @property
+    def profiling_enabled(self) -> bool:
+        return asbool(ckan_config.get('ckanext.datasci_sharing.profiling.enabled', False))
+
+    @property
+    def profiling_threshold(self) -> float:
+        """Seconds a profiled call must take for its profile to be kept."""
+        return float(ckan_config.get('ckanext.datasci_sharing.profiling.threshold', 1.0))
+
+    @property
+    def profiling_cprofile(self) -> bool:
+        return asbool(ckan_config.get('ckanext.datasci_sharing.profiling.cprofile', False))
+
+    @property
+    def profiling_directory(self) -> str:
+        default_directory = os.path.join(
+            ckan_config.get('ckan.storage_path') or tempfile.gettempdir(),
+            'datasci_sharing',
+            'profiles',
+        )
+        return ckan_config.get('ckanext.datasci_sharing.profiling.directory', default_directory)
+
+    @property
+    def profiling_max_entries(self) -> int:
+        return int(ckan_config.get('ckanext.datasci_sharing.profiling.max_entries', 100))
+
+    @property
+    def health_cache_interval(self) -> int:
+        return int(ckan_config.get('ckanext.datasci_sharing.health_cache_interval', 30))
+
+    @property
+    def warm_up_enabled(self) -> bool:
+        return asbool(ckan_config.get('ckanext.datasci_sharing.warm_up.enabled', False))
+
+    @property
+    def warm_up_budget(self) -> float:
+        """Seconds startup may be delayed by the warm-up."""
+        return float(ckan_config.get('ckanext.datasci_sharing.warm_up.budget', 5))
+
+    @property
+    def event_retention_days(self) -> int:
+        return int(ckan_config.get('ckanext.datasci_sharing.event_retention_days', 365))
+
+    def rate_limit(self, service: str) -> RateLimitConfig:
+        """Rate limit of calls to the AWS `service`, where `rate` is in calls per second
+        and `bulk_reserve` is the number of tokens kept for interactive calls.
+        """
+        defaults = _RATE_LIMIT_DEFAULTS[service]
+        return RateLimitConfig(*(
+            float(ckan_config.get(f'ckanext.datasci_sharing.rate_limit.{service}.{field}', default))
+            for field, default in defaults._asdict().items()
+        ))
+
     def _aws_session_options(self) -> dict:
         return literal_eval(ckan_config.get(
             'ckanext.datasci_sharing.aws_session_options', '{}'
@@ -1,9 +1,12 @@
 from contextlib import contextmanager
 import logging
+import time
 
 from ckan.lib.redis import connect_to_redis, is_redis_available
 from redis.exceptions import LockError as RedisLockError, LockNotOwnedError as RedisLockNotOwnedError
 
+from .profiling import record_stage
+
 
 logger = logging.getLogger(__name__)
 
@@ -19,7 +22,9 @@ def distributed_lock(name: str, blocking_timeout=1, timeout=2):
     try:
         lock_name = f"datasci-sharing:lock-{name}"
         logger.debug("acquiring lock %s", lock_name)
+        acquiring_started = time.perf_counter()
         with connect_to_redis().lock(lock_name, blocking_timeout=blocking_timeout, timeout=timeout) as lock:
+            record_stage('redis_lock', time.perf_counter() - acquiring_started)
             try:
                 logger.debug("acquired lock %s", lock_name)
                 yield lock
@@ -0,0 +1,126 @@
+"""Health of the sharing subsystem.
+
+Probing calls AWS, so probe results are cached in redis, or in-process when
+redis is not available, for the configured interval. Probes take rate limit
+tokens at bulk priority without waiting for them, so that they never delay
+the shares of users, and report the services as throttled when no tokens are
+left.
+
+The public report only tells whether each check passed, the latencies, errors,
+rate limiter state and warm-up of the process are reported to sysadmins.
+"""
+import json
+import logging
+import threading
+import time
+import typing as t
+
+from ckan.lib.redis import connect_to_redis, is_redis_available
+from redis.exceptions import RedisError
+
+from .config import config
+from .model import PackageSharingPolicy
+from .rate_limiter import BULK, RateLimitTimeout, rate_limit_max_wait, rate_limit_priority, rate_limiter_stats
+from .sharing_policy_repository import get_access_point_service, get_short_name_strategy
+from .warm_up import last_warm_up
+
+
+logger = logging.getLogger(__name__)
+
+
+_HEALTH_CACHE_KEY = 'datasci-sharing:health'
+
+_local_cache: t.Optional[t.Tuple[float, dict]] = None
+_local_cache_lock = threading.Lock()
+
+
+def _probe(func: t.Callable[[], t.Any]) -> dict:
+    started = time.perf_counter()
+    try:
+        result = func()
+    except RateLimitTimeout:
+        # the service is in use, not down.
+        return {'ok': True, 'status': 'throttled', 'latency': time.perf_counter() - started}
+    except Exception as e:
+        logger.warning("health probe failed", exc_info=True)
+        return {'ok': False, 'status': 'failed', 'latency': time.perf_counter() - started, 'error': str(e)}
+    if result is False:
+        # nothing to check
+        return {'ok': True, 'status': 'not applicable', 'latency': None}
+    return {'ok': True, 'status': 'ok', 'latency': time.perf_counter() - started}
+
+
+def _probe_redis():
+    if not is_redis_available():
+        raise Exception('redis is not available')
+    connect_to_redis().ping()
+
+
+def _run_probes() -> dict:
+    # probes never wait for the rate limits, so that health checks respond
+    # promptly while bulk jobs use the tokens.
+    with rate_limit_priority(BULK), rate_limit_max_wait(0):
+        checks = {
+            'redis': _probe(_probe_redis),
+            's3control': _probe(lambda: get_access_point_service(config.bucket).probe()),
+            'short_name': _probe(lambda: get_short_name_strategy().probe()),
+        }
+    return {
+        'ok': all(check['ok'] for check in checks.values()),
+        'checked': time.time(),
+        'checks': checks,
+        'pending_changes': PackageSharingPolicy.pending_package_ids().count(),
+    }
+
+
+def _cached_probes() -> t.Optional[dict]:
+    try:
+        if is_redis_available():
+            cached = connect_to_redis().get(_HEALTH_CACHE_KEY)
+            return json.loads(cached) if cached else None
+    except RedisError:
+        logger.warning("unable to read health from redis", exc_info=True)
+
+    with _local_cache_lock:
+        if _local_cache and _local_cache[0] > time.monotonic():
+            return _local_cache[1]
+    return None
+
+
+def _cache_probes(health: dict):
+    global _local_cache
+    interval = config.health_cache_interval
+    with _local_cache_lock:
+        _local_cache = (time.monotonic() + interval, health)
+    try:
+        if is_redis_available():
+            connect_to_redis().setex(_HEALTH_CACHE_KEY, interval, json.dumps(health))
+    except RedisError:
+        logger.warning("unable to write health to redis", exc_info=True)
+
+
+def sharing_health(details: bool = False) -> dict:
+    """Report the availability of the services sharing depends on. With
+    `details`, also report the probe latencies and errors, the number of
+    pending sharing changes and the rate limiter state and warm-up of this
+    process.
+    """
+    health = _cached_probes()
+    if health is None:
+        health = _run_probes()
+        _cache_probes(health)
+
+    if not details:
+        return {
+            'ok': health['ok'],
+            'checked': health['checked'],
+            'checks': {
+                name: {'ok': check['ok'], 'status': check.get('status')}
+                for name, check in health['checks'].items()
+            },
+        }
+    return dict(
+        health,
+        rate_limits=rate_limiter_stats(),
+        warm_up=last_warm_up(),
+    )
@@ -0,0 +1,28 @@
+"""add package sharing policy prefix
+
+Revision ID: 3f9c1d0b7e42
+Revises: a8ed527165df
+Create Date: 2026-10-18 14:37:05.914250
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '3f9c1d0b7e42'
+down_revision = 'a8ed527165df'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    # fail instead of blocking the queries queued behind a long transaction.
+    op.execute("SET LOCAL lock_timeout = '5s'")
+    # existing rows are backfilled with the `datasci-sharing backfill prefix`
+    # command, which needs the packages and cannot run as part of the migration.
+    op.add_column('package_sharing_policy', sa.Column('prefix', sa.UnicodeText, nullable=True))
+
+
+def downgrade():
+    op.drop_column('package_sharing_policy', 'prefix')
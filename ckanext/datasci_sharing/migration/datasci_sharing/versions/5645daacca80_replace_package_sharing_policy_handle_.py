@@ -6,7 +6,8 @@ Create Date: 2023-08-18 12:09:22.590777
 
 """
 from alembic import op
-import sqlalchemy as sa
+
+from ckanext.datasci_sharing.migration_utils import autocommit_block
 
 
 # revision identifiers, used by Alembic.
@@ -17,11 +18,17 @@ depends_on = None
 
 
 def upgrade():
-    with op.batch_alter_table('package_sharing_policy') as batch:
-        batch.drop_column('handle')
-        batch.add_column(sa.Column('handle', sa.UnicodeText, nullable=True))
-        batch.drop_constraint('package_sharing_policy_package_id_fkey', type_='foreignkey')
-        batch.create_foreign_key('package_sharing_policy_package_id_fkey', 'package', ondelete='CASCADE')
+    # the handle column is kept, handles stored before access point names are
+    # access point ARNs, which are ignored when read.
+    op.execute("SET LOCAL lock_timeout = '5s'")
+    op.drop_constraint('package_sharing_policy_package_id_fkey', 'package_sharing_policy', type_='foreignkey')
+    # the existing rows are validated separately, without blocking writes.
+    op.execute(
+        'ALTER TABLE package_sharing_policy ADD CONSTRAINT package_sharing_policy_package_id_fkey '
+        'FOREIGN KEY (package_id) REFERENCES package (id) ON DELETE CASCADE NOT VALID'
+    )
+    with autocommit_block():
+        op.execute('ALTER TABLE package_sharing_policy VALIDATE CONSTRAINT package_sharing_policy_package_id_fkey')
 
 
 def downgrade():
@@ -0,0 +1,51 @@
+"""add package sharing policy indexes
+
+Revision ID: 7d2b9e6a4c13
+Revises: 3f9c1d0b7e42
+Create Date: 2026-10-18 16:02:48.731904
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+from ckanext.datasci_sharing.migration_utils import autocommit_block
+
+
+# revision identifiers, used by Alembic.
+revision = '7d2b9e6a4c13'
+down_revision = '3f9c1d0b7e42'
+branch_labels = None
+depends_on = None
+
+
+_INDEXES = {
+    'ix_package_sharing_policy_handle': '(handle)',
+    'ix_package_sharing_policy_pending': (
+        '(package_id) WHERE applied_allowed IS NOT NULL AND applied_allowed <> allowed'
+    ),
+}
+
+
+def upgrade():
+    # indexes are created concurrently, outside of the migration transaction,
+    # so that writes to the table are not blocked while they are built.
+    with autocommit_block():
+        for name, definition in _INDEXES.items():
+            # only an index left invalid by a failed concurrent build is rebuilt,
+            # a valid index is kept as is.
+            invalid = op.get_bind().execute(
+                sa.text(
+                    'SELECT 1 FROM pg_index JOIN pg_class ON pg_class.oid = pg_index.indexrelid '
+                    'WHERE pg_class.relname = :name AND NOT pg_index.indisvalid'
+                ),
+                name=name,
+            ).first()
+            if invalid:
+                op.execute(f'DROP INDEX CONCURRENTLY IF EXISTS {name}')
+            op.execute(f'CREATE INDEX CONCURRENTLY IF NOT EXISTS {name} ON package_sharing_policy {definition}')
+
+
+def downgrade():
+    with autocommit_block():
+        for name in _INDEXES:
+            op.execute(f'DROP INDEX CONCURRENTLY IF EXISTS {name}')
@@ -0,0 +1,28 @@
+"""add package sharing policy applied state
+
+Revision ID: a8ed527165df
+Revises: 5645daacca80
+Create Date: 2026-10-18 10:12:41.208311
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'a8ed527165df'
+down_revision = '5645daacca80'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    # fail instead of blocking the queries queued behind a long transaction.
+    op.execute("SET LOCAL lock_timeout = '5s'")
+    # existing rows keep a NULL applied state, meaning that their desired state
+    # was applied, so no rows need to be rewritten.
+    op.add_column('package_sharing_policy', sa.Column('applied_allowed', sa.Boolean, nullable=True))
+
+
+def downgrade():
+    op.drop_column('package_sharing_policy', 'applied_allowed')
@@ -0,0 +1,34 @@
+"""create access_point_usage table
+
+Revision ID: b52f8e17d0a6
+Revises: e4a06c3f91b8
+Create Date: 2026-10-18 18:45:32.506217
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'b52f8e17d0a6'
+down_revision = 'e4a06c3f91b8'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    # the plugin creates its missing tables when configured, so the table may
+    # have been created when CKAN restarted before the migration ran.
+    if 'access_point_usage' in sa.inspect(op.get_bind()).get_table_names():
+        return
+    op.create_table(
+        'access_point_usage',
+        sa.Column('handle', sa.UnicodeText, primary_key=True),
+        sa.Column('size', sa.Integer, nullable=False),
+        sa.Column('prefixes', sa.Integer, nullable=False),
+        sa.Column('updated', sa.DateTime, nullable=False),
+    )
+
+
+def downgrade():
+    op.drop_table('access_point_usage')
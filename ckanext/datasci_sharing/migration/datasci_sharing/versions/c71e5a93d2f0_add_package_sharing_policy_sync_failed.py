@@ -0,0 +1,48 @@
+"""add package sharing policy sync failed
+
+Revision ID: c71e5a93d2f0
+Revises: b52f8e17d0a6
+Create Date: 2026-10-18 20:14:07.318562
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+from ckanext.datasci_sharing.migration_utils import autocommit_block
+
+
+# revision identifiers, used by Alembic.
+revision = 'c71e5a93d2f0'
+down_revision = 'b52f8e17d0a6'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    # fail instead of blocking the queries queued behind a long transaction.
+    op.execute("SET LOCAL lock_timeout = '5s'")
+    op.add_column('package_sharing_policy', sa.Column('sync_failed', sa.DateTime, nullable=True))
+    # the index is created concurrently, outside of the migration transaction,
+    # so that writes to the table are not blocked while it is built.
+    with autocommit_block():
+        # only an index left invalid by a failed concurrent build is rebuilt.
+        invalid = op.get_bind().execute(
+            sa.text(
+                'SELECT 1 FROM pg_index JOIN pg_class ON pg_class.oid = pg_index.indexrelid '
+                'WHERE pg_class.relname = :name AND NOT pg_index.indisvalid'
+            ),
+            name='ix_package_sharing_policy_sync_failed',
+        ).first()
+        if invalid:
+            op.execute('DROP INDEX CONCURRENTLY IF EXISTS ix_package_sharing_policy_sync_failed')
+        op.execute(
+            'CREATE INDEX CONCURRENTLY IF NOT EXISTS ix_package_sharing_policy_sync_failed '
+            'ON package_sharing_policy (package_id) WHERE sync_failed IS NOT NULL'
+        )
+
+
+def downgrade():
+    with autocommit_block():
+        op.execute('DROP INDEX CONCURRENTLY IF EXISTS ix_package_sharing_policy_sync_failed')
+    op.execute("SET LOCAL lock_timeout = '5s'")
+    op.drop_column('package_sharing_policy', 'sync_failed')
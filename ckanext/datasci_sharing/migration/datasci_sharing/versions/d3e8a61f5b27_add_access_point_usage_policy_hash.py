@@ -0,0 +1,27 @@
+"""add access point usage policy hash
+
+Revision ID: d3e8a61f5b27
+Revises: c71e5a93d2f0
+Create Date: 2026-10-18 22:41:55.129364
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'd3e8a61f5b27'
+down_revision = 'c71e5a93d2f0'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    # fail instead of blocking the queries queued behind a long transaction.
+    op.execute("SET LOCAL lock_timeout = '5s'")
+    op.add_column('access_point_usage', sa.Column('policy_hash', sa.UnicodeText, nullable=True))
+
+
+def downgrade():
+    op.execute("SET LOCAL lock_timeout = '5s'")
+    op.drop_column('access_point_usage', 'policy_hash')
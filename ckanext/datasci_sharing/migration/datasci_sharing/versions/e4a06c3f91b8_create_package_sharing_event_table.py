@@ -0,0 +1,44 @@
+"""create package_sharing_event table
+
+Revision ID: e4a06c3f91b8
+Revises: 7d2b9e6a4c13
+Create Date: 2026-10-18 17:24:10.118562
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'e4a06c3f91b8'
+down_revision = '7d2b9e6a4c13'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    # the plugin creates its missing tables when configured, so the table may
+    # have been created when CKAN restarted before the migration ran.
+    if 'package_sharing_event' in sa.inspect(op.get_bind()).get_table_names():
+        return
+    op.create_table(
+        'package_sharing_event',
+        sa.Column('id', sa.BigInteger, primary_key=True, autoincrement=True),
+        sa.Column('package_id', sa.UnicodeText, nullable=False),
+        sa.Column('handle', sa.UnicodeText, nullable=True),
+        sa.Column('prefix', sa.UnicodeText, nullable=True),
+        sa.Column('allowed', sa.Boolean, nullable=False),
+        sa.Column('actor', sa.UnicodeText, nullable=True),
+        sa.Column('policy_hash', sa.UnicodeText, nullable=True),
+        sa.Column('created', sa.DateTime, nullable=False),
+    )
+    op.create_index(
+        'ix_package_sharing_event_package_id_created',
+        'package_sharing_event',
+        ['package_id', 'created'],
+    )
+    op.create_index('ix_package_sharing_event_created', 'package_sharing_event', ['created'])
+
+
+def downgrade():
+    op.drop_table('package_sharing_event')
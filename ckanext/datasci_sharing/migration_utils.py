@@ -0,0 +1,22 @@
+"""Helpers shared by the migrations of the plugin."""
+from contextlib import contextmanager
+
+from alembic import op
+
+
+@contextmanager
+def autocommit_block():
+    """Run the statements of the block outside of the migration transaction,
+    for example to build indexes concurrently, after committing it.
+
+    Alembic provides `op.get_context().autocommit_block()` from 1.2 on, while
+    CKAN 2.9 pins an older release, so the connection is switched to
+    autocommit on the DBAPI connection instead.
+    """
+    dbapi_connection = op.get_bind().connection.connection
+    dbapi_connection.commit()
+    dbapi_connection.autocommit = True
+    try:
+        yield
+    finally:
+        dbapi_connection.autocommit = False
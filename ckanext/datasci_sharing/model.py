@@ -1,3 +1,4 @@
+import datetime
 from typing import Optional
 
 from sqlalchemy import (
@@ -5,13 +6,24 @@ from sqlalchemy import (
     Column,
     UnicodeText,
     ForeignKey,
+    BigInteger,
     Boolean,
+    DateTime,
+    Index,
+    Integer,
+    and_,
+    func,
+    or_,
+    text,
+    tuple_,
 )
 
 import ckan.model as model
 from ckan.model import types, meta
 from ckan.model.domain_object import DomainObject
 
+from .sharing_policy_document import POLICY_DOCUMENT_SIZE_LIMIT
+
 
 package_sharing_policy_table = Table(
     'package_sharing_policy',
@@ -24,7 +36,62 @@ package_sharing_policy_table = Table(
         default=types.make_uuid,
     ),
     Column('allowed', Boolean),
+    # the access point the package was last shared on.
+    Column('handle', UnicodeText, nullable=True),
+    # the package prefix last shared on the access point `handle`. NULL for rows
+    # written before prefixes were stored, which shared the current prefix.
+    Column('prefix', UnicodeText, nullable=True),
+    # the sharing state last applied to the access point policy, `allowed` being
+    # the desired state. NULL for rows written before the desired and applied
+    # states were tracked separately, which are always applied.
+    Column('applied_allowed', Boolean, nullable=True),
+    # when the sync requested after the last change failed, NULL once synced.
+    Column('sync_failed', DateTime, nullable=True),
+    Index('ix_package_sharing_policy_handle', 'handle'),
+    # the packages pending to be applied are few, so the index stays small.
+    Index(
+        'ix_package_sharing_policy_pending',
+        'package_id',
+        postgresql_where=text('applied_allowed IS NOT NULL AND applied_allowed <> allowed'),
+    ),
+    Index(
+        'ix_package_sharing_policy_sync_failed',
+        'package_id',
+        postgresql_where=text('sync_failed IS NOT NULL'),
+    ),
+)
+
+
+# append-only, rows are never updated and are deleted only when older than the
+# retention period. Packages are not referenced by a foreign key so that the
+# events of deleted packages are kept.
+package_sharing_event_table = Table(
+    'package_sharing_event',
+    meta.metadata,
+    Column('id', BigInteger, primary_key=True, autoincrement=True),
+    Column('package_id', UnicodeText, nullable=False),
     Column('handle', UnicodeText, nullable=True),
+    Column('prefix', UnicodeText, nullable=True),
+    Column('allowed', Boolean, nullable=False),
+    Column('actor', UnicodeText, nullable=True),
+    # sha256 of the policy of the access point `handle` once the change was applied.
+    Column('policy_hash', UnicodeText, nullable=True),
+    Column('created', DateTime, nullable=False, default=datetime.datetime.utcnow),
+    Index('ix_package_sharing_event_package_id_created', 'package_id', 'created'),
+    Index('ix_package_sharing_event_created', 'created'),
+)
+
+
+# the usage of the policy of each access point, recorded after every write.
+access_point_usage_table = Table(
+    'access_point_usage',
+    meta.metadata,
+    Column('handle', UnicodeText, primary_key=True),
+    Column('size', Integer, nullable=False),
+    Column('prefixes', Integer, nullable=False),
+    # sha256 of the policy written by the last change applied to the access point.
+    Column('policy_hash', UnicodeText, nullable=True),
+    Column('updated', DateTime, nullable=False, default=datetime.datetime.utcnow),
 )
 
 
@@ -34,10 +101,14 @@ class PackageSharingPolicy(DomainObject):
         package_id: Optional[str],
         allowed: bool = False,
         handle: Optional[str] = None,
+        prefix: Optional[str] = None,
+        applied_allowed: Optional[bool] = False,
     ):
         self.package_id = package_id
         self.allowed = allowed
         self.handle = handle
+        self.prefix = prefix
+        self.applied_allowed = applied_allowed
 
     @classmethod
     def get_or_default(cls, package_id, for_update=False):
@@ -46,5 +117,230 @@ class PackageSharingPolicy(DomainObject):
             query = query.with_for_update()
         return query.one_or_none() or PackageSharingPolicy(package_id=package_id)
 
+    @classmethod
+    def mark_applied(
+        cls,
+        package_id: str,
+        applied_allowed: bool,
+        handle: Optional[str] = None,
+        prefix: Optional[str] = None,
+        event: Optional['PackageSharingEvent'] = None,
+    ):
+        """Record the state applied to the access points, and the access point
+        and prefix the package is shared on if given. The `event` of the change,
+        if any, is added in the same transaction.
+
+        Must be called while holding the locks of the access points, so that
+        the recorded state is the one applied last, even if the desired state
+        changed since.
+        """
+        values = {'applied_allowed': applied_allowed, 'sync_failed': None}
+        if handle is not None:
+            values.update(handle=handle, prefix=prefix)
+        (
+            model.Session.query(cls)
+            .filter_by(package_id=package_id)
+            .update(values, synchronize_session=False)
+        )
+        if event is not None:
+            model.Session.add(event)
+        model.repo.commit()
+
+    @classmethod
+    def discard_intent(cls, package_id: str):
+        """Reset the desired state to the state last applied, for changes that
+        were rejected while being applied, committing the transaction.
+        """
+        (
+            model.Session.query(cls)
+            .filter_by(package_id=package_id)
+            .filter(cls.applied_allowed.isnot(None))
+            .update({'allowed': cls.applied_allowed, 'sync_failed': None}, synchronize_session=False)
+        )
+        model.repo.commit()
+
+    @classmethod
+    def mark_sync_failed(cls, package_id: str):
+        """Record that the sync of the package failed, so that it is listed as
+        pending until it is synced, committing the transaction.
+        """
+        policy = cls.get_or_default(package_id)
+        policy.sync_failed = datetime.datetime.utcnow()
+        policy.save()
+
+    @classmethod
+    def clear_sync_failed(cls, package_id: str):
+        """Record that the package was synced, committing the transaction."""
+        (
+            model.Session.query(cls)
+            .filter_by(package_id=package_id)
+            .filter(cls.sync_failed.isnot(None))
+            .update({'sync_failed': None}, synchronize_session=False)
+        )
+        model.repo.commit()
+
+    @classmethod
+    def shared_handles(cls):
+        """Query the distinct access points packages are shared on."""
+        return (
+            model.Session.query(cls.handle)
+            .filter(cls.handle.isnot(None))
+            .filter(~cls.handle.contains(':'))
+            .filter(func.coalesce(cls.applied_allowed, cls.allowed).is_(True))
+            .distinct()
+        )
+
+    @classmethod
+    def missing_applied_allowed(cls):
+        """Query the rows written before the applied state was stored."""
+        return model.Session.query(cls).filter(cls.applied_allowed.is_(None))
+
+    @classmethod
+    def missing_prefix(cls):
+        """Query the rows shared before prefixes were stored."""
+        return (
+            model.Session.query(cls)
+            .filter(cls.handle.isnot(None))
+            .filter(~cls.handle.contains(':'))
+            .filter(cls.prefix.is_(None))
+        )
+
+    @classmethod
+    def pending_package_ids(cls):
+        """Query the ids of packages whose desired state was not applied, or
+        whose last sync failed.
+        """
+        return (
+            model.Session.query(cls.package_id)
+            .filter(or_(
+                and_(cls.applied_allowed.isnot(None), cls.applied_allowed != cls.allowed),
+                cls.sync_failed.isnot(None),
+            ))
+        )
+
+
+class PackageSharingEvent(DomainObject):
+    def __init__(
+        self,
+        package_id: str,
+        allowed: bool,
+        handle: Optional[str] = None,
+        prefix: Optional[str] = None,
+        actor: Optional[str] = None,
+        policy_hash: Optional[str] = None,
+    ):
+        self.package_id = package_id
+        self.allowed = allowed
+        self.handle = handle
+        self.prefix = prefix
+        self.actor = actor
+        self.policy_hash = policy_hash
+
+    def as_dict(self) -> dict:
+        return {
+            'id': self.id,
+            'package_id': self.package_id,
+            'handle': self.handle,
+            'prefix': self.prefix,
+            'allowed': self.allowed,
+            'actor': self.actor,
+            'policy_hash': self.policy_hash,
+            'created': self.created.isoformat(),
+        }
+
+    @classmethod
+    def query(
+        cls,
+        package_id: Optional[str] = None,
+        since: Optional[datetime.datetime] = None,
+        until: Optional[datetime.datetime] = None,
+        before_id: Optional[int] = None,
+    ):
+        """Query the events, newest first, of the package if given, created
+        within `since` (inclusive) and `until` (exclusive), after the event
+        `before_id` in that order to continue from a previous page.
+        """
+        query = model.Session.query(cls)
+        if package_id is not None:
+            query = query.filter(cls.package_id == package_id)
+        if since is not None:
+            query = query.filter(cls.created >= since)
+        if until is not None:
+            query = query.filter(cls.created < until)
+        if before_id is not None:
+            # paginated on (created, id), in the order of the indexes on created.
+            before_created = model.Session.query(cls.created).filter(cls.id == before_id).as_scalar()
+            query = query.filter(tuple_(cls.created, cls.id) < tuple_(before_created, before_id))
+        return query.order_by(cls.created.desc(), cls.id.desc())
+
+    @classmethod
+    def prune(cls, older_than: datetime.datetime, batch_size: int = 1000) -> int:
+        """Delete `batch_size` events created before `older_than`, committing the
+        transaction. Returns the number of events deleted.
+        """
+        ids = (
+            model.Session.query(cls.id)
+            .filter(cls.created < older_than)
+            .order_by(cls.created)
+            .limit(batch_size)
+            .subquery()
+        )
+        deleted = (
+            model.Session.query(cls)
+            .filter(cls.id.in_(model.Session.query(ids.c.id)))
+            .delete(synchronize_session=False)
+        )
+        model.repo.commit()
+        return deleted
+
+
+class AccessPointUsage(DomainObject):
+    def __init__(self, handle: str, size: int, prefixes: int, policy_hash: Optional[str] = None):
+        self.handle = handle
+        self.size = size
+        self.prefixes = prefixes
+        self.policy_hash = policy_hash
+        self.updated = datetime.datetime.utcnow()
+
+    @property
+    def headroom(self) -> int:
+        """Characters left under the policy document size limit."""
+        return POLICY_DOCUMENT_SIZE_LIMIT - self.size
+
+    def as_dict(self) -> dict:
+        return {
+            'handle': self.handle,
+            'size': self.size,
+            'limit': POLICY_DOCUMENT_SIZE_LIMIT,
+            'headroom': self.headroom,
+            'prefixes': self.prefixes,
+            'updated': self.updated.isoformat(),
+        }
+
+    @classmethod
+    def query(cls):
+        return model.Session.query(cls)
+
+    @classmethod
+    def get(cls, handle: str) -> Optional['AccessPointUsage']:
+        return model.Session.query(cls).get(handle)
+
+    @classmethod
+    def recorded_policy_hash(cls, handle: str) -> Optional[str]:
+        """Hash of the policy last written to the access point, read from the
+        database rather than the session.
+        """
+        return model.Session.query(cls.policy_hash).filter(cls.handle == handle).scalar()
+
+    @classmethod
+    def record(cls, handle: str, size: int, prefixes: int, policy_hash: Optional[str] = None):
+        """Record the usage of the access point, and the hash of the policy if
+        it was written by the extension, without committing the transaction.
+        Must be called while holding the access point lock.
+        """
+        model.Session.merge(cls(handle, size, prefixes, policy_hash))
+
 
 meta.mapper(PackageSharingPolicy, package_sharing_policy_table)
+meta.mapper(PackageSharingEvent, package_sharing_event_table)
+meta.mapper(AccessPointUsage, access_point_usage_table)
@@ -0,0 +1,167 @@
+import abc
+import csv
+import functools
+import hashlib
+import json
+import logging
+import re
+import typing as t
+
+from .config import config
+from .rate_limiter import RateLimitedClient, get_rate_limiter
+from .utils import LRUCache
+
+
+logger = logging.getLogger(__name__)
+
+
+class ShortNameUnavailable(Exception):
+    """Exception raised when the short name of an organization cannot be resolved."""
+    pass
+
+
+class ShortOrganizationNameStrategy(abc.ABC):
+    """Resolves the short name of an organization from its title.
+
+    The short name is used to build the name of the access point for the organization,
+    so implementations must always return the same short name for the same title.
+    """
+    @abc.abstractmethod
+    def __call__(self, title: str) -> str:
+        pass
+
+    def probe(self) -> bool:
+        """Check that the services the strategy depends on are reachable, raising
+        an exception otherwise. Returns `False` if there is nothing to check.
+        """
+        return False
+
+
+class LambdaShortOrganizationNameStrategy(ShortOrganizationNameStrategy):
+    """Resolves short names by invoking the `GetShortGroup` lambda function."""
+    def __init__(self, session, function_arn: str, region: str):
+        self._lambda = RateLimitedClient(
+            session.client('lambda', region_name=region),
+            get_rate_limiter('lambda'),
+        )
+        self._function_arn = function_arn
+
+    def __call__(self, title: str) -> str:
+        response = self._lambda.invoke(
+            FunctionName=self._function_arn,
+            Payload=json.dumps({"group": title}).encode(),
+        )
+        error = response.get('FunctionError')
+        payload = json.loads(response['Payload'].read().decode())
+
+        if error or payload['statusCode'] != 200:
+            logger.error(
+                'error invoking GetShortName lambda function: %s: %s',
+                error or 'client error',
+                payload,
+            )
+            raise ShortNameUnavailable('unable to get group short name')
+        else:
+            return payload['body']
+
+    def probe(self) -> bool:
+        self._lambda.get_function_configuration(FunctionName=self._function_arn)
+        return True
+
+
+_NON_ALPHANUMERIC = re.compile(r'[^a-z0-9]+')
+_HASH_LENGTH = 8
+
+
+class HashShortOrganizationNameStrategy(ShortOrganizationNameStrategy):
+    """Computes short names locally as a slug of the title followed by a hash of the title.
+
+    For example, the title `'Example Organization'` with a `max_length` of 16
+    becomes `'example-1501e096'`. The hash keeps short names of titles sharing
+    the same slug distinct.
+    """
+    def __init__(self, max_length: int):
+        if max_length <= _HASH_LENGTH + 1:
+            raise ValueError(f'max_length must be greater than {_HASH_LENGTH + 1}')
+        self._max_length = max_length
+
+    def __call__(self, title: str) -> str:
+        digest = hashlib.sha1(title.encode()).hexdigest()[:_HASH_LENGTH]
+        slug_length = self._max_length - _HASH_LENGTH - 1
+        slug = _NON_ALPHANUMERIC.sub('-', title.lower())[:slug_length].strip('-')
+        return f'{slug}-{digest}' if slug else digest
+
+
+class MappingShortOrganizationNameStrategy(ShortOrganizationNameStrategy):
+    """Resolves short names from an in-memory mapping of organization titles to short names."""
+    def __init__(self, mapping: t.Mapping[str, str]):
+        self._mapping = mapping
+
+    @classmethod
+    def from_csv(cls, path: str) -> 'MappingShortOrganizationNameStrategy':
+        """Load the mapping from a CSV file with `title` and `short_name` columns."""
+        with open(path, newline='') as file:
+            mapping = {row['title']: row['short_name'] for row in csv.DictReader(file)}
+        logger.info('loaded %s organization short names from %s', len(mapping), path)
+        return cls(mapping)
+
+    def __call__(self, title: str) -> str:
+        try:
+            return self._mapping[title]
+        except KeyError:
+            raise ShortNameUnavailable(f'no short name mapped for group {title!r}') from None
+
+
+class CachedShortOrganizationNameStrategy(ShortOrganizationNameStrategy):
+    """Caches the short names resolved by another strategy, which are the same
+    for the same title, keeping the most recently used ones.
+    """
+    def __init__(self, strategy: ShortOrganizationNameStrategy, short_names: t.Optional[LRUCache] = None):
+        self._strategy = strategy
+        self._short_names = LRUCache(config.short_name_cache_size) if short_names is None else short_names
+
+    def __call__(self, title: str) -> str:
+        short_name = self._short_names.get(title)
+        if short_name is None:
+            short_name = self._strategy(title)
+            self._short_names.set(title, short_name)
+        return short_name
+
+    def probe(self) -> bool:
+        return self._strategy.probe()
+
+
+SHORT_NAME_STRATEGIES = ('lambda', 'hash', 'mapping')
+
+
+@functools.lru_cache(maxsize=None)
+def _load_mapping_strategy(path: str) -> MappingShortOrganizationNameStrategy:
+    return MappingShortOrganizationNameStrategy.from_csv(path)
+
+
+def create_short_name_strategy(session) -> ShortOrganizationNameStrategy:
+    """Create the short name strategy selected by the `short_name_strategy` config option."""
+    name = config.short_name_strategy
+    if name == 'lambda':
+        return LambdaShortOrganizationNameStrategy(
+            session,
+            config.short_name_lambda_arn,
+            config.short_name_lambda_region,
+        )
+    elif name == 'hash':
+        return HashShortOrganizationNameStrategy(config.short_name_max_length)
+    elif name == 'mapping':
+        return _load_mapping_strategy(config.short_name_mapping_file)
+    else:
+        raise ValueError(f'unknown short name strategy {name!r}')
+
+
+def load_short_name_strategy():
+    """Eagerly load the configured strategy so that configuration errors surface and
+    mapping files are read at startup.
+    """
+    name = config.short_name_strategy
+    if name not in SHORT_NAME_STRATEGIES:
+        raise ValueError(f'unknown short name strategy {name!r}')
+    if name == 'mapping':
+        _load_mapping_strategy(config.short_name_mapping_file)
@@ -0,0 +1,136 @@
+"""Coalescing of the sharing policy syncs requested while handling a request.
+
+A single request can create and then update the same package several times,
+for example `resource_create` updates the package it belongs to. Instead of
+syncing on every change, the packages changed during a request are synced
+once after the request is handled.
+
+API requests are synced immediately, so that API clients get the errors.
+Syncs that fail after the request was handled are flashed and recorded as
+failed, so that the packages stay pending until the `reconcile` command or
+their next change syncs them.
+"""
+from collections import OrderedDict
+import logging
+import typing as t
+
+import ckan.model as model
+from ckan.plugins import toolkit
+from flask import g, has_request_context, request
+
+from .actions import sync_package_sharing_policy
+from .config import SHARE_INTERNALLY_FIELD
+from .model import PackageSharingPolicy
+
+
+logger = logging.getLogger(__name__)
+
+
+_PENDING_SYNCS_ATTR = 'datasci_sharing_pending_syncs'
+
+
+class _PendingSync(t.NamedTuple):
+    context: dict
+    initial_allowed: bool
+
+
+def _applied_allowed(package_id: str) -> bool:
+    policy = PackageSharingPolicy.get_or_default(package_id)
+    return bool(policy.allowed if policy.applied_allowed is None else policy.applied_allowed)
+
+
+def _desired_allowed(package_id: str) -> bool:
+    package = model.Package.get(package_id)
+    if package is None or package.state == 'deleted':
+        return False
+    return toolkit.asbool(package.extras.get(SHARE_INTERNALLY_FIELD, False))
+
+
+def _needs_sync(package_id: str, initial_allowed: bool) -> bool:
+    # shared packages are always synced, as they may have been renamed or
+    # moved to another organization.
+    return initial_allowed or _desired_allowed(package_id)
+
+
+def _is_api_request() -> bool:
+    return request.path.startswith('/api/')
+
+
+def request_sync(context, package_id: str):
+    """Sync the sharing policy of the package once the current request is handled,
+    or immediately when not handling a request or when handling an API request.
+    """
+    if not has_request_context() or _is_api_request():
+        if _needs_sync(package_id, _applied_allowed(package_id)):
+            sync_package_sharing_policy(context, {'package_id': package_id})
+        else:
+            logger.debug("skipping sync of package %s, not shared", package_id)
+        return
+
+    pending = g.setdefault(_PENDING_SYNCS_ATTR, OrderedDict())
+    if package_id not in pending:
+        sync_context = {'user': context.get('user'), 'ignore_auth': context.get('ignore_auth', False)}
+        pending[package_id] = _PendingSync(sync_context, _applied_allowed(package_id))
+
+
+def _mark_sync_failed(package_id: str):
+    # the failed sync may have left changes in the session.
+    model.Session.rollback()
+    try:
+        PackageSharingPolicy.mark_sync_failed(package_id)
+    except Exception:
+        model.Session.rollback()
+        logger.exception("unable to record the failed sync of package %s", package_id)
+
+
+def _field_errors(error: Exception) -> t.Optional[list]:
+    # errors of the sharing field explain why the dataset cannot be shared,
+    # the change being rejected rather than pending.
+    return error.error_dict.get(SHARE_INTERNALLY_FIELD) if isinstance(error, toolkit.ValidationError) else None
+
+
+def _notify_failure(error: Exception):
+    field_errors = _field_errors(error)
+    if field_errors:
+        toolkit.h.flash_error(
+            toolkit._("The dataset was saved but could not be shared: {error}").format(error=field_errors[0])
+        )
+    else:
+        toolkit.h.flash_error(toolkit._(
+            "The dataset was saved but its sharing settings could not be updated, "
+            "please try again later."
+        ))
+
+
+def flush_pending_syncs(notify: bool = True):
+    """Sync the packages changed during the current request, once the changes
+    left uncommitted by the request are rolled back, skipping the packages that
+    were not shared and ended up not shared. Packages that fail
+    to sync are recorded as failed, unless their change was rejected, and the
+    failure is flashed if `notify` is set.
+    """
+    pending = g.pop(_PENDING_SYNCS_ATTR, None)
+    if not pending:
+        return
+
+    # syncs commit the session, changes left uncommitted by the request, for
+    # example by an action that raised, must not be committed with them.
+    model.Session.rollback()
+    for package_id, sync in pending.items():
+        if not _needs_sync(package_id, sync.initial_allowed):
+            logger.debug("skipping sync of package %s, not shared", package_id)
+            continue
+
+        try:
+            sync_package_sharing_policy(dict(sync.context), {'package_id': package_id})
+        except toolkit.ObjectNotFound:
+            logger.debug("skipping sync of missing package %s", package_id)
+        except Exception as e:
+            if isinstance(e, toolkit.ValidationError):
+                logger.warning("unable to sync sharing policy of package %s: %s", package_id, e.error_summary)
+            else:
+                logger.exception("unable to sync sharing policy of package %s", package_id)
+            if not _field_errors(e):
+                _mark_sync_failed(package_id)
+            if notify:
+                _notify_failure(e)
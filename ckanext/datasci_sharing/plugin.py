@@ -3,11 +3,22 @@ import logging
 import ckan.plugins as plugins
 import ckan.plugins.toolkit as toolkit
 
-from .auth import share_internally_show, share_internally_update
-from .actions import sync_package_sharing_policy
-from .config import SHARE_INTERNALLY_FIELD
-from .model import package_sharing_policy_table
+from . import cli, views
+from .auth import access_point_usage_list as access_point_usage_list_auth
+from .auth import package_sharing_event_list as package_sharing_event_list_auth
+from .auth import share_internally_show, share_internally_update, sharing_health_details
+from .actions import (
+    access_point_usage_list,
+    check_sharing_capacity,
+    package_sharing_event_list,
+    sync_package_sharing_policy,
+)
+from .config import SHARE_INTERNALLY_FIELD, config as sharing_config
+from .model import access_point_usage_table, package_sharing_event_table, package_sharing_policy_table
+from .organization_short_name import load_short_name_strategy
+from .pending_syncs import request_sync
 from .sharing_policy_dataset_form import SharingPolicyDatasetForm
+from .warm_up import register_post_fork_warm_up
 
 
 logger = logging.getLogger(__name__)
@@ -20,12 +31,21 @@ class DatasciSharingPlugin(plugins.SingletonPlugin, SharingPolicyDatasetForm):
     plugins.implements(plugins.IActions)
     plugins.implements(plugins.IDatasetForm)
     plugins.implements(plugins.IPackageController, inherit=True)
+    plugins.implements(plugins.IClick)
+    plugins.implements(plugins.IBlueprint)
 
     # IConfigurable
 
     def configure(self, config):
         if not package_sharing_policy_table.exists():
             package_sharing_policy_table.create()
+        if not package_sharing_event_table.exists():
+            package_sharing_event_table.create()
+        if not access_point_usage_table.exists():
+            access_point_usage_table.create()
+        load_short_name_strategy()
+        if sharing_config.warm_up_enabled:
+            register_post_fork_warm_up()
 
     # IConfigurer
 
@@ -40,12 +60,29 @@ class DatasciSharingPlugin(plugins.SingletonPlugin, SharingPolicyDatasetForm):
         return {
             share_internally_show.__name__: share_internally_show,
             share_internally_update.__name__: share_internally_update,
+            package_sharing_event_list_auth.__name__: package_sharing_event_list_auth,
+            access_point_usage_list_auth.__name__: access_point_usage_list_auth,
+            sharing_health_details.__name__: sharing_health_details,
         }
 
     # IActions
 
     def get_actions(self):
-        return {sync_package_sharing_policy.__name__: sync_package_sharing_policy}
+        return {
+            sync_package_sharing_policy.__name__: sync_package_sharing_policy,
+            package_sharing_event_list.__name__: package_sharing_event_list,
+            access_point_usage_list.__name__: access_point_usage_list,
+        }
+
+    # IClick
+
+    def get_commands(self):
+        return cli.get_commands()
+
+    # IBlueprint
+
+    def get_blueprint(self):
+        return views.get_blueprints()
 
     # IPackageController
 
@@ -58,9 +95,10 @@ class DatasciSharingPlugin(plugins.SingletonPlugin, SharingPolicyDatasetForm):
         return pkg_dict
 
     def _update_policy(self, context, pkg_dict):
-        sync_package_sharing_policy(context, {
-            'package_id': pkg_dict['id'],
-        })
+        # rejected before the package is saved, as web requests only sync the
+        # package once the request is handled.
+        check_sharing_capacity(pkg_dict)
+        request_sync(context, pkg_dict['id'])
 
     def after_create(self, context, pkg_dict):
         self._update_policy(context, pkg_dict)
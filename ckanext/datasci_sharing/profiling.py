@@ -0,0 +1,179 @@
+"""Profiling of slow sharing policy syncs.
+
+When enabled, every profiled call records the time spent in each of its
+stages. Calls slower than the configured threshold are kept in a bounded ring
+buffer on disk, optionally with a cProfile dump, to be inspected with the
+`datasci-sharing profiles` command.
+"""
+from contextlib import contextmanager
+from contextvars import ContextVar
+import cProfile
+import io
+import json
+import logging
+import os
+import pstats
+import time
+import typing as t
+import uuid
+
+from .config import config
+
+
+logger = logging.getLogger(__name__)
+
+
+class SyncProfile:
+    """Timings of the stages of a single profiled call."""
+    __slots__ = ('name', 'attributes', 'started', 'duration', 'stages', 'events')
+
+    def __init__(self, name: str, attributes: dict):
+        self.name = name
+        self.attributes = attributes
+        self.started = time.time()
+        self.duration = 0.0
+        self.stages: t.List[t.Tuple[str, float]] = []
+        self.events: t.Dict[str, int] = {}
+
+    def as_dict(self) -> dict:
+        return {
+            'name': self.name,
+            'attributes': self.attributes,
+            'started': self.started,
+            'duration': self.duration,
+            'stages': [{'stage': stage, 'duration': duration} for stage, duration in self.stages],
+            'events': self.events,
+        }
+
+
+_current_profile: ContextVar[t.Optional[SyncProfile]] = ContextVar(
+    'datasci_sharing_current_profile', default=None
+)
+
+
+def record_stage(name: str, duration: float):
+    """Record the duration of a stage of the current profiled call, if any."""
+    profile = _current_profile.get()
+    if profile is not None:
+        profile.stages.append((name, duration))
+
+
+def record_event(name: str):
+    """Count an event, such as a retry, of the current profiled call, if any."""
+    profile = _current_profile.get()
+    if profile is not None:
+        profile.events[name] = profile.events.get(name, 0) + 1
+
+
+@contextmanager
+def stage(name: str):
+    """Time the enclosed block as a stage of the current profiled call, if any."""
+    if _current_profile.get() is None:
+        yield
+        return
+
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        record_stage(name, time.perf_counter() - started)
+
+
+class ProfileStore:
+    """A ring buffer of profiles stored as files in `directory`, keeping the
+    latest `max_entries` profiles.
+    """
+    def __init__(self, directory: str, max_entries: int):
+        self._directory = directory
+        self._max_entries = max_entries
+
+    def _path(self, profile_id: str, extension: str) -> str:
+        return os.path.join(self._directory, f'{profile_id}.{extension}')
+
+    def save(self, profile: SyncProfile, profiler: t.Optional[cProfile.Profile] = None) -> str:
+        os.makedirs(self._directory, exist_ok=True)
+        # ids sort by time so that the oldest profiles are evicted first.
+        profile_id = f'{int(profile.started * 1000):015d}-{uuid.uuid4().hex[:8]}'
+        with open(self._path(profile_id, 'json'), 'w') as file:
+            json.dump(profile.as_dict(), file)
+        if profiler is not None:
+            profiler.dump_stats(self._path(profile_id, 'prof'))
+        self._evict()
+        return profile_id
+
+    def _evict(self):
+        for profile_id in self.ids()[:-self._max_entries or None]:
+            for extension in ('json', 'prof'):
+                try:
+                    os.remove(self._path(profile_id, extension))
+                except FileNotFoundError:
+                    pass
+
+    def ids(self) -> t.List[str]:
+        """Ids of the stored profiles, oldest first."""
+        if not os.path.isdir(self._directory):
+            return []
+        return sorted(
+            name[:-len('.json')] for name in os.listdir(self._directory) if name.endswith('.json')
+        )
+
+    def get(self, profile_id: str) -> dict:
+        with open(self._path(profile_id, 'json')) as file:
+            return json.load(file)
+
+    def stats(self, profile_id: str, limit: int) -> t.Optional[str]:
+        """The cProfile stats of the profile sorted by cumulative time, if dumped."""
+        path = self._path(profile_id, 'prof')
+        if not os.path.exists(path):
+            return None
+        output = io.StringIO()
+        pstats.Stats(path, stream=output).sort_stats('cumulative').print_stats(limit)
+        return output.getvalue()
+
+
+def get_profile_store() -> ProfileStore:
+    return ProfileStore(config.profiling_directory, config.profiling_max_entries)
+
+
+@contextmanager
+def profiled(name: str, **attributes):
+    """Profile the enclosed block if profiling is enabled, storing the profile
+    if it takes longer than the configured threshold. Nested profiled blocks
+    are recorded as stages of the outermost one.
+    """
+    if _current_profile.get() is not None:
+        with stage(name):
+            yield
+        return
+    if not config.profiling_enabled:
+        yield
+        return
+
+    profile = SyncProfile(name, attributes)
+    token = _current_profile.set(profile)
+    profiler = _start_profiler() if config.profiling_cprofile else None
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        profile.duration = time.perf_counter() - started
+        if profiler is not None:
+            profiler.disable()
+        _current_profile.reset(token)
+
+        if profile.duration >= config.profiling_threshold:
+            try:
+                profile_id = get_profile_store().save(profile, profiler)
+                logger.info("%s took %.3f seconds, saved profile %s", name, profile.duration, profile_id)
+            except OSError:
+                logger.exception("unable to save profile of %s", name)
+
+
+def _start_profiler() -> t.Optional[cProfile.Profile]:
+    profiler = cProfile.Profile()
+    try:
+        profiler.enable()
+    except ValueError:
+        # another profiler is already active, for example in a concurrent thread.
+        return None
+    return profiler
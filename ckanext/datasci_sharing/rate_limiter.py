@@ -0,0 +1,282 @@
+from contextlib import contextmanager
+from contextvars import ContextVar
+import functools
+import logging
+import threading
+import time
+import typing as t
+
+from ckan.lib.redis import connect_to_redis, is_redis_available
+from redis.exceptions import RedisError
+
+from .config import config
+
+
+logger = logging.getLogger(__name__)
+
+
+INTERACTIVE = 'interactive'
+BULK = 'bulk'
+
+_priority: ContextVar[str] = ContextVar('datasci_sharing_rate_limit_priority', default=INTERACTIVE)
+_max_wait: ContextVar[t.Optional[float]] = ContextVar('datasci_sharing_rate_limit_max_wait', default=None)
+
+
+@contextmanager
+def rate_limit_priority(priority: str):
+    """Set the priority of rate limited calls made within the context.
+
+    Calls with `BULK` priority can only take tokens while the bucket holds more
+    than the reserve kept for `INTERACTIVE` calls.
+    """
+    token = _priority.set(priority)
+    try:
+        yield
+    finally:
+        _priority.reset(token)
+
+
+@contextmanager
+def rate_limit_max_wait(max_wait: float):
+    """Wait at most `max_wait` seconds to admit the rate limited calls made
+    within the context, for example `0` to fail instead of waiting.
+    """
+    token = _max_wait.set(max_wait)
+    try:
+        yield
+    finally:
+        _max_wait.reset(token)
+
+
+class RateLimitTimeout(Exception):
+    """Exception raised when a call cannot be admitted within the maximum wait time."""
+    def __init__(self, name: str, max_wait: float):
+        super().__init__(f"rate limit {name} not available within {max_wait} seconds")
+
+
+class RateLimiterStats:
+    """In-process wait time metrics of a rate limiter."""
+    __slots__ = ('calls', 'waited_calls', 'total_wait', 'max_wait', 'timeouts', '_lock')
+
+    def __init__(self):
+        self.calls = 0
+        self.waited_calls = 0
+        self.total_wait = 0.0
+        self.max_wait = 0.0
+        self.timeouts = 0
+        self._lock = threading.Lock()
+
+    def record(self, wait: float, timed_out: bool = False):
+        with self._lock:
+            self.calls += 1
+            if wait > 0:
+                self.waited_calls += 1
+                self.total_wait += wait
+                self.max_wait = max(self.max_wait, wait)
+            if timed_out:
+                self.timeouts += 1
+
+    def as_dict(self) -> dict:
+        with self._lock:
+            return {
+                'calls': self.calls,
+                'waited_calls': self.waited_calls,
+                'total_wait': self.total_wait,
+                'max_wait': self.max_wait,
+                'timeouts': self.timeouts,
+            }
+
+
+class LocalTokenBucket:
+    """A token bucket shared by the threads of the current process."""
+    def __init__(self, rate: float, capacity: float):
+        self._rate = rate
+        self._capacity = capacity
+        self._tokens = capacity
+        self._timestamp = time.monotonic()
+        self._lock = threading.Lock()
+
+    def take(self, reserve: float = 0) -> float:
+        """Take a token if one is available above `reserve`. Returns the time in
+        seconds to wait before trying again, or 0 if the token was taken.
+        """
+        with self._lock:
+            now = time.monotonic()
+            self._tokens = min(self._capacity, self._tokens + (now - self._timestamp) * self._rate)
+            self._timestamp = now
+            if self._tokens - 1 >= reserve:
+                self._tokens -= 1
+                return 0
+            return (1 + reserve - self._tokens) / self._rate
+
+
+# KEYS[1]: bucket key
+# ARGV: rate, capacity, now, reserve
+_TAKE_TOKEN_SCRIPT = """
+local rate = tonumber(ARGV[1])
+local capacity = tonumber(ARGV[2])
+local now = tonumber(ARGV[3])
+local reserve = tonumber(ARGV[4])
+local bucket = redis.call('HMGET', KEYS[1], 'tokens', 'timestamp')
+local tokens = tonumber(bucket[1]) or capacity
+local timestamp = tonumber(bucket[2]) or now
+tokens = math.min(capacity, tokens + math.max(0, now - timestamp) * rate)
+local wait = 0
+if tokens - 1 >= reserve then
+    tokens = tokens - 1
+else
+    wait = (1 + reserve - tokens) / rate
+end
+redis.call('HMSET', KEYS[1], 'tokens', tokens, 'timestamp', now)
+redis.call('EXPIRE', KEYS[1], math.ceil(capacity / rate) + 1)
+return tostring(wait)
+"""
+
+
+class RedisTokenBucket:
+    """A token bucket shared by all the processes connected to the same redis instance."""
+    def __init__(self, name: str, rate: float, capacity: float):
+        self._key = f"datasci-sharing:rate-limit-{name}"
+        self._rate = rate
+        self._capacity = capacity
+        self._script = None
+
+    def take(self, reserve: float = 0) -> float:
+        if self._script is None:
+            self._script = connect_to_redis().register_script(_TAKE_TOKEN_SCRIPT)
+        wait = self._script(
+            keys=[self._key],
+            args=[self._rate, self._capacity, time.time(), reserve],
+        )
+        return float(wait)
+
+
+# seconds the result of a redis availability check is reused, as checking
+# pings redis.
+_REDIS_CHECK_INTERVAL = 5
+
+_redis_check: t.Optional[t.Tuple[float, bool]] = None
+
+
+def _redis_available() -> bool:
+    global _redis_check
+    now = time.monotonic()
+    if _redis_check is None or now - _redis_check[0] >= _REDIS_CHECK_INTERVAL:
+        _redis_check = (now, is_redis_available())
+    return _redis_check[1]
+
+
+def _redis_failed():
+    global _redis_check
+    _redis_check = (time.monotonic(), False)
+
+
+class RateLimiter:
+    """Token bucket rate limiter backed by redis, falling back to an in-process
+    bucket when redis is not available.
+    """
+    def __init__(
+        self,
+        name: str,
+        rate: float,
+        burst: float,
+        bulk_reserve: float = 0,
+        max_wait: float = 1,
+        bulk_max_wait: float = 60,
+    ):
+        self.name = name
+        self.stats = RateLimiterStats()
+        self._bulk_reserve = min(bulk_reserve, burst - 1)
+        self._max_wait = max_wait
+        self._bulk_max_wait = bulk_max_wait
+        self._redis_bucket = RedisTokenBucket(name, rate, burst)
+        self._local_bucket = LocalTokenBucket(rate, burst)
+
+    @property
+    def max_wait(self) -> float:
+        """Maximum seconds a call of the current priority waits to be admitted,
+        bulk calls waiting longer as they only take the tokens above the reserve,
+        at most the wait set with `rate_limit_max_wait`.
+        """
+        max_wait = self._bulk_max_wait if _priority.get() == BULK else self._max_wait
+        override = _max_wait.get()
+        return max_wait if override is None else min(max_wait, override)
+
+    def _take(self, reserve: float) -> float:
+        if _redis_available():
+            try:
+                return self._redis_bucket.take(reserve)
+            except RedisError:
+                logger.warning("rate limiter %s: redis unavailable, using local bucket", self.name, exc_info=True)
+                _redis_failed()
+        return self._local_bucket.take(reserve)
+
+    def acquire(self):
+        """Block until a call is admitted, raising `RateLimitTimeout` if the wait
+        would exceed the maximum wait time.
+        """
+        reserve = self._bulk_reserve if _priority.get() == BULK else 0
+        max_wait = self.max_wait
+        waited = 0.0
+        while True:
+            wait = self._take(reserve)
+            if wait <= 0:
+                break
+            if waited + wait > max_wait:
+                self.stats.record(waited, timed_out=True)
+                raise RateLimitTimeout(self.name, max_wait)
+            time.sleep(wait)
+            waited += wait
+
+        if waited:
+            logger.debug("rate limiter %s: waited %.3f seconds", self.name, waited)
+        self.stats.record(waited)
+
+
+class RateLimitedClient:
+    """Proxy to a boto3 client acquiring from a rate limiter before every API call."""
+    def __init__(self, client, limiter: RateLimiter):
+        self._client = client
+        self._limiter = limiter
+
+    def __getattr__(self, name):
+        attr = getattr(self._client, name)
+        if not callable(attr) or name.startswith('_') or name in _UNLIMITED_CLIENT_METHODS:
+            return attr
+
+        @functools.wraps(attr)
+        def wrapper(*args, **kwargs):
+            self._limiter.acquire()
+            return attr(*args, **kwargs)
+
+        return wrapper
+
+
+_UNLIMITED_CLIENT_METHODS = frozenset(['can_paginate', 'get_paginator', 'get_waiter', 'close'])
+
+
+_limiters: t.Dict[str, RateLimiter] = {}
+_limiters_lock = threading.Lock()
+
+
+def get_rate_limiter(name: str) -> RateLimiter:
+    """Get the process wide rate limiter for the AWS service `name`, configured
+    from the `rate_limit.{name}.*` config options.
+    """
+    with _limiters_lock:
+        if name not in _limiters:
+            options = config.rate_limit(name)
+            _limiters[name] = RateLimiter(
+                name,
+                rate=options.rate,
+                burst=options.burst,
+                bulk_reserve=options.bulk_reserve,
+                max_wait=options.max_wait,
+                bulk_max_wait=options.bulk_max_wait,
+            )
+        return _limiters[name]
+
+
+def rate_limiter_stats() -> t.Dict[str, dict]:
+    with _limiters_lock:
+        return {name: limiter.stats.as_dict() for name, limiter in _limiters.items()}
@@ -0,0 +1,271 @@
+"""Export and import of all the sharing state as newline delimited JSON.
+
+An export starts with a header line, followed by a line for every row of the
+`package_sharing_policy` table and a line for every access point referenced
+by these rows, for example:
+
+    {"type": "header", "version": 1, "account_id": "...", "bucket_region": "...", "bucket_name": "..."}
+    {"type": "package_sharing_policy", "package_id": "...", "allowed": true, "applied_allowed": true, "handle": "...", "prefix": "..."}
+    {"type": "access_point", "name": "...", "policy": {...}}
+"""
+import asyncio
+import json
+import logging
+import typing as t
+
+import ckan.model as model
+
+from .async_access_points import AsyncAccessPointService, run_bulk
+from .model import AccessPointUsage, PackageSharingPolicy
+from .rate_limiter import BULK, rate_limit_priority
+from .sharing_policy_diff import PolicyDiff, diff_documents, update_prefix_unchecked
+from .sharing_policy_document import PolicyDocumentSizeLimitExceeded, SharingPolicyDocument, policy_hash
+from .sharing_policy_repository import AccessPointService, access_point_lock
+
+
+logger = logging.getLogger(__name__)
+
+
+_FORMAT_VERSION = 1
+
+HEADER = 'header'
+PACKAGE_SHARING_POLICY = 'package_sharing_policy'
+ACCESS_POINT = 'access_point'
+
+
+ProgressCallback = t.Callable[[str, int], None]
+
+
+def _no_progress(kind: str, count: int):
+    pass
+
+
+async def _write_access_points(
+    ap_service: AccessPointService,
+    names: t.Iterable[str],
+    workers: int,
+    write: t.Callable[[dict], None],
+) -> int:
+    async_service = AsyncAccessPointService(ap_service, workers)
+    count = 0
+    try:
+        async for name, policy in async_service.get_policies(names, force_refresh=True):
+            write({'type': ACCESS_POINT, 'name': name, 'policy': policy})
+            count += 1
+    finally:
+        async_service.close()
+    return count
+
+
+def export_sharing_state(
+    output: t.TextIO,
+    ap_service: AccessPointService,
+    batch_size: int = 500,
+    workers: int = 8,
+    progress: ProgressCallback = _no_progress,
+):
+    """Stream the sharing state to `output`, then fetch the policies of the
+    access points concurrently and write them as they are fetched.
+    """
+    def write(line: dict):
+        output.write(json.dumps(line) + '\n')
+
+    counts = {PACKAGE_SHARING_POLICY: 0, ACCESS_POINT: 0}
+    # there is one access point per organization, so the handles are few
+    # compared to the rows.
+    handles: t.Dict[str, None] = {}
+    write({
+        'type': HEADER,
+        'version': _FORMAT_VERSION,
+        'account_id': ap_service.account_id,
+        'bucket_region': ap_service.bucket_region,
+        'bucket_name': ap_service.bucket_name,
+    })
+
+    query = (
+        model.Session.query(PackageSharingPolicy)
+        .order_by(PackageSharingPolicy.package_id)
+        .yield_per(batch_size)
+    )
+    for policy in query:
+        write({
+            'type': PACKAGE_SHARING_POLICY,
+            'package_id': policy.package_id,
+            'allowed': bool(policy.allowed),
+            'applied_allowed': policy.applied_allowed,
+            'handle': policy.handle,
+            'prefix': policy.prefix,
+        })
+        counts[PACKAGE_SHARING_POLICY] += 1
+        if counts[PACKAGE_SHARING_POLICY] % batch_size == 0:
+            progress(PACKAGE_SHARING_POLICY, counts[PACKAGE_SHARING_POLICY])
+        # handles stored before access point names are ARNs, which are ignored.
+        if policy.handle and ':' not in policy.handle:
+            handles[policy.handle] = None
+    progress(PACKAGE_SHARING_POLICY, counts[PACKAGE_SHARING_POLICY])
+
+    counts[ACCESS_POINT] = run_bulk(_write_access_points(ap_service, handles, workers, write))
+    progress(ACCESS_POINT, counts[ACCESS_POINT])
+    return counts
+
+
+def refresh_access_point_usage(ap_service: AccessPointService, workers: int = 8) -> int:
+    """Record the usage of the access points packages are shared on from their
+    live policies, for example after the policies were changed outside CKAN.
+    Returns the number of access points recorded.
+    """
+    def record(line: dict):
+        if line['policy'] is not None:
+            document = SharingPolicyDocument(line['policy'], line['name'])
+            AccessPointUsage.record(line['name'], document.size(), len(document.shared_prefixes()))
+
+    handles = [handle for (handle,) in PackageSharingPolicy.shared_handles()]
+    count = run_bulk(_write_access_points(ap_service, handles, workers, record))
+    model.repo.commit()
+    return count
+
+
+def _rebuild_document(ap_service: AccessPointService, name: str, policy: t.Optional[dict]) -> SharingPolicyDocument:
+    # the document is rebuilt from the shared prefixes, so that exports can be
+    # restored to a different account, region or bucket.
+    document = SharingPolicyDocument.new(ap_service.bucket_region, ap_service.account_id, name)
+    if policy is not None:
+        for prefix in SharingPolicyDocument(policy, name).shared_prefixes():
+            update_prefix_unchecked(document, prefix, True)
+    return document
+
+
+def _restore_access_point(ap_service: AccessPointService, name: str, policy: t.Optional[dict]) -> str:
+    document = _rebuild_document(ap_service, name, policy)
+    PolicyDocumentSizeLimitExceeded.check(document)
+
+    # restored at bulk priority, the lock expires after the longer bulk waits.
+    with access_point_lock(name, blocking_timeout=10):
+        ap_service.ensure_exists(name)
+        if not ap_service.update(name, document.as_json()):
+            raise Exception(f'access point {name} is not available yet')
+        try:
+            AccessPointUsage.record(
+                name, document.size(), len(document.shared_prefixes()), policy_hash(document.as_json())
+            )
+            model.repo.commit()
+        finally:
+            # restored on a thread of the pool, which keeps no session open.
+            model.Session.remove()
+    return name
+
+
+def _restore_policies(batch: t.List[dict]) -> int:
+    package_ids = [line['package_id'] for line in batch]
+    existing_ids = {
+        package_id for (package_id,) in
+        model.Session.query(model.Package.id).filter(model.Package.id.in_(package_ids))
+    }
+    for line in batch:
+        if line['package_id'] not in existing_ids:
+            logger.warning('skipping sharing policy of missing package %s', line['package_id'])
+            continue
+        # the restored access point policies are the ones last applied.
+        model.Session.merge(PackageSharingPolicy(
+            package_id=line['package_id'],
+            allowed=line['allowed'],
+            handle=line['handle'],
+            prefix=line.get('prefix'),
+            applied_allowed=line.get('applied_allowed', line['allowed']),
+        ))
+    model.repo.commit()
+    return len(existing_ids)
+
+
+def plan_import_sharing_state(input: t.Iterable[str], ap_service: AccessPointService) -> t.Iterator[PolicyDiff]:
+    """Diff the access point policies of an export against the live policies
+    without writing anything.
+    """
+    with rate_limit_priority(BULK):
+        for raw_line in input:
+            if not raw_line.strip():
+                continue
+            line = json.loads(raw_line)
+            if line['type'] != ACCESS_POINT:
+                continue
+
+            name = line['name']
+            live = ap_service.get_policy(name)
+            before = SharingPolicyDocument(live, name) if live is not None else None
+            yield diff_documents(name, before, _rebuild_document(ap_service, name, line['policy']))
+
+
+async def _restore_access_points(
+    ap_service: AccessPointService,
+    lines: t.List[dict],
+    workers: int,
+) -> t.Tuple[int, int]:
+    async_service = AsyncAccessPointService(ap_service, workers)
+
+    async def restore(line: dict) -> bool:
+        async with async_service.ordered(line['name']):
+            try:
+                await async_service.call_sync(_restore_access_point, ap_service, line['name'], line['policy'])
+                return True
+            except Exception:
+                logger.exception('unable to restore access point %s', line['name'])
+                return False
+
+    try:
+        results = await asyncio.gather(*(restore(line) for line in lines))
+    finally:
+        async_service.close()
+    restored = sum(results)
+    return restored, len(results) - restored
+
+
+def import_sharing_state(
+    input: t.Iterable[str],
+    ap_service: AccessPointService,
+    batch_size: int = 500,
+    workers: int = 8,
+    progress: ProgressCallback = _no_progress,
+):
+    """Restore the sharing state exported by `export_sharing_state`.
+
+    Rows are restored in batches of `batch_size` and access points are restored
+    concurrently in batches of `workers * 4`. Importing the same export more
+    than once is safe, rows are upserted and access points are created only if
+    missing before their policy is replaced.
+    """
+    def restore_access_points():
+        restored, failed = run_bulk(_restore_access_points(ap_service, access_points, workers))
+        counts[ACCESS_POINT] += restored
+        counts['failed'] += failed
+        progress(ACCESS_POINT, counts[ACCESS_POINT])
+        access_points.clear()
+
+    counts = {PACKAGE_SHARING_POLICY: 0, ACCESS_POINT: 0, 'failed': 0}
+    batch = []
+    access_points = []
+    for raw_line in input:
+        if not raw_line.strip():
+            continue
+        line = json.loads(raw_line)
+
+        if line['type'] == HEADER:
+            if line['version'] != _FORMAT_VERSION:
+                raise ValueError(f"unsupported export version {line['version']}")
+        elif line['type'] == PACKAGE_SHARING_POLICY:
+            batch.append(line)
+            if len(batch) >= batch_size:
+                counts[PACKAGE_SHARING_POLICY] += _restore_policies(batch)
+                progress(PACKAGE_SHARING_POLICY, counts[PACKAGE_SHARING_POLICY])
+                batch = []
+        elif line['type'] == ACCESS_POINT:
+            access_points.append(line)
+            if len(access_points) >= workers * 4:
+                restore_access_points()
+
+    if batch:
+        counts[PACKAGE_SHARING_POLICY] += _restore_policies(batch)
+        progress(PACKAGE_SHARING_POLICY, counts[PACKAGE_SHARING_POLICY])
+    if access_points:
+        restore_access_points()
+
+    return counts
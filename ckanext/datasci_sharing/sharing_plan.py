@@ -0,0 +1,112 @@
+"""Planning of sharing changes without taking locks or writing to the database
+or to the access points.
+"""
+import asyncio
+import logging
+import typing as t
+
+import ckan.model as model
+from ckan.plugins import toolkit
+
+from .async_access_points import AsyncAccessPointService, AsyncShortOrganizationNameStrategy, run_bulk
+from .model import PackageSharingPolicy
+from .organization_short_name import ShortOrganizationNameStrategy
+from .sharing_policy_diff import PolicyDiff, diff_documents, update_prefix_unchecked
+from .sharing_policy_document import SharingPolicyDocument
+from .sharing_policy_repository import AccessPointService
+
+
+logger = logging.getLogger(__name__)
+
+
+async def _get_policies(
+    ap_service: AccessPointService,
+    handles: t.List[str],
+    force_refresh: bool,
+    workers: int,
+) -> t.Dict[str, t.Optional[dict]]:
+    async_service = AsyncAccessPointService(ap_service, workers)
+    try:
+        return {
+            handle: policy
+            async for handle, policy in async_service.get_policies(handles, force_refresh=force_refresh)
+        }
+    finally:
+        async_service.close()
+
+
+async def _get_short_names(
+    get_org_short_name: ShortOrganizationNameStrategy,
+    org_titles: t.Iterable[str],
+    workers: int,
+) -> t.Dict[str, str]:
+    async_strategy = AsyncShortOrganizationNameStrategy(get_org_short_name, workers)
+    try:
+        titles = list(org_titles)
+        return dict(zip(titles, await asyncio.gather(*(async_strategy(title) for title in titles))))
+    finally:
+        async_strategy.close()
+
+
+def _package_prefix(package_id: str) -> str:
+    package = toolkit.get_action('package_show')({'ignore_auth': True}, {'id': package_id})
+    return toolkit.h['get_package_cloud_storage_key'](package)
+
+
+def plan_sharing_state(
+    ap_service: AccessPointService,
+    get_org_short_name: ShortOrganizationNameStrategy,
+    resources_prefix: str,
+    batch_size: int = 500,
+    live: bool = False,
+    workers: int = 8,
+) -> t.Iterator[PolicyDiff]:
+    """Diff the documents of all the access points as computed from the database
+    against their live documents.
+
+    The target handle of every package is computed from `resources_prefix`, so
+    that the effect of changing it can be planned. Access points that are no
+    longer the target of any package are planned to share nothing. Cached
+    policies are used unless `live` is set. Short names and policies are
+    fetched concurrently by `workers` threads.
+
+    Packages are planned to be shared on the prefix stored with their sharing
+    policy, the packages shared before prefixes were stored are looked up.
+    Packages without an organization cannot be shared and are skipped.
+    """
+    org_prefixes: t.Dict[str, t.Set[str]] = {}
+    current_handles = set()
+
+    query = (
+        model.Session.query(PackageSharingPolicy, model.Package.state, model.Group.title)
+        .join(model.Package, model.Package.id == PackageSharingPolicy.package_id)
+        .outerjoin(model.Group, model.Group.id == model.Package.owner_org)
+        .order_by(PackageSharingPolicy.package_id)
+        .yield_per(batch_size)
+    )
+    for policy, state, org_title in query:
+        if policy.handle and ':' not in policy.handle:
+            current_handles.add(policy.handle)
+        if not policy.allowed or state == 'deleted':
+            continue
+        if not org_title:
+            logger.warning("skipping package %s without an organization", policy.package_id)
+            continue
+
+        prefix = policy.prefix or _package_prefix(policy.package_id)
+        org_prefixes.setdefault(org_title, set()).add(prefix)
+
+    short_names = run_bulk(_get_short_names(get_org_short_name, org_prefixes.keys(), workers))
+    target_prefixes: t.Dict[str, t.Set[str]] = {}
+    for org_title, prefixes in org_prefixes.items():
+        target_prefixes.setdefault(f'{resources_prefix}-{short_names[org_title]}', set()).update(prefixes)
+
+    handles = sorted(current_handles | target_prefixes.keys())
+    policies = run_bulk(_get_policies(ap_service, handles, live, workers))
+    for handle in handles:
+        current = policies[handle]
+        before = SharingPolicyDocument(current, handle) if current is not None else None
+        after = SharingPolicyDocument.new(ap_service.bucket_region, ap_service.account_id, handle)
+        for prefix in sorted(target_prefixes.get(handle, ())):
+            update_prefix_unchecked(after, prefix, True)
+        yield diff_documents(handle, before, after)
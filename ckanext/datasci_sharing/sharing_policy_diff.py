@@ -0,0 +1,60 @@
+import typing as t
+
+from .sharing_policy_document import (
+    POLICY_DOCUMENT_SIZE_LIMIT,
+    PolicyDocumentSizeLimitExceeded,
+    SharingPolicyDocument,
+)
+
+
+class PolicyDiff(t.NamedTuple):
+    handle: str
+    added_prefixes: t.List[str]
+    removed_prefixes: t.List[str]
+    size_before: int
+    size_after: int
+
+    @property
+    def headroom(self) -> int:
+        """Characters left under the policy document size limit after the change."""
+        return POLICY_DOCUMENT_SIZE_LIMIT - self.size_after
+
+    @property
+    def has_changes(self) -> bool:
+        return bool(self.added_prefixes or self.removed_prefixes)
+
+    def as_dict(self) -> dict:
+        return dict(self._asdict(), headroom=self.headroom)
+
+    def summary(self) -> str:
+        return (
+            f'{self.handle}: +{len(self.added_prefixes)} -{len(self.removed_prefixes)} '
+            f'size {self.size_before} -> {self.size_after} (headroom {self.headroom})'
+        )
+
+
+def diff_documents(
+    handle: str,
+    before: t.Optional[SharingPolicyDocument],
+    after: t.Optional[SharingPolicyDocument],
+) -> PolicyDiff:
+    """Diff the prefixes shared by two documents, where `None` is a missing document."""
+    before_prefixes = set(before.shared_prefixes()) if before is not None else set()
+    after_prefixes = set(after.shared_prefixes()) if after is not None else set()
+    return PolicyDiff(
+        handle=handle,
+        added_prefixes=sorted(after_prefixes - before_prefixes),
+        removed_prefixes=sorted(before_prefixes - after_prefixes),
+        size_before=before.size() if before is not None else 0,
+        size_after=after.size() if after is not None else 0,
+    )
+
+
+def update_prefix_unchecked(document: SharingPolicyDocument, prefix: str, allow: bool):
+    """Update the prefix of the document, allowing it to exceed the size limit so
+    that the size of oversized documents can be reported.
+    """
+    try:
+        document.update_prefix(prefix, allow)
+    except PolicyDocumentSizeLimitExceeded:
+        pass
@@ -1,4 +1,6 @@
 import typing as t
+import copy
+import hashlib
 import logging
 import json
 
@@ -38,8 +40,11 @@ class _ListExt:
         return value
 
 
+POLICY_DOCUMENT_SIZE_LIMIT = 20 * 1024  # 20 KB
+
+
 class PolicyDocumentSizeLimitExceeded(Exception):
-    _POLICY_DOCUMENT_SIZE_LIMIT = 20 * 1024  # 20 KB
+    _POLICY_DOCUMENT_SIZE_LIMIT = POLICY_DOCUMENT_SIZE_LIMIT
 
     def __init__(self):
         super().__init__(f"policy document size limit exceeded")
@@ -69,6 +74,9 @@ class SharingPolicyDocument:
         document = _new_policy_document(region, account_id, access_point_name)
         return cls(document, access_point_name)
 
+    def copy(self) -> 'SharingPolicyDocument':
+        return SharingPolicyDocument(copy.deepcopy(self._document), self.access_point_name)
+
     def _statements(self):
         return self._document['Statement']
 
@@ -86,6 +94,15 @@ class SharingPolicyDocument:
     def as_json(self):
         return json.dumps(self._document)
 
+    def shared_prefixes(self) -> t.List[str]:
+        """The package prefixes shared by this policy."""
+        objects_arn_prefix = f'{self.access_point_arn()}/object/'
+        return [
+            resource[len(objects_arn_prefix):-len('/*')]
+            for resource in _ListExt.as_list(self._statement(_PACKAGES_ACTIONS_SID)['Resource'])
+            if resource.startswith(objects_arn_prefix) and resource.endswith('/*')
+        ]
+
     def update_prefix(self, prefix: str, allow: bool):
         listing_stmt = self._statement(_PACKAGES_LISTING_SID)
         prefixes_set = set(_ListExt.as_list(listing_stmt['Condition']['StringLike']['s3:prefix']))
@@ -115,7 +132,7 @@ class SharingPolicyDocument:
 
     def _prefix_objects_arn(self, prefix: str) -> str:
         """ARN for all objects within the provided `prefix`"""
-        return f'{self.access_point_arn()}/object/{prefix}/*'
+        return _prefix_objects_arn(self.access_point_arn(), prefix)
 
     def _prefixes_chain_from_prefix(self, prefix: str) -> t.List[str]:
         """
@@ -123,12 +140,58 @@ class SharingPolicyDocument:
 
         For example, the prefix `'/a/b/c'` will be converted into the list `['/a/', '/a/b/', '/a/b/c/*']`.
         """
-        components = prefix.split('/')
-        prefixes = [
-            '/'.join(components[:index+1]) + '/' for index in range(len(components))
-        ]
-        prefixes[-1] = prefixes[-1] + '*'
-        return prefixes
+        return _prefixes_chain_from_prefix(prefix)
+
+
+def _prefix_objects_arn(access_point_arn: str, prefix: str) -> str:
+    return f'{access_point_arn}/object/{prefix}/*'
+
+
+def _prefixes_chain_from_prefix(prefix: str) -> t.List[str]:
+    components = prefix.split('/')
+    prefixes = [
+        '/'.join(components[:index+1]) + '/' for index in range(len(components))
+    ]
+    prefixes[-1] = prefixes[-1] + '*'
+    return prefixes
+
+
+def policy_hash(policy: str) -> str:
+    """sha256 of the JSON of a policy, as written to S3 Control."""
+    return hashlib.sha256(policy.encode()).hexdigest()
+
+
+def format_access_point_arn(region: str, account_id: str, access_point_name: str) -> str:
+    return f'arn:aws:s3:{region}:{account_id}:accesspoint/{access_point_name}'
+
+
+def _list_element_size(value: str) -> int:
+    # the quoted value and the separating comma.
+    return len(json.dumps(value)) + 1
+
+
+def estimate_share_size(access_point_arn: str, prefix: str) -> int:
+    """Upper bound of the characters sharing `prefix` adds to the size of a
+    document, computed without the document. The whole prefixes chain is
+    counted, even though the prefixes of the organization are usually listed,
+    along with the brackets added when the listed prefixes and the resources
+    are single values written back as lists.
+    """
+    return (
+        sum(_list_element_size(chain_prefix) for chain_prefix in _prefixes_chain_from_prefix(prefix))
+        + _list_element_size(_prefix_objects_arn(access_point_arn, prefix))
+        + 2 * len('[]')
+    )
+
+
+def estimate_unshare_size(access_point_arn: str, prefix: str) -> int:
+    """Characters unsharing the shared `prefix` removes from the size of a
+    document, computed without the document.
+    """
+    return (
+        _list_element_size(_prefixes_chain_from_prefix(prefix)[-1])
+        + _list_element_size(_prefix_objects_arn(access_point_arn, prefix))
+    )
 
 
 _ALLOWED_PRINCIPAL_PATTERNS = [
@@ -140,7 +203,7 @@ _ALLOWED_PRINCIPAL_PATTERNS = [
 
 
 def _new_policy_document(region: str, account_id: str, access_point_name: str) -> dict:
-    access_point_arn = f'arn:aws:s3:{region}:{account_id}:accesspoint/{access_point_name}'
+    access_point_arn = format_access_point_arn(region, account_id, access_point_name)
     principal_arns = [
         principal.format(account_id=account_id)
         for principal in _ALLOWED_PRINCIPAL_PATTERNS
@@ -1,3 +1,7 @@
+from typing import Optional, Tuple
+
+import ckan.model as model
+
 from .model import PackageSharingPolicy
 
 
@@ -5,7 +9,12 @@ class SharingPolicyRecord(PackageSharingPolicy):
     def __init__(self, package_prefix: str, package_policy: PackageSharingPolicy):
         self._package_prefix = package_prefix
         self._policy = package_policy
-        self._init_allowed = self._policy.allowed
+        # rows without an applied state were saved only after being applied.
+        self._applied_allowed = (
+            self._policy.allowed
+            if self._policy.applied_allowed is None
+            else self._policy.applied_allowed
+        )
 
     def __getattr__(self, name):
         return getattr(self._policy, name)
@@ -26,5 +35,46 @@ class SharingPolicyRecord(PackageSharingPolicy):
     def allowed(self, value):
         self._policy.allowed = value
 
-    def has_changes(self) -> bool:
-        return self._init_allowed != self.allowed
+    @property
+    def applied_allowed(self) -> bool:
+        return self._applied_allowed
+
+    @property
+    def sync_failed(self):
+        return self._policy.sync_failed
+
+    @property
+    def package_prefix(self) -> str:
+        return self._package_prefix
+
+    def missing_prefix(self) -> bool:
+        """Whether the package was shared before prefixes were stored, and is
+        assumed to be shared on its current prefix until the rows are backfilled.
+        """
+        return bool(self._applied_allowed and self.handle and ":" not in self.handle and not self._policy.prefix)
+
+    def applied_share(self) -> Optional[Tuple[str, str]]:
+        """The access point and prefix the package is shared on, if any, the
+        current prefix of the package for records missing their prefix.
+        """
+        if not self._applied_allowed or not self.handle or ":" in self.handle:
+            return None
+        return self.handle, self._policy.prefix or self._package_prefix
+
+    def has_changes(self, handle: Optional[str]) -> bool:
+        """Whether the desired state differs from the state last applied, the
+        package being shared on the access point `handle` when allowed.
+        """
+        if self._applied_allowed != self.allowed:
+            return True
+        return bool(self.allowed) and self.applied_share() != (handle, self._package_prefix)
+
+    def discard_changes(self):
+        """Discard the unsaved changes to the desired state."""
+        if self._policy in model.Session:
+            model.Session.expire(self._policy)
+
+    def save_intent(self):
+        """Save the desired state, committing the transaction."""
+        self._policy.applied_allowed = self._applied_allowed
+        self._policy.save()
@@ -1,24 +1,44 @@
-from contextlib import contextmanager
+from contextlib import ExitStack, contextmanager
 import logging
 import json
-from typing import Optional, Iterator
+from typing import Dict, List, Optional, Iterator, Tuple
 
 import boto3
 import boto3.session
+from botocore.config import Config as BotoConfig
 from botocore.exceptions import ClientError as BotoClientError
+import ckan.model as model
 
+from .access_point_cache import cache_namespace, get_known_access_points, get_policy_document_cache
 from .config import BucketConfig, config
-from .model import PackageSharingPolicy
+from .model import AccessPointUsage, PackageSharingEvent, PackageSharingPolicy
+from .organization_short_name import (
+    CachedShortOrganizationNameStrategy,
+    ShortNameUnavailable,
+    ShortOrganizationNameStrategy,
+    create_short_name_strategy,
+)
 from .distributed_lock import distributed_lock
-from .sharing_policy_document import SharingPolicyDocument
+from .profiling import profiled, record_event, stage
+from .rate_limiter import RateLimitedClient, RateLimitTimeout, get_rate_limiter
+from .sharing_policy_document import (
+    POLICY_DOCUMENT_SIZE_LIMIT,
+    PolicyDocumentSizeLimitExceeded,
+    SharingPolicyDocument,
+    estimate_share_size,
+    estimate_unshare_size,
+    format_access_point_arn,
+    policy_hash,
+)
+from .sharing_policy_diff import PolicyDiff, diff_documents, update_prefix_unchecked
 from .sharing_policy_record import SharingPolicyRecord
-from .utils import retry
+from .utils import LRUCache, process_cached, retry, retry_duration
 
 
 logger = logging.getLogger(__name__)
 
 
-def _create_boto3_session():
+def create_boto3_session():
     return boto3.Session(
         aws_access_key_id=config.aws_access_key_id,
         aws_secret_access_key=config.aws_secret_access_key,
@@ -33,71 +53,145 @@ class SharingNotAvailable(Exception):
     pass
 
 
-class ShortOrganizationNameStrategy:
-    def __init__(self, session: boto3.Session):
-        self._lambda = session.client('lambda', region_name='eu-west-1')
+class SharingChangePending(SharingNotAvailable):
+    """Exception raised when the change to the sharing policy was saved but
+    could not be applied yet, the package staying pending until synced again.
+    """
+    pass
 
-    def __call__(self, title: str) -> str:
-        response = self._lambda.invoke(
-            FunctionName='arn:aws:lambda:eu-west-1:450869586150:function:GetShortGroup',
-            Payload=json.dumps({"group": title}).encode(),
-        )
-        error = response.get('FunctionError')
-        payload = json.loads(response['Payload'].read().decode())
-
-        if error or payload['statusCode'] != 200:
-            logger.error(
-                'error invoking GetShortName lambda function: %s: %s',
-                error or 'client error',
-                payload,
-            )
-            raise Exception('unable to get group short name')
-        else:
-            return payload['body']
+
+class SharingCapacityExceeded(Exception):
+    """Exception raised when the policy of the access point has no room left
+    to share another package.
+    """
+    def __init__(self, handle: str, headroom: int):
+        super().__init__(f"policy of access point {handle} has {headroom} characters left")
+        self.handle = handle
+        self.headroom = headroom
+
+
+# S3 Control calls are bounded in time, so that the access point locks held
+# during the calls can be given a timeout that covers them.
+_S3_CONTROL_CONNECT_TIMEOUT = 2
+_S3_CONTROL_READ_TIMEOUT = 5
+_S3_CONTROL_ATTEMPTS = 2
+_S3_CONTROL_CLIENT_CONFIG = BotoConfig(
+    connect_timeout=_S3_CONTROL_CONNECT_TIMEOUT,
+    read_timeout=_S3_CONTROL_READ_TIMEOUT,
+    retries={'max_attempts': _S3_CONTROL_ATTEMPTS},
+)
+
+_UPDATE_RETRIES = 2
+_UPDATE_BACKOFF = 2
 
 
 class AccessPointService:
     def __init__(self, session: boto3.Session, account_id: str, bucket_name: str, bucket_region: str):
-        self._s3_control = session.client('s3control', region_name=bucket_region)
+        self._s3_control = RateLimitedClient(
+            session.client('s3control', region_name=bucket_region, config=_S3_CONTROL_CLIENT_CONFIG),
+            get_rate_limiter('s3control'),
+        )
+        namespace = cache_namespace(account_id, bucket_region, bucket_name)
+        self._known_access_points = get_known_access_points(namespace)
+        self._policy_cache = get_policy_document_cache(namespace)
         self.account_id = account_id
         self.bucket_name = bucket_name
         self.bucket_region = bucket_region
 
-    def get_policy(self, name: str) -> Optional[dict]:
+    def get_policy(self, name: str, force_refresh: bool = False) -> Optional[dict]:
+        """Returns the policy of the access point, or `None` if either the access
+        point or its policy does not exist. Use `exists` to tell both cases apart.
+
+        The policy is read from the policy cache unless `force_refresh` is set.
+        """
+        if not force_refresh:
+            cached = self._policy_cache.get(name)
+            if cached is not None:
+                record_event('policy_cache_hit')
+                return json.loads(cached)
+
         try:
-            response = self._s3_control.get_access_point_policy(AccountId=self.account_id, Name=name)
-            policy = response['Policy']
-            return json.loads(policy) if policy != '' else None
+            with stage('get_policy'):
+                response = self._s3_control.get_access_point_policy(AccountId=self.account_id, Name=name)
         except BotoClientError as e:
-            if e.response['Error']['Code'] not in ['NoSuchAccessPoint', 'NoSuchAccessPointPolicy']:
+            code = e.response['Error']['Code']
+            if code == 'NoSuchAccessPointPolicy':
+                self._known_access_points.add(name)
+            elif code == 'NoSuchAccessPoint':
+                self._known_access_points.discard(name)
+                self._policy_cache.invalidate(name)
+            else:
                 raise
             return None
 
+        self._known_access_points.add(name)
+        policy = response['Policy']
+        if policy == '':
+            return None
+        self._policy_cache.set(name, policy)
+        return json.loads(policy)
+
+    def cached_policy(self, name: str) -> Optional[str]:
+        """The JSON of the cached policy of the access point, without calling S3 Control."""
+        return self._policy_cache.get(name)
+
+    def probe(self):
+        """Check that S3 Control is reachable, raising an exception otherwise."""
+        self._s3_control.list_access_points(
+            AccountId=self.account_id,
+            Bucket=self.bucket_name,
+            MaxResults=1,
+        )
+
+    def exists(self, name: str) -> bool:
+        """Whether the access point is known to exist, without calling S3 Control."""
+        return name in self._known_access_points
+
     def create(self, name: str):
         try:
-            self._s3_control.create_access_point(
-                AccountId=self.account_id,
-                Bucket=self.bucket_name,
-                Name=name,
-            )
+            with stage('create_access_point'):
+                self._s3_control.create_access_point(
+                    AccountId=self.account_id,
+                    Bucket=self.bucket_name,
+                    Name=name,
+                )
         except BotoClientError as e:
             if e.response['Error']['Code'] != 'AccessPointAlreadyOwnedByYou':
                 raise
+        self._known_access_points.add(name)
 
-    def update(self, name: str, policy: dict):
+    def ensure_exists(self, name: str):
+        """Create the access point unless it is known to exist."""
+        if not self.exists(name):
+            self.create(name)
+
+    def update(self, name: str, policy: str):
+        """Replace the policy of the access point. Must be called while holding
+        the access point lock, as the cached policy is replaced on success.
+        """
         try:
-            self._update_with_retry(name, policy)
+            with stage('put_policy'):
+                self._update_with_retry(name, policy)
+            self._known_access_points.add(name)
+            self._policy_cache.set(name, policy)
             return True
         except BotoClientError as e:
+            self._policy_cache.invalidate(name)
             if e.response['Error']['Code'] == 'NoSuchAccessPoint':
+                self._known_access_points.discard(name)
                 # TODO verify that this is the case
                 # can happen even if the access point was created previously,
                 # due to AWS eventually consistent API behavior.
                 return False
             raise
+        except Exception:
+            # the policy may have been replaced even if the call failed.
+            self._policy_cache.invalidate(name)
+            raise
 
-    @retry(2, backoff=2)
-    def _update_with_retry(self, name: str, policy: dict):
+    # waiting again for the rate limit would only hold the access point lock longer.
+    @retry(_UPDATE_RETRIES, backoff=_UPDATE_BACKOFF, exclude=(RateLimitTimeout,))
+    def _update_with_retry(self, name: str, policy: str):
         self._s3_control.put_access_point_policy(
             AccountId=self.account_id,
             Name=name,
@@ -105,28 +199,93 @@ class AccessPointService:
         )
 
 
+def create_access_point_service(bucket_config: BucketConfig, session: Optional[boto3.Session] = None) -> AccessPointService:
+    return AccessPointService(
+        session or create_boto3_session(),
+        bucket_config.account_id,
+        bucket_config.bucket_name,
+        bucket_config.bucket_region,
+    )
+
+
+def get_boto3_session() -> boto3.Session:
+    """The boto3 session of this process."""
+    return process_cached('boto3_session', create_boto3_session)
+
+
+def get_access_point_service(bucket_config: BucketConfig) -> AccessPointService:
+    """The access point service of this process for the bucket, reusing its client."""
+    return process_cached(
+        ('access_point_service', bucket_config),
+        lambda: create_access_point_service(bucket_config, get_boto3_session()),
+    )
+
+
+# kept in forked processes, unlike the strategy and its client.
+_short_names: Optional[LRUCache] = None
+
+
+def _get_short_names() -> LRUCache:
+    global _short_names
+    if _short_names is None:
+        _short_names = LRUCache(config.short_name_cache_size)
+    return _short_names
+
+
+def get_short_name_strategy() -> ShortOrganizationNameStrategy:
+    """The short name strategy of this process, caching the resolved short names."""
+    return process_cached(
+        'short_name_strategy',
+        lambda: CachedShortOrganizationNameStrategy(create_short_name_strategy(get_boto3_session()), _get_short_names()),
+    )
+
+
+# S3 Control calls made while holding the locks of a sync: reading the policy,
+# creating the access point and updating the policy, with retries, of up to
+# two access points.
+_CALLS_UNDER_LOCK = 2 * (2 + _UPDATE_RETRIES + 1)
+
+
+def access_point_lock_timeout(calls: int = _CALLS_UNDER_LOCK) -> float:
+    """Seconds an access point lock may be held while making `calls` calls to
+    S3 Control, each waiting for the rate limit of the current priority and for
+    its attempts to time out, and waiting between the retries of the updates.
+    """
+    call_timeout = _S3_CONTROL_ATTEMPTS * (_S3_CONTROL_CONNECT_TIMEOUT + _S3_CONTROL_READ_TIMEOUT)
+    max_wait = get_rate_limiter('s3control').max_wait
+    return calls * (max_wait + call_timeout) + 2 * retry_duration(_UPDATE_RETRIES, _UPDATE_BACKOFF)
+
+
+def access_point_lock(name: str, blocking_timeout=1, timeout: Optional[float] = None):
+    """Distributed lock held while reading and updating the policy of an access
+    point. The lock expires after `timeout` seconds, by default the time the
+    calls of a sync may take, so that it is not released while still in use.
+    """
+    if timeout is None:
+        timeout = access_point_lock_timeout()
+    return distributed_lock(
+        f'sharing_policy_repository.access_points.{name}',
+        blocking_timeout=blocking_timeout,
+        timeout=timeout,
+    )
+
+
 class SharingPolicyRepository:
     def __init__(
             self,
             resources_prefix: str,
             bucket_config: BucketConfig,
         ):
-        session = _create_boto3_session()
-        self._ap_service = AccessPointService(
-            session,
-            bucket_config.account_id,
-            bucket_config.bucket_name,
-            bucket_config.bucket_region,
-        )
-        self._get_org_short_name = ShortOrganizationNameStrategy(session)
+        self._ap_service = get_access_point_service(bucket_config)
+        self._get_org_short_name = get_short_name_strategy()
         self._access_point_prefix = resources_prefix
 
-    def _get_or_create_document(self, name: str) -> SharingPolicyDocument:
-        doc = self._ap_service.get_policy(name)
+    def _get_or_create_document(self, name: str, force_refresh: bool = False) -> SharingPolicyDocument:
+        doc = self._ap_service.get_policy(name, force_refresh=force_refresh)
         if doc is not None:
             return SharingPolicyDocument(doc, name)
 
-        self._ap_service.create(name)
+        self._ap_service.ensure_exists(name)
         policy = SharingPolicyDocument.new(
             self._ap_service.bucket_region,
             self._ap_service.account_id,
@@ -138,28 +297,300 @@ class SharingPolicyRepository:
         if not self._ap_service.update(policy.access_point_name, policy.as_json()):
             raise SharingNotAvailable()
 
-    def _get_policy_record(self, package_id, package_prefix) -> SharingPolicyRecord:
-        policy_entity = PackageSharingPolicy.get_or_default(package_id, for_update=True)
+    def _get_policy_record(self, package_id, package_prefix, detached=False) -> SharingPolicyRecord:
+        policy_entity = PackageSharingPolicy.get_or_default(package_id)
+        if detached:
+            # a copy outside of the session, so that changes to the record are
+            # not saved.
+            policy_entity = PackageSharingPolicy(
+                package_id,
+                allowed=policy_entity.allowed,
+                handle=policy_entity.handle,
+                prefix=policy_entity.prefix,
+                applied_allowed=policy_entity.applied_allowed,
+            )
         record = SharingPolicyRecord(package_prefix, policy_entity)
         if record.handle and ":" in record.handle:
             record.handle = None
             record.allowed = False
         return record
 
+    @staticmethod
+    def _warn_missing_prefix(record: SharingPolicyRecord):
+        # assumed to be shared on its current prefix, the prefix the package was
+        # shared on cannot be told once it was renamed or moved, so its old
+        # prefix would stay shared.
+        if record.missing_prefix():
+            logger.warning(
+                "package %s was shared before prefixes were stored and is assumed to be "
+                "shared on its current prefix, run `datasci-sharing backfill prefix`",
+                record.package_id,
+            )
+
+    def _handle_of_share(self, org_title: str, record: SharingPolicyRecord) -> str:
+        # packages are stored under their organization, so a package that kept
+        # its prefix is still in the organization of the access point it is
+        # shared on, and its short name is not resolved again.
+        applied = record.applied_share()
+        if applied is not None and applied[1] == record.package_prefix:
+            return applied[0]
+        return self.handle_for(org_title)
+
+    def handle_for(self, org_title: str) -> str:
+        """The name of the access point of the organization."""
+        try:
+            with stage('short_name'):
+                org_short_name = self._get_org_short_name(org_title)
+        except (ShortNameUnavailable, RateLimitTimeout) as e:
+            raise SharingNotAvailable() from e
+        return f'{self._access_point_prefix}-{org_short_name}'
+
+    def plan(
+            self,
+            org_title: str,
+            package_id: str,
+            package_prefix: str,
+            allowed: bool,
+            live: bool = False,
+        ) -> List[PolicyDiff]:
+        """Compute the changes `sharing_policy` would make to the access point
+        policies when setting `allowed`, without taking locks or writing anything.
+        The cached policies are used unless `live` is set.
+        """
+        policy = self._get_policy_record(package_id, package_prefix, detached=True)
+        handle = self._handle_of_share(org_title, policy) if allowed else None
+        applied = policy.applied_share()
+        target = (handle, package_prefix) if allowed else None
+        if applied == target:
+            return []
+
+        changes = []
+        if applied is not None:
+            changes.append((applied[0], applied[1], False))
+        if target is not None:
+            changes.append((handle, package_prefix, True))
+
+        try:
+            before: Dict[str, Optional[SharingPolicyDocument]] = {}
+            after: Dict[str, SharingPolicyDocument] = {}
+            for name, prefix, allow in changes:
+                if name not in after:
+                    current = self._ap_service.get_policy(name, force_refresh=live)
+                    before[name] = SharingPolicyDocument(current, name) if current is not None else None
+                    after[name] = before[name].copy() if before[name] is not None else SharingPolicyDocument.new(
+                        self._ap_service.bucket_region,
+                        self._ap_service.account_id,
+                        name,
+                    )
+                update_prefix_unchecked(after[name], prefix, allow)
+        except RateLimitTimeout as e:
+            raise SharingNotAvailable() from e
+        return [diff_documents(name, before[name], document) for name, document in after.items()]
+
+    def _check_capacity(self, handle: str, package_prefix: str, applied: Optional[Tuple[str, str]]):
+        """Reject sharing the prefix on the access point `handle` if its recorded
+        usage leaves no room for it, without taking locks or calling AWS.
+        """
+        usage = AccessPointUsage.get(handle)
+        if usage is None:
+            return
+        arn = format_access_point_arn(self._ap_service.bucket_region, self._ap_service.account_id, handle)
+        growth = estimate_share_size(arn, package_prefix)
+        if applied is not None and applied[0] == handle:
+            growth -= estimate_unshare_size(arn, applied[1])
+        if usage.size + growth > POLICY_DOCUMENT_SIZE_LIMIT:
+            raise SharingCapacityExceeded(handle, usage.headroom)
+
+    def check_capacity(self, org_title: str, package_id: str, package_prefix: str):
+        """Raise `SharingCapacityExceeded` if sharing the package would not fit
+        in the policy of its access point, as estimated from its recorded
+        usage, without taking locks, calling S3 Control or saving anything.
+        """
+        policy = self._get_policy_record(package_id, package_prefix, detached=True)
+        handle = self._handle_of_share(org_title, policy)
+        applied = policy.applied_share()
+        if applied != (handle, package_prefix):
+            self._check_capacity(handle, package_prefix, applied)
+
+    def _read_state(self, package_id: str, package_prefix: str) -> Tuple[bool, Optional[Tuple[str, str]]]:
+        """Read the latest desired state, and the access point and prefix the
+        package is shared on, in a short transaction.
+        """
+        record = SharingPolicyRecord(package_prefix, PackageSharingPolicy.get_or_default(package_id))
+        state = (bool(record.allowed), record.applied_share())
+        # end the transaction so that it is not held open during remote calls.
+        model.repo.commit()
+        return state
+
+    def _get_document(self, name: str, create: bool) -> Optional[SharingPolicyDocument]:
+        # the policy is replaced by the update, and a stale cached policy would
+        # drop the changes made to it since it was cached: the cached policy is
+        # only used if it is the one last written to the access point, as
+        # recorded with its usage, and read live otherwise.
+        cached = self._ap_service.cached_policy(name)
+        if cached is not None and policy_hash(cached) == AccessPointUsage.recorded_policy_hash(name):
+            record_event('policy_cache_hit')
+            return SharingPolicyDocument(json.loads(cached), name)
+        if create:
+            return self._get_or_create_document(name, force_refresh=True)
+        doc = self._ap_service.get_policy(name, force_refresh=True)
+        return SharingPolicyDocument(doc, name) if doc is not None else None
+
+    def _apply(
+            self,
+            package_id: str,
+            handle: Optional[str],
+            package_prefix: str,
+            applied_handle: Optional[str],
+            actor: Optional[str] = None,
+        ):
+        """Share the package prefix on the access point `handle` if allowed, and
+        stop sharing the prefix it was previously shared on if it changed, for
+        example after the package was renamed or moved to another organization.
+
+        The changes to an access point are applied in a single update, first on
+        the access point previously shared on when moving across access points.
+        The change is recorded as an event of `actor` along with the applied state.
+        """
+        handles = sorted({name for name in (handle, applied_handle) if name})
+        try:
+            with ExitStack() as locks:
+                for name in handles:
+                    locks.enter_context(access_point_lock(name))
+
+                # the states are read again while holding the locks so that
+                # concurrent changes are applied in the order they acquire them.
+                allowed, applied = self._read_state(package_id, package_prefix)
+                if (applied is not None and applied[0] not in handles) or (allowed and not handle):
+                    # changed concurrently, the sync of the change applies it.
+                    logger.debug("sharing policy of package %s changed while being applied", package_id)
+                    return
+                target = (handle, package_prefix) if allowed else None
+
+                documents: Dict[str, Optional[SharingPolicyDocument]] = {}
+                if applied is not None and applied != target:
+                    documents[applied[0]] = self._get_document(applied[0], create=False)
+                    if documents[applied[0]] is not None:
+                        documents[applied[0]].update_prefix(applied[1], False)
+                if target is not None:
+                    if handle not in documents or documents[handle] is None:
+                        documents[handle] = self._get_document(handle, create=True)
+                    try:
+                        documents[handle].update_prefix(package_prefix, True)
+                    except PolicyDocumentSizeLimitExceeded:
+                        raise self._reject_share(package_id, handle)
+                for document in documents.values():
+                    if document is not None:
+                        self._save_document(document)
+
+                event = None
+                if documents:
+                    event_handle, event_prefix = target or applied
+                    event = PackageSharingEvent(package_id, target is not None, event_handle, event_prefix, actor)
+                    if documents.get(event_handle) is not None:
+                        event.policy_hash = policy_hash(documents[event_handle].as_json())
+
+                with stage('mark_applied'):
+                    # recorded in the same transaction once all the documents are saved.
+                    for document in documents.values():
+                        if document is not None:
+                            AccessPointUsage.record(
+                                document.access_point_name,
+                                document.size(),
+                                len(document.shared_prefixes()),
+                                policy_hash(document.as_json()),
+                            )
+                    if target is not None:
+                        PackageSharingPolicy.mark_applied(package_id, True, handle, package_prefix, event)
+                    else:
+                        PackageSharingPolicy.mark_applied(package_id, False, event=event)
+        except RateLimitTimeout as e:
+            raise SharingNotAvailable() from e
+
+    @staticmethod
+    def _mark_pending(package_id: str):
+        # the saved intent is applied by the next sync or the `reconcile`
+        # command, including changes of prefix that keep the same state.
+        model.Session.rollback()
+        try:
+            PackageSharingPolicy.mark_sync_failed(package_id)
+        except Exception:
+            model.Session.rollback()
+            logger.exception("unable to record the failed sync of package %s", package_id)
+
+    def _reject_share(self, package_id: str, handle: str) -> SharingCapacityExceeded:
+        """Discard the saved intent to share the package on the access point
+        `handle`, whose policy has no room left for it, and record the usage of
+        its live policy so that the next shares are rejected before saving.
+        Must be called while holding the access point lock.
+        """
+        # the live policy was cached when read under the lock.
+        live = self._ap_service.get_policy(handle)
+        document = SharingPolicyDocument(live, handle) if live is not None else SharingPolicyDocument.new(
+            self._ap_service.bucket_region,
+            self._ap_service.account_id,
+            handle,
+        )
+        usage = AccessPointUsage(handle, document.size(), len(document.shared_prefixes()))
+        AccessPointUsage.record(usage.handle, usage.size, usage.prefixes)
+        PackageSharingPolicy.discard_intent(package_id)
+        logger.warning("rejected sharing package %s, the policy of access point %s is full", package_id, handle)
+        return SharingCapacityExceeded(handle, usage.headroom)
+
     @contextmanager
-    def sharing_policy(self, org_title: str, package_id: str, package_prefix: str) -> Iterator[PackageSharingPolicy]:
-        policy = self._get_policy_record(package_id, package_prefix)
+    def sharing_policy(
+            self,
+            org_title: str,
+            package_id: str,
+            package_prefix: str,
+            actor: Optional[str] = None,
+        ) -> Iterator[PackageSharingPolicy]:
+        """Yields the sharing policy of the package to be updated, and applies the
+        changes to the access point policies.
 
-        yield policy
+        The access point and prefix a package was last shared on are stored, so
+        that the share follows the package when it is renamed or moved to
+        another organization. The access point is only computed again when the
+        prefix of the package changed. Packages shared before prefixes were
+        stored are assumed to be shared on their current prefix.
 
-        if policy.has_changes():
-            org_short_name = self._get_org_short_name(org_title)
-            if not policy.handle:
-                policy.handle = f'{self._access_point_prefix}-{org_short_name}'
+        No database lock or transaction is held while calling AWS. The desired
+        state is committed first, then applied to the access points and
+        recorded as applied, along with an event of `actor`, while holding
+        their locks. Changes that fail to apply stay pending until the
+        package is synced again, raising `SharingChangePending`. Shares that would not fit in the policy of the
+        access point, as estimated from its recorded usage, are rejected before
+        saving anything. Shares that turn out not to fit when applied are
+        rejected, their saved intent being discarded.
+        """
+        with profiled('sharing_policy', package_id=package_id):
+            with stage('read_policy_record'):
+                policy = self._get_policy_record(package_id, package_prefix)
+            self._warn_missing_prefix(policy)
 
-            with distributed_lock(f'sharing_policy_repository.access_points.{policy.handle}'):
-                document = self._get_or_create_document(policy.handle)
-                document.update_prefix(package_prefix, policy.allowed)
-                self._save_document(document)
+            yield policy
 
-            policy.save()
+            handle = self._handle_of_share(org_title, policy) if policy.allowed else None
+            if not policy.has_changes(handle):
+                if policy.sync_failed is not None:
+                    PackageSharingPolicy.clear_sync_failed(package_id)
+            else:
+                applied = policy.applied_share()
+                if handle is not None and applied != (handle, package_prefix):
+                    try:
+                        # not flushed, so that the rejected change is not saved.
+                        with stage('check_capacity'), model.Session.no_autoflush:
+                            self._check_capacity(handle, package_prefix, applied)
+                    except SharingCapacityExceeded:
+                        policy.discard_changes()
+                        raise
+                with stage('save_intent'):
+                    policy.save_intent()
+                try:
+                    self._apply(package_id, handle, package_prefix, applied[0] if applied else None, actor)
+                except SharingCapacityExceeded:
+                    raise
+                except Exception as e:
+                    logger.warning("unable to apply the sharing policy of package %s", package_id, exc_info=True)
+                    self._mark_pending(package_id)
+                    raise SharingChangePending() from e
@@ -0,0 +1,110 @@
+"""Benchmarks of `SharingPolicyDocument` for documents with 10 to 10,000 prefixes.
+
+Run with:
+
+    python -m ckanext.datasci_sharing.tests.benchmark_sharing_policy_document
+
+For every document size, reports the time per `update_prefix` call when
+sharing a new prefix, when unsharing a prefix, and for a mixed sequence of
+share and unshare calls, the time per `size()` call, and the memory allocated
+by the document. Documents are allowed to exceed the policy document size
+limit, so that the cost of the operations can be compared at any size.
+"""
+import argparse
+import itertools
+import random
+import timeit
+import tracemalloc
+
+from ckanext.datasci_sharing.sharing_policy_diff import update_prefix_unchecked
+from ckanext.datasci_sharing.sharing_policy_document import SharingPolicyDocument
+
+
+SIZES = (10, 100, 1000, 10000)
+
+
+def _prefix(index: int) -> str:
+    return f'organization-{index % 50}/package-{index}'
+
+
+def _document(prefixes: int) -> SharingPolicyDocument:
+    """A document sharing `prefixes` prefixes, built without `update_prefix`
+    which checks the size of the document on every call.
+    """
+    document = SharingPolicyDocument.new('eu-west-2', '123456789012', 'benchmark')
+    listing = {''}
+    resources = set()
+    for index in range(prefixes):
+        listing.update(document._prefixes_chain_from_prefix(_prefix(index)))
+        resources.add(document._prefix_objects_arn(_prefix(index)))
+    if resources:
+        document._statement('A')['Condition']['StringLike']['s3:prefix'] = list(listing)
+        document._statement('B')['Resource'] = list(resources)
+    return document
+
+
+def _time_per_call(func, number: int) -> float:
+    return min(timeit.repeat(func, number=number, repeat=3)) / number
+
+
+def _benchmark(prefixes: int, number: int) -> dict:
+    document = _document(prefixes)
+    new_prefixes = itertools.count(prefixes)
+    share = _time_per_call(lambda: update_prefix_unchecked(document, _prefix(next(new_prefixes)), True), number)
+
+    document = _document(prefixes)
+    # unsharing more prefixes than the document has unshares missing prefixes.
+    existing_prefixes = itertools.count()
+    unshare = _time_per_call(
+        lambda: update_prefix_unchecked(document, _prefix(next(existing_prefixes) % prefixes), False),
+        number,
+    )
+
+    document = _document(prefixes)
+    rng = random.Random(prefixes)
+    mixed = _time_per_call(
+        lambda: update_prefix_unchecked(document, _prefix(rng.randrange(2 * prefixes)), rng.random() < 0.5),
+        number,
+    )
+
+    document = _document(prefixes)
+    size = _time_per_call(document.size, number)
+
+    tracemalloc.start()
+    document = _document(prefixes)
+    memory, _ = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+
+    return {
+        'prefixes': prefixes,
+        'share': share,
+        'unshare': unshare,
+        'mixed': mixed,
+        'size': size,
+        'memory': memory,
+        'document_size': document.size(),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--number', type=int, default=20, help='calls timed per repetition')
+    parser.add_argument('--sizes', type=int, nargs='+', default=SIZES, help='prefixes per document')
+    args = parser.parse_args()
+
+    print(f"{'prefixes':>8} {'share':>10} {'unshare':>10} {'mixed':>10} {'size()':>10} {'memory':>10} {'document':>10}")
+    for prefixes in args.sizes:
+        result = _benchmark(prefixes, args.number)
+        print(
+            f"{result['prefixes']:>8} "
+            f"{result['share'] * 1e6:>8.1f}us "
+            f"{result['unshare'] * 1e6:>8.1f}us "
+            f"{result['mixed'] * 1e6:>8.1f}us "
+            f"{result['size'] * 1e6:>8.1f}us "
+            f"{result['memory'] / 1024:>8.1f}KB "
+            f"{result['document_size'] / 1024:>8.1f}KB"
+        )
+
+
+if __name__ == '__main__':
+    main()
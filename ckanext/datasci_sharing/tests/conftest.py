@@ -0,0 +1,157 @@
+import json
+
+import pytest
+
+
+ACCOUNT_ID = '123456789012'
+BUCKET_REGION = 'eu-west-2'
+BUCKET_NAME = 'test-bucket'
+
+
+class FakeRedis:
+    """In-memory stand-in for the redis commands used by the caches."""
+    def __init__(self):
+        self.values = {}
+
+    def get(self, key):
+        return self.values.get(key)
+
+    def setex(self, key, ttl, value):
+        self.values[key] = value if isinstance(value, bytes) else str(value).encode()
+
+    def exists(self, key):
+        return int(key in self.values)
+
+    def delete(self, key):
+        self.values.pop(key, None)
+
+
+@pytest.fixture
+def fake_redis(monkeypatch):
+    from ckanext.datasci_sharing import access_point_cache
+
+    redis = FakeRedis()
+    monkeypatch.setattr(access_point_cache, 'is_redis_available', lambda: True)
+    monkeypatch.setattr(access_point_cache, 'connect_to_redis', lambda: redis)
+    return redis
+
+
+def _client_error(code: str, operation: str):
+    from botocore.exceptions import ClientError
+
+    return ClientError({'Error': {'Code': code, 'Message': code}}, operation)
+
+
+class FakeS3Control:
+    """In-memory stand-in for the S3 Control API of a single account, where
+    `policies` maps the names of the access points to their policy, `None`
+    for access points without a policy.
+    """
+    def __init__(self):
+        self.policies = {}
+        self.calls = []
+        self.put_errors = []
+
+    def get_access_point_policy(self, AccountId, Name):
+        self.calls.append(('get_access_point_policy', Name))
+        if Name not in self.policies:
+            raise _client_error('NoSuchAccessPoint', 'GetAccessPointPolicy')
+        if self.policies[Name] is None:
+            raise _client_error('NoSuchAccessPointPolicy', 'GetAccessPointPolicy')
+        return {'Policy': self.policies[Name]}
+
+    def create_access_point(self, AccountId, Bucket, Name):
+        self.calls.append(('create_access_point', Name))
+        if Name in self.policies:
+            raise _client_error('AccessPointAlreadyOwnedByYou', 'CreateAccessPoint')
+        self.policies[Name] = None
+
+    def put_access_point_policy(self, AccountId, Name, Policy):
+        self.calls.append(('put_access_point_policy', Name))
+        if self.put_errors:
+            raise self.put_errors.pop(0)
+        if Name not in self.policies:
+            raise _client_error('NoSuchAccessPoint', 'PutAccessPointPolicy')
+        self.policies[Name] = Policy
+
+    def list_access_points(self, AccountId, Bucket, MaxResults=None):
+        self.calls.append(('list_access_points', Bucket))
+        return {'AccessPointList': [{'Name': name} for name in self.policies]}
+
+    def shared_prefixes(self, name):
+        from ckanext.datasci_sharing.sharing_policy_document import SharingPolicyDocument
+
+        policy = self.policies.get(name)
+        return set(SharingPolicyDocument(json.loads(policy), name).shared_prefixes()) if policy else set()
+
+
+class FakeSession:
+    def __init__(self, s3control: FakeS3Control):
+        self._s3control = s3control
+
+    def client(self, service, region_name=None, config=None):
+        if service != 's3control':
+            raise ValueError(f'unexpected client {service}')
+        return self._s3control
+
+    def get_credentials(self):
+        return None
+
+
+@pytest.fixture
+def s3control(monkeypatch):
+    """Replace S3 Control with an in-memory fake for the clients created by the
+    test, the cached clients of the process being discarded.
+    """
+    from ckanext.datasci_sharing import sharing_policy_repository, utils
+
+    fake = FakeS3Control()
+    monkeypatch.setattr(sharing_policy_repository, 'create_boto3_session', lambda: FakeSession(fake))
+    monkeypatch.setattr(utils, '_process_cache', {})
+    return fake
+
+
+@pytest.fixture
+def ap_service(s3control, fake_redis):
+    """An access point service of the test bucket backed by the fake S3 Control."""
+    from ckanext.datasci_sharing.sharing_policy_repository import AccessPointService
+
+    return AccessPointService(FakeSession(s3control), ACCOUNT_ID, BUCKET_NAME, BUCKET_REGION)
+
+
+def shared_policy(name: str, *prefixes: str) -> str:
+    """The policy of the access point `name` sharing `prefixes`."""
+    from ckanext.datasci_sharing.sharing_policy_document import SharingPolicyDocument
+
+    document = SharingPolicyDocument.new(BUCKET_REGION, ACCOUNT_ID, name)
+    for prefix in prefixes:
+        document.update_prefix(prefix, True)
+    return document.as_json()
+
+
+@pytest.fixture
+def sharing_config(ckan_config, monkeypatch, s3control, fake_redis):
+    """Share on the test bucket with short names computed locally, packages
+    being stored under `{organization name}/{package name}`.
+    """
+    from ckan.plugins import toolkit
+
+    for key, value in {
+        'ckanext.datasci_sharing.aws_account_id': ACCOUNT_ID,
+        'ckanext.datasci_sharing.bucket_region': BUCKET_REGION,
+        'ckanext.datasci_sharing.bucket_name': BUCKET_NAME,
+        'ckanext.datasci_sharing.short_name_strategy': 'hash',
+    }.items():
+        monkeypatch.setitem(ckan_config, key, value)
+    monkeypatch.setitem(toolkit.h, 'get_package_cloud_storage_key', package_prefix)
+
+
+def package_prefix(package: dict) -> str:
+    return f"{package['organization']['name']}/{package['name']}"
+
+
+def handle_for(org_title: str) -> str:
+    """The access point of the organization on the test bucket."""
+    from ckanext.datasci_sharing.organization_short_name import HashShortOrganizationNameStrategy
+
+    return f'{BUCKET_NAME}-{HashShortOrganizationNameStrategy(20)(org_title)}'
@@ -0,0 +1,55 @@
+from ckanext.datasci_sharing import access_point_cache
+from ckanext.datasci_sharing.access_point_cache import KnownAccessPoints, PolicyDocumentCache, cache_namespace
+
+
+NAMESPACE = cache_namespace('123456789012', 'eu-west-2', 'test-bucket')
+
+
+def test_known_access_points_in_process():
+    known = KnownAccessPoints(ttl=60, namespace=NAMESPACE)
+
+    assert 'ap' not in known
+    known.add('ap')
+    assert 'ap' in known
+    known.discard('ap')
+    assert 'ap' not in known
+    known.add_local(['ap', 'other-ap'])
+    assert 'ap' in known and 'other-ap' in known
+
+
+def test_known_access_points_expire(monkeypatch):
+    now = [1000.0]
+    monkeypatch.setattr(access_point_cache.time, 'monotonic', lambda: now[0])
+    known = KnownAccessPoints(ttl=60, namespace=NAMESPACE)
+
+    known.add('ap')
+    now[0] += 61
+
+    assert 'ap' not in known
+
+
+def test_known_access_points_are_shared_through_redis(fake_redis):
+    KnownAccessPoints(ttl=60, namespace=NAMESPACE).add('ap')
+    other_process = KnownAccessPoints(ttl=60, namespace=NAMESPACE)
+
+    assert 'ap' in other_process
+    other_process.discard('ap')
+    assert 'ap' not in KnownAccessPoints(ttl=60, namespace=NAMESPACE)
+
+
+def test_caches_of_other_buckets_are_not_shared(fake_redis):
+    other_namespace = cache_namespace('123456789012', 'eu-west-2', 'other-bucket')
+
+    KnownAccessPoints(ttl=60, namespace=NAMESPACE).add('ap')
+    PolicyDocumentCache(ttl=60, namespace=NAMESPACE).set('ap', '{}')
+
+    assert 'ap' not in KnownAccessPoints(ttl=60, namespace=other_namespace)
+    assert PolicyDocumentCache(ttl=60, namespace=other_namespace).get('ap') is None
+    assert PolicyDocumentCache(ttl=60, namespace=NAMESPACE).get('ap') == '{}'
+
+
+def test_known_access_points_added_locally_are_not_shared(fake_redis):
+    KnownAccessPoints(ttl=60, namespace=NAMESPACE).add_local(['ap', 'other-ap'])
+
+    assert 'ap' not in KnownAccessPoints(ttl=60, namespace=NAMESPACE)
+    assert fake_redis.values == {}
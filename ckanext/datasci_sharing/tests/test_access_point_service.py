@@ -0,0 +1,57 @@
+import json
+
+import pytest
+
+from ckanext.datasci_sharing.rate_limiter import RateLimitTimeout
+from ckanext.datasci_sharing.tests.conftest import shared_policy
+
+
+def test_get_policy_of_access_point_without_policy_marks_it_known(s3control, ap_service):
+    s3control.policies['ap'] = None
+
+    assert ap_service.get_policy('ap') is None
+    assert ap_service.exists('ap')
+
+
+def test_get_policy_of_missing_access_point_discards_it(s3control, ap_service):
+    s3control.policies['ap'] = None
+    ap_service.ensure_exists('ap')
+    del s3control.policies['ap']
+
+    assert ap_service.get_policy('ap') is None
+    assert not ap_service.exists('ap')
+
+    ap_service.ensure_exists('ap')
+    assert ('create_access_point', 'ap') in s3control.calls
+
+
+def test_update_of_missing_access_point_discards_it(s3control, ap_service):
+    ap_service.create('ap')
+    del s3control.policies['ap']
+
+    assert not ap_service.update('ap', json.dumps({}))
+    assert not ap_service.exists('ap')
+
+
+def test_update_writes_the_policy_through_the_cache(s3control, ap_service):
+    ap_service.create('ap')
+    policy = shared_policy('ap', 'org/package')
+
+    assert ap_service.update('ap', policy)
+    del s3control.calls[:]
+
+    assert ap_service.get_policy('ap') == json.loads(policy)
+    assert s3control.calls == []
+
+
+def test_failed_update_invalidates_the_cached_policy(s3control, ap_service):
+    s3control.policies['ap'] = shared_policy('ap', 'org/package')
+    ap_service.get_policy('ap')
+    s3control.put_errors.append(RateLimitTimeout('s3control', 1))
+
+    with pytest.raises(RateLimitTimeout):
+        ap_service.update('ap', shared_policy('ap', 'org/other'))
+    del s3control.calls[:]
+
+    ap_service.get_policy('ap')
+    assert s3control.calls == [('get_access_point_policy', 'ap')]
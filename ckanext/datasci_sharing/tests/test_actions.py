@@ -0,0 +1,103 @@
+import datetime
+
+import ckan.model as model
+from ckan.plugins import toolkit
+from ckan.tests import factories, helpers
+import pytest
+
+from ckanext.datasci_sharing.actions import _parse_timestamp
+from ckanext.datasci_sharing.model import AccessPointUsage, PackageSharingEvent
+from ckanext.datasci_sharing.tests.conftest import handle_for
+
+
+@pytest.mark.parametrize('value', [
+    '2026-10-18T12:30:00Z',
+    '2026-10-18T12:30:00+00:00',
+    '2026-10-18T13:30:00+01:00',
+    '2026-10-18T12:30:00',
+])
+def test_parse_timestamp_returns_naive_utc(value):
+    assert _parse_timestamp({'since': value}, 'since') == datetime.datetime(2026, 10, 18, 12, 30)
+
+
+def test_parse_timestamp_rejects_invalid_timestamps():
+    with pytest.raises(toolkit.ValidationError):
+        _parse_timestamp({'since': 'yesterday'}, 'since')
+
+
+@pytest.mark.usefixtures('clean_db', 'with_plugins')
+def test_package_sharing_event_list_filters_by_utc_timestamps():
+    dataset = factories.Dataset()
+    for created in (datetime.datetime(2026, 10, 17), datetime.datetime(2026, 10, 19)):
+        event = PackageSharingEvent(dataset['id'], True, 'test-ap', 'org/package')
+        event.created = created
+        model.Session.add(event)
+    model.repo.commit()
+
+    result = helpers.call_action('package_sharing_event_list', package_id=dataset['id'], since='2026-10-18T00:00:00Z')
+
+    assert [event['created'] for event in result['events']] == ['2026-10-19T00:00:00']
+
+
+@pytest.mark.usefixtures('clean_db', 'with_plugins')
+def test_package_sharing_event_list_pages_by_creation_time():
+    dataset = factories.Dataset()
+    # recorded out of order, for example by concurrent syncs.
+    for day in (18, 19, 17):
+        event = PackageSharingEvent(dataset['id'], True, 'test-ap', 'org/package')
+        event.created = datetime.datetime(2026, 10, day)
+        model.Session.add(event)
+        model.repo.commit()
+
+    pages = []
+    before_id = None
+    while True:
+        result = helpers.call_action(
+            'package_sharing_event_list', package_id=dataset['id'], limit=2, before_id=before_id
+        )
+        pages.append([event['created'][:10] for event in result['events']])
+        before_id = result['next_before_id']
+        if before_id is None:
+            break
+
+    assert pages == [['2026-10-19', '2026-10-18'], ['2026-10-17']]
+
+
+@pytest.mark.usefixtures('clean_db', 'with_plugins', 'sharing_config')
+def test_access_point_usage_list_lists_all_access_points_to_sysadmins():
+    sysadmin = factories.Sysadmin()
+    AccessPointUsage.record('small-ap', 1000, 1)
+    AccessPointUsage.record('large-ap', 2000, 2)
+    model.repo.commit()
+
+    usages = helpers.call_action('access_point_usage_list', {'user': sysadmin['name']})
+
+    assert [usage['handle'] for usage in usages] == ['large-ap', 'small-ap']
+
+
+@pytest.mark.usefixtures('clean_db', 'with_plugins', 'sharing_config')
+def test_access_point_usage_list_shows_the_usage_of_an_organization_to_its_admins():
+    user = factories.User()
+    organization = factories.Organization(users=[{'name': user['name'], 'capacity': 'admin'}])
+    AccessPointUsage.record(handle_for(organization['title']), 1000, 1)
+    AccessPointUsage.record('other-ap', 2000, 2)
+    model.repo.commit()
+
+    usages = helpers.call_action(
+        'access_point_usage_list', {'user': user['name']}, organization_id=organization['id']
+    )
+
+    assert [(usage['handle'], usage['organization_id']) for usage in usages] == [
+        (handle_for(organization['title']), organization['id'])
+    ]
+
+
+@pytest.mark.usefixtures('clean_db', 'with_plugins', 'sharing_config')
+def test_access_point_usage_list_is_not_shown_to_other_users():
+    user = factories.User()
+    organization = factories.Organization()
+
+    with pytest.raises(toolkit.NotAuthorized):
+        helpers.call_action('access_point_usage_list', {'user': user['name']}, organization_id=organization['id'])
+    with pytest.raises(toolkit.NotAuthorized):
+        helpers.call_action('access_point_usage_list', {'user': user['name']})
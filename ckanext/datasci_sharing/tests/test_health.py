@@ -0,0 +1,93 @@
+from ckan.tests import factories
+import pytest
+
+from ckanext.datasci_sharing import health
+from ckanext.datasci_sharing.model import PackageSharingPolicy
+from ckanext.datasci_sharing.rate_limiter import RateLimiter
+
+
+class _UnreachableService:
+    def probe(self):
+        raise Exception('arn:aws:s3:eu-west-2:123456789012 is unreachable')
+
+
+class _ThrottledService:
+    """A service whose rate limit tokens are used up for the next minutes."""
+    def __init__(self):
+        self._limiter = RateLimiter('throttled', rate=0.001, burst=1)
+        self._limiter.acquire()
+
+    def probe(self):
+        self._limiter.acquire()
+
+
+class _LocalStrategy:
+    def probe(self):
+        return False
+
+
+@pytest.fixture
+def probes(monkeypatch):
+    """Probe an unreachable S3 Control, caching the probes in-process."""
+    monkeypatch.setattr(health, 'is_redis_available', lambda: False)
+    monkeypatch.setattr(health, '_local_cache', None)
+    monkeypatch.setattr(health, 'get_access_point_service', lambda bucket: _UnreachableService())
+    monkeypatch.setattr(health, 'get_short_name_strategy', lambda: _LocalStrategy())
+
+
+@pytest.mark.usefixtures('clean_db', 'with_plugins', 'probes')
+def test_health_hides_the_details_from_the_public(app):
+    response = app.get('/datasci-sharing/health', status=503)
+
+    assert response.json['ok'] is False
+    assert response.json['checks']['s3control'] == {'ok': False, 'status': 'failed'}
+    assert 'arn:aws' not in response.body
+    assert 'pending_changes' not in response.json
+
+
+@pytest.mark.usefixtures('clean_db', 'with_plugins', 'probes')
+def test_health_reports_the_details_to_sysadmins(app):
+    sysadmin = factories.Sysadmin()
+
+    response = app.get(
+        '/datasci-sharing/health',
+        extra_environ={'REMOTE_USER': str(sysadmin['name'])},
+        status=503,
+    )
+
+    assert 'unreachable' in response.json['checks']['s3control']['error']
+    assert response.json['pending_changes'] == 0
+    assert 'rate_limits' in response.json
+
+
+@pytest.mark.usefixtures('clean_db', 'with_plugins', 'probes')
+def test_pending_changes_are_cached_with_the_probes():
+    dataset = factories.Dataset()
+    assert health.sharing_health(details=True)['pending_changes'] == 0
+
+    PackageSharingPolicy.mark_sync_failed(dataset['id'])
+
+    assert health.sharing_health(details=True)['pending_changes'] == 0
+
+
+@pytest.mark.usefixtures('clean_db', 'with_plugins', 'probes')
+def test_throttled_services_are_reported_without_waiting(monkeypatch):
+    service = _ThrottledService()
+    monkeypatch.setattr(health, 'get_access_point_service', lambda bucket: service)
+
+    check = health.sharing_health(details=True)['checks']['s3control']
+
+    assert (check['ok'], check['status']) == (True, 'throttled')
+    assert check['latency'] < 1
+
+
+@pytest.mark.usefixtures('clean_db', 'with_plugins', 'probes')
+def test_configuration_errors_are_reported_as_failed_checks(monkeypatch, app):
+    def misconfigured(bucket):
+        raise KeyError('ckanext.datasci_sharing.bucket_name')
+
+    monkeypatch.setattr(health, 'get_access_point_service', misconfigured)
+
+    response = app.get('/datasci-sharing/health', status=503)
+
+    assert response.json['checks']['s3control'] == {'ok': False, 'status': 'failed'}
@@ -0,0 +1,66 @@
+import pytest
+
+from ckanext.datasci_sharing.organization_short_name import (
+    CachedShortOrganizationNameStrategy,
+    HashShortOrganizationNameStrategy,
+    MappingShortOrganizationNameStrategy,
+    ShortNameUnavailable,
+    ShortOrganizationNameStrategy,
+)
+from ckanext.datasci_sharing.utils import LRUCache
+
+
+def test_hash_strategy_is_deterministic_and_bounded():
+    strategy = HashShortOrganizationNameStrategy(max_length=16)
+
+    short_name = strategy('Example Organization')
+
+    assert short_name == strategy('Example Organization')
+    assert short_name.startswith('example-')
+    assert len(short_name) <= 16
+
+
+def test_hash_strategy_distinguishes_titles_with_the_same_slug():
+    strategy = HashShortOrganizationNameStrategy(max_length=16)
+
+    assert strategy('Example Organization') != strategy('Example, Organization')
+
+
+def test_mapping_strategy_from_csv(tmp_path):
+    path = tmp_path / 'short_names.csv'
+    path.write_text('title,short_name\nExample Organization,example\n')
+
+    strategy = MappingShortOrganizationNameStrategy.from_csv(str(path))
+
+    assert strategy('Example Organization') == 'example'
+    with pytest.raises(ShortNameUnavailable):
+        strategy('Unknown Organization')
+
+
+class CountingStrategy(ShortOrganizationNameStrategy):
+    def __init__(self):
+        self.calls = []
+
+    def __call__(self, title):
+        self.calls.append(title)
+        return title.lower()
+
+
+def test_strategies_must_implement_call():
+    with pytest.raises(TypeError):
+        ShortOrganizationNameStrategy()
+
+
+def test_cached_strategy_keeps_the_most_recently_used_short_names():
+    strategy = CountingStrategy()
+    cached = CachedShortOrganizationNameStrategy(strategy, LRUCache(maxsize=2))
+
+    cached('A')
+    cached('B')
+    cached('A')
+    cached('C')
+    cached('A')
+    cached('B')
+
+    # B was the least recently used when C was cached.
+    assert strategy.calls == ['A', 'B', 'C', 'B']
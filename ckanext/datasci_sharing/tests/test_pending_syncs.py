@@ -0,0 +1,122 @@
+import ckan.model as model
+from ckan.plugins import toolkit
+from ckan.tests import factories
+import pytest
+
+from ckanext.datasci_sharing import pending_syncs
+from ckanext.datasci_sharing.model import PackageSharingPolicy
+
+
+@pytest.fixture
+def synced(monkeypatch):
+    """Record the packages synced instead of syncing them, committing the
+    session as syncs do, raising the errors added to `synced.errors` instead.
+    """
+    class Recorder(list):
+        def __init__(self):
+            super().__init__()
+            self.errors = []
+
+        def __call__(self, context, data_dict):
+            if self.errors:
+                raise self.errors.pop(0)
+            self.append(data_dict['package_id'])
+            model.repo.commit()
+
+    recorder = Recorder()
+    monkeypatch.setattr(pending_syncs, 'sync_package_sharing_policy', recorder)
+    return recorder
+
+
+def _pending_package_ids():
+    return {package_id for package_id, in PackageSharingPolicy.pending_package_ids()}
+
+
+@pytest.mark.usefixtures('clean_db', 'with_plugins')
+def test_syncs_are_coalesced_until_the_request_is_handled(synced, test_request_context):
+    dataset = factories.Dataset(share_internally=True)
+    del synced[:]
+
+    with test_request_context('/dataset/edit/{}'.format(dataset['name'])):
+        pending_syncs.request_sync({}, dataset['id'])
+        pending_syncs.request_sync({}, dataset['id'])
+        assert synced == []
+
+        pending_syncs.flush_pending_syncs()
+
+    assert synced == [dataset['id']]
+
+
+@pytest.mark.usefixtures('clean_db', 'with_plugins')
+def test_changes_left_uncommitted_by_the_request_are_not_committed(synced, test_request_context):
+    dataset = factories.Dataset(share_internally=True)
+
+    with test_request_context('/dataset/edit/{}'.format(dataset['name'])):
+        pending_syncs.request_sync({}, dataset['id'])
+        # changed by an action that raised before committing.
+        model.Package.get(dataset['id']).notes = 'aborted'
+        pending_syncs.flush_pending_syncs(notify=False)
+
+    assert synced[-1] == dataset['id']
+    assert model.Package.get(dataset['id']).notes == dataset['notes']
+
+
+@pytest.mark.usefixtures('clean_db', 'with_plugins')
+def test_packages_not_shared_and_not_desired_are_skipped(synced, test_request_context):
+    dataset = factories.Dataset()
+
+    with test_request_context('/dataset/edit/{}'.format(dataset['name'])):
+        pending_syncs.request_sync({}, dataset['id'])
+        pending_syncs.flush_pending_syncs()
+
+    assert synced == []
+
+
+@pytest.mark.usefixtures('clean_db', 'with_plugins')
+def test_api_requests_are_synced_immediately(synced, test_request_context):
+    dataset = factories.Dataset(share_internally=True)
+    del synced[:]
+
+    with test_request_context('/api/3/action/package_update'):
+        pending_syncs.request_sync({}, dataset['id'])
+        assert synced == [dataset['id']]
+
+
+@pytest.mark.usefixtures('clean_db', 'with_plugins')
+def test_api_request_errors_are_raised(synced, test_request_context):
+    dataset = factories.Dataset(share_internally=True)
+    synced.errors.append(toolkit.ValidationError({'share_internally': ['unavailable']}))
+
+    with test_request_context('/api/3/action/package_update'):
+        with pytest.raises(toolkit.ValidationError):
+            pending_syncs.request_sync({}, dataset['id'])
+
+
+@pytest.mark.usefixtures('clean_db', 'with_plugins')
+def test_syncs_without_a_request_are_immediate(synced):
+    dataset = factories.Dataset(share_internally=True)
+
+    assert synced == [dataset['id']]
+
+
+@pytest.mark.usefixtures('clean_db', 'with_plugins')
+def test_failed_syncs_stay_pending(synced, test_request_context):
+    dataset = factories.Dataset(share_internally=True)
+    synced.errors.append(RuntimeError('S3 Control is unavailable'))
+
+    with test_request_context('/dataset/edit/{}'.format(dataset['name'])):
+        pending_syncs.request_sync({}, dataset['id'])
+        pending_syncs.flush_pending_syncs(notify=False)
+
+    assert dataset['id'] in _pending_package_ids()
+
+
+@pytest.mark.usefixtures('clean_db', 'with_plugins')
+def test_failed_syncs_are_cleared_once_synced():
+    dataset = factories.Dataset()
+    PackageSharingPolicy.mark_sync_failed(dataset['id'])
+    assert dataset['id'] in _pending_package_ids()
+
+    PackageSharingPolicy.clear_sync_failed(dataset['id'])
+
+    assert dataset['id'] not in _pending_package_ids()
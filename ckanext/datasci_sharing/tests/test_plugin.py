@@ -1,53 +1,166 @@
+"""Tests for plugin.py, sharing datasets through the actions of CKAN with an
+in-memory S3 Control.
 """
-Tests for plugin.py.
+import ckan.model as model
+from ckan.plugins import toolkit
+from ckan.tests import factories, helpers
+import pytest
 
-Tests are written using the pytest library (https://docs.pytest.org), and you
-should read the testing guidelines in the CKAN docs:
-https://docs.ckan.org/en/2.9/contributing/testing.html
+from ckanext.datasci_sharing.model import AccessPointUsage, PackageSharingEvent, PackageSharingPolicy
+from ckanext.datasci_sharing.rate_limiter import RateLimitTimeout
+from ckanext.datasci_sharing.sharing_policy_diff import update_prefix_unchecked
+from ckanext.datasci_sharing.sharing_policy_document import POLICY_DOCUMENT_SIZE_LIMIT, SharingPolicyDocument
+from ckanext.datasci_sharing.tests.conftest import ACCOUNT_ID, BUCKET_REGION, handle_for, package_prefix
 
-To write tests for your extension you should install the pytest-ckan package:
 
-    pip install pytest-ckan
+def _pending_package_ids():
+    return {package_id for package_id, in PackageSharingPolicy.pending_package_ids()}
 
-This will allow you to use CKAN specific fixtures on your tests.
 
-For instance, if your test involves database access you can use `clean_db` to
-reset the database:
+@pytest.mark.usefixtures('clean_db', 'with_plugins', 'sharing_config')
+def test_shared_dataset_is_shared_on_the_access_point_of_its_organization(s3control):
+    organization = factories.Organization()
 
-    import pytest
+    dataset = factories.Dataset(owner_org=organization['id'], share_internally=True)
 
-    from ckan.tests import factories
+    handle = handle_for(organization['title'])
+    assert s3control.shared_prefixes(handle) == {package_prefix(dataset)}
+    policy = PackageSharingPolicy.get_or_default(dataset['id'])
+    assert (policy.allowed, policy.applied_allowed, policy.handle) == (True, True, handle)
+    event = model.Session.query(PackageSharingEvent).filter_by(package_id=dataset['id']).one()
+    assert (event.allowed, event.handle, event.prefix) == (True, handle, package_prefix(dataset))
+    assert AccessPointUsage.get(handle).prefixes == 1
 
-    @pytest.mark.usefixtures("clean_db")
-    def test_some_action():
 
-        dataset = factories.Dataset()
+@pytest.mark.usefixtures('clean_db', 'with_plugins', 'sharing_config')
+def test_deleted_dataset_stops_being_shared(s3control):
+    organization = factories.Organization()
+    dataset = factories.Dataset(owner_org=organization['id'], share_internally=True)
 
-        # ...
+    helpers.call_action('package_delete', id=dataset['id'])
 
-For functional tests that involve requests to the application, you can use the
-`app` fixture:
+    assert s3control.shared_prefixes(handle_for(organization['title'])) == set()
+    assert PackageSharingPolicy.get_or_default(dataset['id']).applied_allowed is False
 
-    from ckan.plugins import toolkit
 
-    def test_some_endpoint(app):
+@pytest.mark.usefixtures('clean_db', 'with_plugins', 'sharing_config')
+def test_unshared_dataset_does_not_call_s3control(s3control):
+    organization = factories.Organization()
 
-        url = toolkit.url_for('myblueprint.some_endpoint')
+    factories.Dataset(owner_org=organization['id'])
 
-        response = app.get(url)
+    assert s3control.calls == []
 
-        assert response.status_code == 200
 
+@pytest.mark.usefixtures('clean_db', 'with_plugins', 'sharing_config')
+def test_share_internally_is_hidden_from_users_who_cannot_update_the_dataset():
+    organization = factories.Organization()
+    dataset = factories.Dataset(owner_org=organization['id'], share_internally=True)
+    user = factories.User()
 
-To temporary patch the CKAN configuration for the duration of a test you can use:
+    shown = helpers.call_action('package_show', {'user': user['name']}, id=dataset['id'])
 
-    import pytest
+    assert 'share_internally' not in shown
 
-    @pytest.mark.ckan_config("ckanext.myext.some_key", "some_value")
-    def test_some_action():
-        pass
-"""
-import ckanext.datasci_sharing.plugin as plugin
 
-def test_plugin():
-    pass
+@pytest.mark.usefixtures('clean_db', 'with_plugins', 'sharing_config')
+def test_share_that_failed_to_apply_stays_pending(s3control):
+    organization = factories.Organization()
+    dataset = factories.Dataset(owner_org=organization['id'])
+    s3control.put_errors.append(RateLimitTimeout('s3control', 1))
+
+    with pytest.raises(toolkit.ValidationError) as error:
+        helpers.call_action('package_patch', id=dataset['id'], share_internally=True, notes='updated')
+
+    assert 'was saved' in error.value.error_dict['message'][0]
+    assert helpers.call_action('package_show', id=dataset['id'])['notes'] == 'updated'
+    assert s3control.shared_prefixes(handle_for(organization['title'])) == set()
+    assert dataset['id'] in _pending_package_ids()
+
+    helpers.call_action('sync_package_sharing_policy', package_id=dataset['id'])
+
+    assert s3control.shared_prefixes(handle_for(organization['title'])) == {package_prefix(dataset)}
+    assert dataset['id'] not in _pending_package_ids()
+
+
+@pytest.mark.usefixtures('clean_db', 'with_plugins', 'sharing_config')
+def test_share_exceeding_the_capacity_of_the_access_point_is_rejected(s3control):
+    organization = factories.Organization()
+    handle = handle_for(organization['title'])
+    AccessPointUsage.record(handle, POLICY_DOCUMENT_SIZE_LIMIT - 10, 100)
+    model.repo.commit()
+
+    with pytest.raises(toolkit.ValidationError) as error:
+        factories.Dataset(owner_org=organization['id'], share_internally=True)
+
+    assert 'share_internally' in error.value.error_dict
+    assert not [call for call in s3control.calls if call[0] == 'put_access_point_policy']
+
+
+@pytest.mark.usefixtures('clean_db', 'with_plugins', 'sharing_config')
+def test_update_exceeding_the_capacity_of_the_access_point_is_not_saved(s3control):
+    organization = factories.Organization()
+    dataset = factories.Dataset(owner_org=organization['id'])
+    AccessPointUsage.record(handle_for(organization['title']), POLICY_DOCUMENT_SIZE_LIMIT - 10, 100)
+    model.repo.commit()
+
+    with pytest.raises(toolkit.ValidationError) as error:
+        helpers.call_action('package_patch', id=dataset['id'], share_internally=True, notes='updated')
+    model.Session.rollback()
+
+    assert 'share_internally' in error.value.error_dict
+    shown = helpers.call_action('package_show', id=dataset['id'])
+    assert (shown['share_internally'], shown['notes']) == (False, dataset['notes'])
+    assert PackageSharingPolicy.get_or_default(dataset['id']).allowed is not True
+
+
+@pytest.mark.usefixtures('clean_db', 'with_plugins', 'sharing_config')
+def test_move_exceeding_the_capacity_of_the_new_access_point_is_rejected(s3control):
+    organization = factories.Organization()
+    other_organization = factories.Organization()
+    dataset = factories.Dataset(owner_org=organization['id'], share_internally=True)
+    AccessPointUsage.record(handle_for(other_organization['title']), POLICY_DOCUMENT_SIZE_LIMIT - 10, 100)
+    model.repo.commit()
+
+    with pytest.raises(toolkit.ValidationError) as error:
+        helpers.call_action('package_patch', id=dataset['id'], owner_org=other_organization['id'])
+    model.Session.rollback()
+
+    assert 'share_internally' in error.value.error_dict
+    assert helpers.call_action('package_show', id=dataset['id'])['owner_org'] == organization['id']
+    assert s3control.shared_prefixes(handle_for(organization['title'])) == {package_prefix(dataset)}
+
+
+def _full_policy(handle: str) -> SharingPolicyDocument:
+    document = SharingPolicyDocument.new(BUCKET_REGION, ACCOUNT_ID, handle)
+    index = 0
+    while document.size() < POLICY_DOCUMENT_SIZE_LIMIT - 50:
+        update_prefix_unchecked(document, f'other-org/package-{index}', True)
+        index += 1
+    return document
+
+
+@pytest.mark.usefixtures('clean_db', 'with_plugins', 'sharing_config')
+def test_share_exceeding_the_capacity_without_recorded_usage_is_discarded(s3control):
+    organization = factories.Organization()
+    handle = handle_for(organization['title'])
+    live = _full_policy(handle)
+    s3control.policies[handle] = live.as_json()
+
+    with pytest.raises(toolkit.ValidationError) as error:
+        helpers.call_action('package_create', name='full-dataset', owner_org=organization['id'], share_internally=True)
+
+    assert 'share_internally' in error.value.error_dict
+    package_id = model.Package.get('full-dataset').id
+    policy = PackageSharingPolicy.get_or_default(package_id)
+    assert (policy.allowed, policy.applied_allowed) == (False, False)
+    assert package_id not in _pending_package_ids()
+    usage = AccessPointUsage.get(handle)
+    assert (usage.size, usage.prefixes) == (live.size(), len(live.shared_prefixes()))
+    assert s3control.policies[handle] == live.as_json()
+
+    # rejected from the recorded usage, before calling S3 Control.
+    del s3control.calls[:]
+    with pytest.raises(toolkit.ValidationError):
+        helpers.call_action('package_patch', id=package_id, notes='updated')
+    assert s3control.calls == []
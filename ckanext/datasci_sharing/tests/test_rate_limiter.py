@@ -0,0 +1,80 @@
+import pytest
+
+from ckanext.datasci_sharing import rate_limiter
+from ckanext.datasci_sharing.rate_limiter import (
+    BULK,
+    LocalTokenBucket,
+    RateLimiter,
+    RateLimitTimeout,
+    rate_limit_max_wait,
+    rate_limit_priority,
+)
+
+
+def test_local_bucket_allows_burst_then_asks_to_wait():
+    bucket = LocalTokenBucket(rate=1, capacity=2)
+
+    assert bucket.take() == 0
+    assert bucket.take() == 0
+    assert bucket.take() > 0
+
+
+def test_local_bucket_keeps_reserve_from_bulk_callers():
+    bucket = LocalTokenBucket(rate=1, capacity=3)
+
+    assert bucket.take(reserve=2) == 0
+    assert bucket.take(reserve=2) > 0
+    assert bucket.take() == 0
+
+
+@pytest.fixture(autouse=True)
+def without_redis(monkeypatch):
+    monkeypatch.setattr(rate_limiter, 'is_redis_available', lambda: False)
+    monkeypatch.setattr(rate_limiter, '_redis_check', None)
+
+
+def test_rate_limiter_times_out_bulk_calls():
+    limiter = RateLimiter('test', rate=0.1, burst=2, bulk_reserve=1, max_wait=1, bulk_max_wait=1)
+
+    with rate_limit_priority(BULK):
+        limiter.acquire()
+        with pytest.raises(RateLimitTimeout):
+            limiter.acquire()
+
+    limiter.acquire()
+    assert limiter.stats.as_dict()['timeouts'] == 1
+
+
+def test_rate_limiter_waits_longer_for_bulk_calls():
+    limiter = RateLimiter('test', rate=10, burst=2, bulk_reserve=1, max_wait=0.01, bulk_max_wait=1)
+
+    with rate_limit_priority(BULK):
+        assert limiter.max_wait == 1
+        limiter.acquire()
+        limiter.acquire()
+
+    assert limiter.max_wait == 0.01
+    assert limiter.stats.as_dict()['timeouts'] == 0
+
+
+def test_rate_limit_max_wait_bounds_the_wait():
+    limiter = RateLimiter('test', rate=0.1, burst=1, max_wait=60, bulk_max_wait=60)
+    limiter.acquire()
+
+    with rate_limit_max_wait(0):
+        assert limiter.max_wait == 0
+        with pytest.raises(RateLimitTimeout):
+            limiter.acquire()
+
+    assert limiter.max_wait == 60
+
+
+def test_rate_limiter_reuses_redis_availability_check(monkeypatch):
+    checks = []
+    monkeypatch.setattr(rate_limiter, 'is_redis_available', lambda: checks.append(1) or False)
+    limiter = RateLimiter('test', rate=100, burst=10)
+
+    for _ in range(5):
+        limiter.acquire()
+
+    assert len(checks) == 1
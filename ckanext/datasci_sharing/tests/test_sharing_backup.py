@@ -0,0 +1,117 @@
+import io
+import json
+
+import ckan.model as model
+from ckan.tests import factories
+import pytest
+
+from ckanext.datasci_sharing.model import AccessPointUsage, PackageSharingPolicy
+from ckanext.datasci_sharing.sharing_backup import export_sharing_state, import_sharing_state
+from ckanext.datasci_sharing.tests.conftest import shared_policy
+
+
+def _share(package_id: str, handle: str, prefix: str):
+    model.Session.add(PackageSharingPolicy(package_id, True, handle, prefix, applied_allowed=True))
+    model.repo.commit()
+
+
+def _export(ap_service) -> str:
+    output = io.StringIO()
+    export_sharing_state(output, ap_service, workers=2)
+    return output.getvalue()
+
+
+@pytest.mark.usefixtures('clean_db', 'with_plugins')
+def test_export_writes_rows_and_referenced_access_points(s3control, ap_service):
+    dataset = factories.Dataset()
+    _share(dataset['id'], 'test-ap', 'org/package')
+    s3control.policies['test-ap'] = shared_policy('test-ap', 'org/package')
+    s3control.policies['unreferenced-ap'] = shared_policy('unreferenced-ap')
+
+    lines = [json.loads(line) for line in _export(ap_service).splitlines()]
+
+    assert lines[0]['type'] == 'header'
+    assert lines[1] == {
+        'type': 'package_sharing_policy',
+        'package_id': dataset['id'],
+        'allowed': True,
+        'applied_allowed': True,
+        'handle': 'test-ap',
+        'prefix': 'org/package',
+    }
+    assert [line['name'] for line in lines[2:]] == ['test-ap']
+
+
+@pytest.mark.usefixtures('clean_db', 'with_plugins')
+def test_export_skips_the_access_points_of_legacy_handles(s3control, ap_service):
+    dataset = factories.Dataset()
+    _share(dataset['id'], 'arn:aws:s3:eu-west-2:123456789012:accesspoint/legacy', 'org/package')
+
+    lines = [json.loads(line) for line in _export(ap_service).splitlines()]
+
+    assert [line['type'] for line in lines] == ['header', 'package_sharing_policy']
+    assert s3control.calls == []
+
+
+@pytest.mark.usefixtures('clean_db', 'with_plugins')
+def test_import_restores_an_export(s3control, ap_service):
+    dataset = factories.Dataset()
+    _share(dataset['id'], 'test-ap', 'org/package')
+    s3control.policies['test-ap'] = shared_policy('test-ap', 'org/package')
+    exported = _export(ap_service)
+
+    model.Session.query(PackageSharingPolicy).delete()
+    model.repo.commit()
+    s3control.policies.clear()
+
+    # importing the same export again is safe.
+    for _ in range(2):
+        counts = import_sharing_state(io.StringIO(exported), ap_service, workers=2)
+        assert counts == {'package_sharing_policy': 1, 'access_point': 1, 'failed': 0}
+
+    policy = PackageSharingPolicy.get_or_default(dataset['id'])
+    assert (policy.allowed, policy.applied_allowed, policy.handle, policy.prefix) == (
+        True, True, 'test-ap', 'org/package'
+    )
+    assert s3control.shared_prefixes('test-ap') == {'org/package'}
+    assert AccessPointUsage.get('test-ap').prefixes == 1
+
+
+@pytest.mark.usefixtures('clean_db', 'with_plugins')
+def test_import_skips_rows_of_missing_packages(s3control, ap_service):
+    exported = '\n'.join(json.dumps(line) for line in [
+        {'type': 'header', 'version': 1},
+        {
+            'type': 'package_sharing_policy',
+            'package_id': 'missing',
+            'allowed': True,
+            'applied_allowed': True,
+            'handle': 'test-ap',
+            'prefix': 'org/package',
+        },
+    ])
+
+    counts = import_sharing_state(io.StringIO(exported), ap_service)
+
+    assert counts['package_sharing_policy'] == 0
+    assert model.Session.query(PackageSharingPolicy).count() == 0
+
+
+def test_failed_export_keeps_the_previous_export(tmp_path):
+    from ckanext.datasci_sharing.cli import _atomic_output
+
+    path = tmp_path / 'sharing.ndjson'
+    path.write_text('previous\n')
+
+    with pytest.raises(RuntimeError):
+        with _atomic_output(str(path)) as stream:
+            stream.write('partial\n')
+            raise RuntimeError('S3 Control is unavailable')
+
+    assert path.read_text() == 'previous\n'
+    assert [p.name for p in tmp_path.iterdir()] == ['sharing.ndjson']
+
+    with _atomic_output(str(path)) as stream:
+        stream.write('complete\n')
+
+    assert path.read_text() == 'complete\n'
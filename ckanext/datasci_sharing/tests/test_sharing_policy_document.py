@@ -0,0 +1,170 @@
+import json
+
+from hypothesis import given, settings, strategies as st
+import pytest
+
+from ckanext.datasci_sharing.sharing_policy_document import (
+    POLICY_DOCUMENT_SIZE_LIMIT,
+    PolicyDocumentSizeLimitExceeded,
+    SharingPolicyDocument,
+    estimate_share_size,
+    estimate_unshare_size,
+)
+
+
+ACCESS_POINT_ARN = 'arn:aws:s3:eu-west-2:123456789012:accesspoint/test'
+NULL_OBJECT = f'{ACCESS_POINT_ARN}/object/__null_object__'
+
+
+def new_document() -> SharingPolicyDocument:
+    return SharingPolicyDocument.new('eu-west-2', '123456789012', 'test')
+
+
+def listed_prefixes(document: SharingPolicyDocument) -> set:
+    statement = document._statement('A')
+    return set(statement['Condition']['StringLike']['s3:prefix'])
+
+
+def resources(document: SharingPolicyDocument) -> set:
+    return set(document._statement('B')['Resource'])
+
+
+# package prefixes are `{org_name}/{package_name}`, a small alphabet makes
+# operations on the same prefixes and on prefixes of the same organization likely.
+names = st.text(alphabet='abc-', min_size=1, max_size=4)
+prefixes = st.builds(lambda org, package: f'{org}/{package}', names, names)
+operations = st.lists(st.tuples(prefixes, st.booleans()), max_size=50)
+
+
+def test_prefixes_chain_from_prefix():
+    document = new_document()
+
+    assert document._prefixes_chain_from_prefix('a/b/c') == ['a/', 'a/b/', 'a/b/c/*']
+    assert document._prefixes_chain_from_prefix('a') == ['a/*']
+
+
+def test_new_document_shares_nothing():
+    document = new_document()
+
+    assert document.shared_prefixes() == []
+    assert resources(document) == {NULL_OBJECT}
+    assert listed_prefixes(document) == {''}
+
+
+def test_update_prefix_raises_when_size_limit_exceeded():
+    document = new_document()
+
+    with pytest.raises(PolicyDocumentSizeLimitExceeded):
+        for index in range(POLICY_DOCUMENT_SIZE_LIMIT):
+            document.update_prefix(f'org/package-{index}', True)
+    assert document.size() > POLICY_DOCUMENT_SIZE_LIMIT
+
+
+@settings(max_examples=200)
+@given(operations)
+def test_update_prefix_matches_reference_model(operations):
+    document = new_document()
+    shared = set()
+
+    for prefix, allow in operations:
+        document.update_prefix(prefix, allow)
+        if allow:
+            shared.add(prefix)
+        else:
+            shared.discard(prefix)
+
+        assert set(document.shared_prefixes()) == shared
+        if shared:
+            assert NULL_OBJECT not in resources(document)
+        else:
+            assert resources(document) == {NULL_OBJECT}
+
+        listed = listed_prefixes(document)
+        assert {p for p in listed if p.endswith('*')} == {f'{p}/*' for p in shared}
+        for shared_prefix in shared:
+            assert set(document._prefixes_chain_from_prefix(shared_prefix)) <= listed
+
+
+@given(operations)
+def test_size_counts_compact_json(operations):
+    document = new_document()
+    for prefix, allow in operations:
+        document.update_prefix(prefix, allow)
+
+    assert document.size() == len(json.dumps(json.loads(document.as_json()), separators=(',', ':')))
+
+
+@given(st.lists(prefixes, min_size=1, max_size=20, unique=True))
+def test_unsharing_all_prefixes_restores_null_object(shared):
+    document = new_document()
+    for prefix in shared:
+        document.update_prefix(prefix, True)
+    for prefix in shared:
+        document.update_prefix(prefix, False)
+
+    assert document.shared_prefixes() == []
+    assert resources(document) == {NULL_OBJECT}
+
+
+@given(st.lists(prefixes, min_size=1, max_size=20, unique=True), st.data())
+def test_update_prefix_raises_only_over_size_limit(shared, data):
+    # a tiny limit exercises the check with small documents.
+    limit = data.draw(st.integers(min_value=new_document().size(), max_value=new_document().size() + 1000))
+    document = new_document()
+
+    PolicyDocumentSizeLimitExceeded._POLICY_DOCUMENT_SIZE_LIMIT = limit
+    try:
+        for prefix in shared:
+            try:
+                document.update_prefix(prefix, True)
+            except PolicyDocumentSizeLimitExceeded:
+                assert document.size() > limit
+            else:
+                assert document.size() <= limit
+    finally:
+        PolicyDocumentSizeLimitExceeded._POLICY_DOCUMENT_SIZE_LIMIT = POLICY_DOCUMENT_SIZE_LIMIT
+
+
+@given(st.lists(prefixes, max_size=20, unique=True), prefixes)
+def test_estimate_share_size_is_an_upper_bound(shared, prefix):
+    document = new_document()
+    for shared_prefix in shared:
+        document.update_prefix(shared_prefix, True)
+    size = document.size()
+
+    document.update_prefix(prefix, True)
+
+    assert document.size() - size <= estimate_share_size(ACCESS_POINT_ARN, prefix)
+
+
+@given(st.lists(prefixes, max_size=3, unique=True), prefixes)
+def test_estimate_share_size_is_an_upper_bound_for_single_values(shared, prefix):
+    # AWS policies may hold single values instead of single element lists,
+    # which are written back as lists.
+    document = new_document()
+    for shared_prefix in shared:
+        document.update_prefix(shared_prefix, True)
+    listing = document._statement('A')['Condition']['StringLike']
+    actions = document._statement('B')
+    if len(listing['s3:prefix']) == 1:
+        listing['s3:prefix'] = listing['s3:prefix'][0]
+    if len(actions['Resource']) == 1:
+        actions['Resource'] = actions['Resource'][0]
+    size = document.size()
+
+    document.update_prefix(prefix, True)
+
+    assert document.size() - size <= estimate_share_size(ACCESS_POINT_ARN, prefix)
+
+
+@given(st.lists(prefixes, min_size=1, max_size=20, unique=True))
+def test_estimate_unshare_size_is_exact_while_sharing_other_prefixes(shared):
+    document = new_document()
+    for prefix in shared:
+        document.update_prefix(prefix, True)
+    # another package of the same organization keeps the organization listed.
+    document.update_prefix(f'{shared[0]}-other', True)
+    size = document.size()
+    document.update_prefix(shared[0], False)
+
+    assert size - document.size() == estimate_unshare_size(ACCESS_POINT_ARN, shared[0])
@@ -0,0 +1,187 @@
+import ckan.model as model
+from ckan.tests import factories, helpers
+import pytest
+
+from ckanext.datasci_sharing.config import config
+from ckanext.datasci_sharing.model import AccessPointUsage, PackageSharingPolicy
+from ckanext.datasci_sharing.sharing_policy_document import (
+    POLICY_DOCUMENT_SIZE_LIMIT,
+    estimate_share_size,
+    estimate_unshare_size,
+    format_access_point_arn,
+)
+from ckanext.datasci_sharing.sharing_policy_repository import (
+    SharingCapacityExceeded,
+    SharingNotAvailable,
+    SharingPolicyRepository,
+)
+from ckanext.datasci_sharing.tests.conftest import (
+    ACCOUNT_ID,
+    BUCKET_REGION,
+    handle_for,
+    package_prefix,
+    shared_policy,
+)
+
+
+def _repository() -> SharingPolicyRepository:
+    return SharingPolicyRepository(config.bucket.bucket_name, config.bucket)
+
+
+@pytest.mark.usefixtures('clean_db', 'with_plugins', 'sharing_config')
+def test_plan_does_not_change_legacy_rows():
+    organization = factories.Organization()
+    dataset = factories.Dataset(owner_org=organization['id'])
+    legacy_handle = 'arn:aws:s3:eu-west-2:123456789012:accesspoint/legacy'
+    model.Session.add(PackageSharingPolicy(dataset['id'], True, legacy_handle, applied_allowed=True))
+    model.repo.commit()
+
+    diffs = _repository().plan(organization['title'], dataset['id'], package_prefix(dataset), True)
+
+    assert [diff.handle for diff in diffs] == [handle_for(organization['title'])]
+    assert not model.Session.dirty
+    model.repo.commit()
+    policy = PackageSharingPolicy.get_or_default(dataset['id'])
+    assert (policy.allowed, policy.handle) == (True, legacy_handle)
+
+
+@pytest.mark.usefixtures('clean_db', 'with_plugins', 'sharing_config')
+def test_apply_updates_the_live_policy_instead_of_the_cached_one(s3control):
+    organization = factories.Organization()
+    dataset = factories.Dataset(owner_org=organization['id'])
+    handle = handle_for(organization['title'])
+    repository = _repository()
+    s3control.policies[handle] = shared_policy(handle)
+    repository._ap_service.get_policy(handle)
+    # changed since it was cached, for example by another process.
+    s3control.policies[handle] = shared_policy(handle, 'other-org/other-package')
+
+    with repository.sharing_policy(organization['title'], dataset['id'], package_prefix(dataset)) as policy:
+        policy.allowed = True
+
+    assert s3control.shared_prefixes(handle) == {'other-org/other-package', package_prefix(dataset)}
+
+
+@pytest.mark.usefixtures('clean_db', 'with_plugins', 'sharing_config')
+def test_apply_reuses_the_cached_policy_it_last_wrote(s3control):
+    organization = factories.Organization()
+    first = factories.Dataset(owner_org=organization['id'], share_internally=True)
+    second = factories.Dataset(owner_org=organization['id'])
+    handle = handle_for(organization['title'])
+    del s3control.calls[:]
+
+    with _repository().sharing_policy(organization['title'], second['id'], package_prefix(second)) as policy:
+        policy.allowed = True
+
+    assert s3control.calls == [('put_access_point_policy', handle)]
+    assert s3control.shared_prefixes(handle) == {package_prefix(first), package_prefix(second)}
+
+
+@pytest.mark.usefixtures('clean_db', 'with_plugins', 'sharing_config')
+def test_apply_reads_the_live_policy_once_the_usage_is_refreshed(s3control):
+    organization = factories.Organization()
+    factories.Dataset(owner_org=organization['id'], share_internally=True)
+    dataset = factories.Dataset(owner_org=organization['id'])
+    handle = handle_for(organization['title'])
+    # changed outside CKAN, then recorded from the live policy.
+    s3control.policies[handle] = shared_policy(handle, 'other-org/other-package')
+    AccessPointUsage.record(handle, 1000, 1)
+    model.repo.commit()
+
+    with _repository().sharing_policy(organization['title'], dataset['id'], package_prefix(dataset)) as policy:
+        policy.allowed = True
+
+    assert s3control.shared_prefixes(handle) == {'other-org/other-package', package_prefix(dataset)}
+
+
+@pytest.mark.usefixtures('clean_db', 'with_plugins', 'sharing_config')
+def test_renamed_package_stops_sharing_its_old_prefix(s3control):
+    organization = factories.Organization()
+    dataset = factories.Dataset(owner_org=organization['id'], share_internally=True)
+    handle = handle_for(organization['title'])
+    assert s3control.shared_prefixes(handle) == {package_prefix(dataset)}
+
+    renamed = helpers.call_action('package_patch', id=dataset['id'], name='renamed-dataset')
+
+    assert s3control.shared_prefixes(handle) == {package_prefix(renamed)}
+    assert PackageSharingPolicy.get_or_default(dataset['id']).prefix == package_prefix(renamed)
+
+
+@pytest.mark.usefixtures('clean_db', 'with_plugins', 'sharing_config')
+def test_moved_package_is_shared_on_the_access_point_of_its_new_organization(s3control):
+    organization = factories.Organization()
+    other_organization = factories.Organization()
+    dataset = factories.Dataset(owner_org=organization['id'], share_internally=True)
+
+    moved = helpers.call_action('package_patch', id=dataset['id'], owner_org=other_organization['id'])
+
+    assert s3control.shared_prefixes(handle_for(organization['title'])) == set()
+    assert s3control.shared_prefixes(handle_for(other_organization['title'])) == {package_prefix(moved)}
+    policy = PackageSharingPolicy.get_or_default(dataset['id'])
+    assert (policy.handle, policy.prefix) == (handle_for(other_organization['title']), package_prefix(moved))
+
+
+@pytest.mark.usefixtures('clean_db', 'with_plugins', 'sharing_config')
+def test_shared_package_keeping_its_prefix_is_synced_without_resolving_its_access_point(monkeypatch, s3control):
+    organization = factories.Organization()
+    dataset = factories.Dataset(owner_org=organization['id'], share_internally=True)
+
+    def unavailable(self, org_title):
+        raise SharingNotAvailable()
+
+    monkeypatch.setattr(SharingPolicyRepository, 'handle_for', unavailable)
+    helpers.call_action('package_patch', id=dataset['id'], notes='updated')
+
+    assert s3control.shared_prefixes(handle_for(organization['title'])) == {package_prefix(dataset)}
+
+
+@pytest.mark.usefixtures('clean_db', 'with_plugins', 'sharing_config')
+def test_packages_shared_without_a_stored_prefix_are_synced_on_their_current_prefix(s3control):
+    organization = factories.Organization()
+    dataset = factories.Dataset(owner_org=organization['id'])
+    handle = handle_for(organization['title'])
+    s3control.policies[handle] = shared_policy(handle, package_prefix(dataset))
+    model.Session.add(PackageSharingPolicy(dataset['id'], True, handle, applied_allowed=True))
+    model.repo.commit()
+
+    helpers.call_action('sync_package_sharing_policy', package_id=dataset['id'])
+    assert s3control.calls == []
+
+    helpers.call_action('package_patch', id=dataset['id'], share_internally=False)
+
+    assert s3control.shared_prefixes(handle) == set()
+    policy = PackageSharingPolicy.get_or_default(dataset['id'])
+    assert (policy.allowed, policy.applied_allowed) == (False, False)
+
+
+def _record_usage(handle: str, size: int):
+    AccessPointUsage.record(handle, size, 1)
+    model.repo.commit()
+
+
+@pytest.mark.usefixtures('clean_db', 'with_plugins', 'sharing_config')
+def test_check_capacity_accepts_access_points_without_recorded_usage():
+    _repository()._check_capacity('test-ap', 'org/package', None)
+
+
+@pytest.mark.usefixtures('clean_db', 'with_plugins', 'sharing_config')
+def test_check_capacity_rejects_shares_exceeding_the_size_limit():
+    arn = format_access_point_arn(BUCKET_REGION, ACCOUNT_ID, 'test-ap')
+    growth = estimate_share_size(arn, 'org/package')
+    _record_usage('test-ap', POLICY_DOCUMENT_SIZE_LIMIT - growth)
+    _repository()._check_capacity('test-ap', 'org/package', None)
+
+    _record_usage('test-ap', POLICY_DOCUMENT_SIZE_LIMIT - growth + 1)
+    with pytest.raises(SharingCapacityExceeded):
+        _repository()._check_capacity('test-ap', 'org/package', None)
+
+
+@pytest.mark.usefixtures('clean_db', 'with_plugins', 'sharing_config')
+def test_check_capacity_counts_the_prefix_unshared_on_the_same_access_point():
+    arn = format_access_point_arn(BUCKET_REGION, ACCOUNT_ID, 'test-ap')
+    growth = estimate_share_size(arn, 'org/renamed') - estimate_unshare_size(arn, 'org/package')
+    _record_usage('test-ap', POLICY_DOCUMENT_SIZE_LIMIT - growth)
+
+    _repository()._check_capacity('test-ap', 'org/renamed', ('test-ap', 'org/package'))
+    with pytest.raises(SharingCapacityExceeded):
+        _repository()._check_capacity('test-ap', 'org/renamed', ('other-ap', 'org/package'))
@@ -0,0 +1,38 @@
+import pytest
+
+from ckanext.datasci_sharing.utils import retry, retry_duration
+
+
+class Excluded(Exception):
+    pass
+
+
+def test_retry_does_not_retry_excluded_exceptions():
+    calls = []
+
+    @retry(2, exclude=(Excluded,))
+    def fail():
+        calls.append(1)
+        raise Excluded()
+
+    with pytest.raises(Excluded):
+        fail()
+    assert len(calls) == 1
+
+
+def test_retry_retries_other_exceptions():
+    calls = []
+
+    @retry(2, exclude=(Excluded,))
+    def fail():
+        calls.append(1)
+        raise ValueError()
+
+    with pytest.raises(ValueError):
+        fail()
+    assert len(calls) == 3
+
+
+def test_retry_duration_sums_the_backoff_delays():
+    assert retry_duration(2, backoff=2, delay=0.2) == pytest.approx(0.6)
+    assert retry_duration(2) == 0
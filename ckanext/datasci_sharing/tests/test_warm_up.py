@@ -0,0 +1,40 @@
+import sys
+import types
+
+import pytest
+
+from ckanext.datasci_sharing import rate_limiter, warm_up
+
+
+@pytest.fixture
+def steps(monkeypatch):
+    """Replace the warm-up steps with one recording the rate limit priority."""
+    priorities = []
+    monkeypatch.setattr(warm_up, '_STEPS', (('step', lambda deadline: priorities.append(rate_limiter._priority.get())),))
+    return priorities
+
+
+def test_warm_up_takes_rate_limit_tokens_at_bulk_priority(steps):
+    warm_up.warm_up(budget=5)
+
+    assert steps == [rate_limiter.BULK]
+    assert 'step' in warm_up.last_warm_up()['steps']
+
+
+def test_warm_up_is_not_registered_outside_of_uwsgi(monkeypatch, steps):
+    monkeypatch.setitem(sys.modules, 'uwsgi', None)
+
+    warm_up.register_post_fork_warm_up()
+
+    assert steps == []
+
+
+def test_warm_up_is_registered_as_a_post_fork_hook_of_uwsgi(monkeypatch, steps):
+    hooks = []
+    monkeypatch.setitem(sys.modules, 'uwsgi', types.SimpleNamespace(worker_id=lambda: 0))
+    monkeypatch.setitem(sys.modules, 'uwsgidecorators', types.SimpleNamespace(postfork=hooks.append))
+
+    warm_up.register_post_fork_warm_up()
+
+    assert steps == []
+    assert hooks == [warm_up.warm_up]
@@ -1,6 +1,13 @@
+from collections import OrderedDict
 import functools
+import os
+import threading
 import time
 import logging
+import typing as t
+import weakref
+
+from .profiling import record_event
 
 logger = logging.getLogger(__name__)
 
@@ -24,9 +31,23 @@ def _with_backoff(func, factor, delay):
     return wrapper
 
 
-def retry(n: int, backoff: float = 0, delay: float = 0.2):
+def retry_duration(n: int, backoff: float = 0, delay: float = 0.2) -> float:
+    """Seconds spent sleeping between the calls of a function decorated with
+    `retry(n, backoff, delay)` when every call fails.
+    """
+    if backoff == 0:
+        return 0
+    return sum(delay * backoff ** i for i in range(n))
+
+
+def retry(
+    n: int,
+    backoff: float = 0,
+    delay: float = 0.2,
+    exclude: t.Tuple[t.Type[Exception], ...] = (),
+):
     """Retry the decorated function `n` times with a backoff factor of `backoff`
-    and a delay in seconds.
+    and a delay in seconds. Exceptions of the `exclude` types are not retried.
     """
     def decorator(func):
         @functools.wraps(func)
@@ -37,11 +58,74 @@ def retry(n: int, backoff: float = 0, delay: float = 0.2):
             for i in range(n + 1):
                 try:
                     return wrapped(*args, **kwargs)
+                except exclude:
+                    raise
                 except Exception as e:
                     last_exc = e
+                    record_event('retry')
                     logger.exception("retry:%s: call %s of %s errored", func.__name__, i + 1, n + 1)
 
             raise last_exc
 
         return wrapper
     return decorator
+
+
+class LRUCache:
+    """Thread safe cache keeping the `maxsize` most recently used values."""
+    def __init__(self, maxsize: int):
+        self._maxsize = maxsize
+        self._values: 'OrderedDict[t.Hashable, t.Any]' = OrderedDict()
+        self._lock = threading.Lock()
+        _lru_caches.add(self)
+
+    def get(self, key: t.Hashable, default: t.Any = None) -> t.Any:
+        with self._lock:
+            if key not in self._values:
+                return default
+            self._values.move_to_end(key)
+            return self._values[key]
+
+    def set(self, key: t.Hashable, value: t.Any):
+        with self._lock:
+            self._values[key] = value
+            self._values.move_to_end(key)
+            while len(self._values) > self._maxsize:
+                self._values.popitem(last=False)
+
+    def __len__(self) -> int:
+        return len(self._values)
+
+
+_lru_caches: 'weakref.WeakSet[LRUCache]' = weakref.WeakSet()
+
+
+_process_cache: t.Dict[t.Hashable, t.Any] = {}
+_process_cache_lock = threading.Lock()
+
+
+def _reset_process_cache():
+    global _process_cache_lock
+    _process_cache.clear()
+    # the locks may have been held by another thread when forking, the values
+    # of LRU caches are kept.
+    _process_cache_lock = threading.Lock()
+    for cache in _lru_caches:
+        cache._lock = threading.Lock()
+
+
+os.register_at_fork(after_in_child=_reset_process_cache)
+
+
+def process_cached(key: t.Hashable, factory: t.Callable[[], t.Any]) -> t.Any:
+    """Return the value cached for `key` in this process, creating it with
+    `factory` on first use.
+
+    Values are discarded in forked processes, as boto3 sessions and clients
+    must not be shared between processes. Values are created while holding a
+    lock, as creating clients from the same boto3 session is not thread safe.
+    """
+    with _process_cache_lock:
+        if key not in _process_cache:
+            _process_cache[key] = factory()
+        return _process_cache[key]
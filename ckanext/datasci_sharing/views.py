@@ -0,0 +1,41 @@
+from ckan.plugins import toolkit
+from flask import Blueprint, jsonify
+
+from .health import sharing_health
+from .pending_syncs import flush_pending_syncs
+
+
+datasci_sharing = Blueprint('datasci_sharing', __name__)
+
+
+@datasci_sharing.route('/datasci-sharing/health')
+def health():
+    """Health of the sharing subsystem, responding with 503 when unhealthy,
+    with the details of the checks for sysadmins.
+    """
+    try:
+        toolkit.check_access('sharing_health_details', {'user': toolkit.g.get('user')})
+        details = True
+    except toolkit.NotAuthorized:
+        details = False
+    report = sharing_health(details)
+    return jsonify(report), 200 if report['ok'] else 503
+
+
+@datasci_sharing.after_app_request
+def sync_pending_packages(response):
+    flush_pending_syncs()
+    return response
+
+
+@datasci_sharing.teardown_app_request
+def sync_remaining_pending_packages(exc):
+    # syncs requested after the response was built, or within request contexts
+    # that never build a response such as the ones pushed by CLI commands. The
+    # changes of a request that raised are rolled back, its packages are synced
+    # from their committed state.
+    flush_pending_syncs(notify=False)
+
+
+def get_blueprints():
+    return [datasci_sharing]
@@ -0,0 +1,142 @@
+"""Warm-up of the sharing services of a process, so that the first share after
+a worker starts does not pay for resolving credentials, building clients and
+the cold start of the short name lambda function.
+
+The warm-up runs in a background thread, startup waits for it at most the
+configured budget. It runs in the workers once forked, never in the process
+forking them, whose clients and connections would be shared by the workers.
+"""
+import logging
+import threading
+import time
+import typing as t
+
+import ckan.model as model
+from ckan.lib.redis import connect_to_redis, is_redis_available
+
+from .access_point_cache import cache_namespace, get_known_access_points
+from .config import config
+from .model import PackageSharingPolicy
+from .rate_limiter import BULK, rate_limit_priority
+from .sharing_policy_repository import get_access_point_service, get_boto3_session, get_short_name_strategy
+
+
+logger = logging.getLogger(__name__)
+
+
+_last_warm_up: t.Optional[dict] = None
+
+
+def last_warm_up() -> t.Optional[dict]:
+    """The timings of the last warm-up of this process, if any."""
+    return _last_warm_up
+
+
+def _check_redis(deadline: float):
+    if not is_redis_available():
+        raise Exception('redis is not available')
+    connect_to_redis().ping()
+
+
+def _build_clients(deadline: float):
+    # building the clients loads the botocore service models, resolving the
+    # credentials may call the instance metadata service.
+    get_boto3_session().get_credentials()
+    get_access_point_service(config.bucket)
+    get_short_name_strategy()
+
+
+def _prefetch_access_points(deadline: float):
+    # filled after the fork, as the in-process cache of the forking process
+    # would be copied to workers started long after it was filled. Access
+    # points deleted since are discarded when their update fails.
+    handles = [handle for (handle,) in PackageSharingPolicy.shared_handles()]
+    get_known_access_points(cache_namespace(*config.bucket)).add_local(handles)
+    logger.debug("prefetched %s known access points", len(handles))
+
+
+def _prefetch_short_names(deadline: float):
+    get_org_short_name = get_short_name_strategy()
+    titles = (
+        model.Session.query(model.Group.title)
+        .join(model.Package, model.Package.owner_org == model.Group.id)
+        .join(PackageSharingPolicy, PackageSharingPolicy.package_id == model.Package.id)
+        .filter(PackageSharingPolicy.allowed.is_(True))
+        .distinct()
+    )
+    for (title,) in titles:
+        if time.monotonic() >= deadline:
+            break
+        get_org_short_name(title)
+
+
+_STEPS = (
+    ('redis', _check_redis),
+    ('clients', _build_clients),
+    ('access_points', _prefetch_access_points),
+    ('short_names', _prefetch_short_names),
+)
+
+
+def _run(deadline: float) -> dict:
+    report: t.Dict[str, t.Any] = {'started': time.time(), 'steps': {}}
+    started = time.perf_counter()
+    try:
+        # the warm-up must not take the tokens reserved for the shares of users.
+        with rate_limit_priority(BULK):
+            for name, step in _STEPS:
+                if time.monotonic() >= deadline:
+                    report['steps'][name] = {'skipped': True}
+                    continue
+                step_started = time.perf_counter()
+                try:
+                    step(deadline)
+                    report['steps'][name] = {'duration': time.perf_counter() - step_started}
+                except Exception as e:
+                    logger.warning("warm-up step %s failed", name, exc_info=True)
+                    report['steps'][name] = {'duration': time.perf_counter() - step_started, 'error': str(e)}
+    finally:
+        model.Session.remove()
+    report['duration'] = time.perf_counter() - started
+    return report
+
+
+def warm_up(budget: t.Optional[float] = None):
+    """Warm up the sharing services of this process, waiting at most `budget`
+    seconds, the configured budget by default. Steps not started within the
+    budget are skipped, a step still running keeps running in the background.
+    """
+    budget = config.warm_up_budget if budget is None else budget
+    deadline = time.monotonic() + budget
+
+    def run():
+        global _last_warm_up
+        _last_warm_up = _run(deadline)
+        steps = ', '.join(
+            f"{name} {'skipped' if step.get('skipped') else format(step['duration'], '.3f') + 's'}"
+            for name, step in _last_warm_up['steps'].items()
+        )
+        logger.info("warm-up took %.3f seconds: %s", _last_warm_up['duration'], steps)
+
+    thread = threading.Thread(target=run, name='datasci-sharing-warm-up', daemon=True)
+    thread.start()
+    thread.join(budget)
+    if thread.is_alive():
+        logger.warning("warm-up exceeded its budget of %s seconds, continuing in the background", budget)
+
+
+def register_post_fork_warm_up():
+    """Warm up every uWSGI worker once it is forked, so that the master process
+    and CLI commands never warm up. Workers of other servers are warmed up from
+    the post-fork hook of the server.
+    """
+    try:
+        import uwsgi
+    except ImportError:
+        return
+    if uwsgi.worker_id() > 0:
+        # the application is loaded by the worker, for example with lazy-apps.
+        warm_up()
+    else:
+        from uwsgidecorators import postfork
+        postfork(warm_up)